@@ -7,17 +7,28 @@ Uses YOUR uploaded model architecture (QuantileRegressor, FeatureBuilder)
 from flask import Flask, request, jsonify
 from flask_socketio import SocketIO
 from flask_cors import CORS
+import os
 import threading
 from pathlib import Path
 from datetime import datetime
 import logging
 
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
 # Import your modules
 from background_order_processor import (
-    submit_order, background_order_engine, set_socketio, 
-    blockchain, order_book, state_lock, get_order_book_summary
+    submit_order, submit_orders, cancel_order, amend_order, get_order, background_order_engine, set_socketio,
+    parse_timestamp,
+    blockchain, order_book, state_lock, get_order_book_summary, get_order_book_depth,
+    get_markets_summary, get_top_of_book, book_entries, CONSENSUS_MODE, SEALER_KEY_FILE, MATCHING_PROCESSES
 )
-from block_chain_templates import QuantumParticipant
+from block_chain_templates import QuantumParticipant, SimpleSigningKey
+from chain_network import PeerNode
+from wallet_manager import wallet_manager
 from solar_service import SolarForecastService
 from config import PlantConfig
 
@@ -60,22 +71,35 @@ except Exception as e:
     forecast_service = None
 
 # ------------------------------------------------------------------
-# Wallet Management
+# Peer replication (optional)
+# QORCA_P2P_PORT enables the node; QORCA_PEERS is a comma list of host:port
 # ------------------------------------------------------------------
-wallets = {}
+P2P_PORT = os.environ.get("QORCA_P2P_PORT")
+P2P_PEERS = [p.strip() for p in os.environ.get("QORCA_PEERS", "").split(",") if p.strip()]
+peer_node = None
 
-def generate_wallet(user_id: str):
-    """Create quantum-enabled wallet"""
-    if user_id in wallets:
-        return wallets[user_id].address
-    participant = QuantumParticipant(user_id)
-    blockchain.register_quantum_participant(participant)
-    wallets[user_id] = participant
-    return participant.address
+# ------------------------------------------------------------------
+# Wallet Management
+# Balances live in wallet_manager; each user also gets a blockchain
+# quantum participant under the same id.
+# ------------------------------------------------------------------
+wallet_creation_lock = threading.Lock()
+
+def generate_wallet(user_id: str, huawei_id: str = None):
+    """Create quantum-enabled wallet (idempotent)"""
+    with wallet_creation_lock:
+        wallet = wallet_manager.get_wallet(user_id)
+        if wallet is None:
+            wallet = wallet_manager.create_wallet(user_id, huawei_id or user_id)
+        if user_id not in blockchain.quantum_participants:
+            # Chain identity uses the wallet key, so it is stable across restarts
+            key = SimpleSigningKey(wallet.private_key.to_string())
+            blockchain.register_quantum_participant(QuantumParticipant(user_id, key))
+    return wallet
 
 def get_participant(user_id: str):
     """Get user's quantum participant"""
-    return wallets.get(user_id)
+    return blockchain.quantum_participants.get(user_id)
 
 # ------------------------------------------------------------------
 # SOLAR FORECASTING API - Uses YOUR Models
@@ -218,23 +242,105 @@ def create_wallet():
     if not user_id:
         return jsonify(error="user_id required"), 400
     
-    addr = generate_wallet(user_id)
-    return jsonify(user_id=user_id, address=addr, type="quantum_enabled")
+    try:
+        wallet = generate_wallet(user_id, data.get('huawei_id'))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(user_id=user_id, address=wallet.address,
+                   quantum_address=get_participant(user_id).address, type="quantum_enabled")
 
 @app.route('/wallet/<user_id>', methods=['GET'])
 def get_wallet(user_id: str):
     """Get wallet information"""
-    participant = get_participant(user_id)
-    if not participant:
+    wallet = wallet_manager.get_wallet(user_id)
+    if not wallet:
         return jsonify(error="wallet not found"), 404
     
+    participant = get_participant(user_id)
     return jsonify(
         user_id=user_id,
-        address=participant.address,
-        label=participant.label,
+        address=wallet.address,
+        quantum_address=participant.address if participant else None,
+        label=participant.label if participant else None,
+        balances=wallet.get_balance_summary(),
         type="quantum_enabled"
     )
 
+@app.route('/wallet/<user_id>/trades', methods=['GET'])
+def get_wallet_trades(user_id: str):
+    """Get a user's P2P trades (?limit=&offset=&start=&end=&newest_first=1)"""
+    try:
+        limit = request.args.get('limit')
+        history = wallet_manager.get_user_trading_history(
+            user_id,
+            limit=int(limit) if limit is not None else None,
+            offset=int(request.args.get('offset', 0)),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            newest_first=request.args.get('newest_first') == '1'
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if 'error' in history:
+        return jsonify(error=history['error']), 404
+    return jsonify(history)
+
+@app.route('/wallet/<user_id>/smart-home', methods=['POST'])
+def connect_smart_home(user_id: str):
+    """
+    Connect a wallet to its Huawei Smart Home so meter readings are credited.
+    
+    Request body: {"huawei_id": "..."}  (must match the id the wallet was created with)
+    """
+    wallet = wallet_manager.get_wallet(user_id)
+    if not wallet:
+        return jsonify(error="wallet not found"), 404
+    data = request.get_json(silent=True)
+    huawei_id = data.get('huawei_id') if isinstance(data, dict) else None
+    if not huawei_id:
+        return jsonify(error="huawei_id required"), 400
+    if not wallet.connect_huawei_smart_home(huawei_id):
+        return jsonify(error="huawei_id does not match this wallet"), 403
+    return jsonify(status="connected", balances=wallet.get_balance_summary())
+
+@app.route('/wallet/<user_id>/smart-home', methods=['DELETE'])
+def disconnect_smart_home(user_id: str):
+    """Stop crediting smart-home readings to this wallet"""
+    wallet = wallet_manager.get_wallet(user_id)
+    if not wallet:
+        return jsonify(error="wallet not found"), 404
+    wallet.disconnect_huawei_smart_home()
+    return jsonify(status="disconnected", balances=wallet.get_balance_summary())
+
+@app.route('/api/smart-home/readings', methods=['POST'])
+def ingest_smart_home_readings():
+    """
+    Bulk smart-home meter ingestion.
+    
+    Request body, row form:
+    {"readings": [{"user_id": "user123", "produced_kwh": 4.2,
+                   "consumed_kwh": 1.1, "timestamp": "2024-01-15T12:00:00"}, ...]}
+    or columnar form:
+    {"user_id": [...], "produced_kwh": [...], "consumed_kwh": [...], "timestamp": [...]}
+    A bare list is taken as the row form. Only wallets connected through
+    POST /wallet/<user_id>/smart-home are credited.
+    """
+    data = request.get_json(silent=True)
+    readings = data.get('readings', data) if isinstance(data, dict) else data
+    if isinstance(readings, dict):
+        if 'user_id' not in readings:
+            return jsonify(error="readings required"), 400
+    elif not isinstance(readings, list):
+        return jsonify(error="readings must be a list or an object of columns"), 400
+    
+    try:
+        results = wallet_manager.sync_huawei_energy_batch(readings)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"malformed readings: {e}"), 400
+    
+    applied = sum(1 for r in results if r['status'] == 'ok')
+    return jsonify(received=len(results), applied=applied, results=results)
+
 @app.route('/order', methods=['POST'])
 def place_order():
     """
@@ -246,8 +352,13 @@ def place_order():
         "side": "buy" or "sell",
         "price": 0.15,
         "quantity": 100,
-        "timestamp": "2024-01-15T12:00:00"
+        "timestamp": "2024-01-15T12:00:00",
+        "time_in_force": "GTC" | "GTD" | "IOC" | "FOK",   (optional, default GTC)
+        "expires_at": "2024-01-15T13:00:00",              (optional; ISO or epoch seconds)
+        "zone": "north",                                  (optional grid zone)
+        "delivery_start": "2024-01-15T14:00:00"           (optional; 15-minute delivery interval)
     }
+    Orders with a zone and/or delivery interval trade in that market's own book.
     """
     data = request.json
     required = ['timestamp', 'price', 'quantity', 'side', 'user_id']
@@ -255,30 +366,146 @@ def place_order():
         return jsonify(error="missing fields"), 400
 
     user_id = data['user_id']
-    if user_id not in wallets:
+    try:
         generate_wallet(user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
     try:
-        submit_order(
+        # Same parsing as /orders: ISO text (with or without offset) or epoch seconds
+        expires_at = data.get('expires_at')
+        if expires_at is not None:
+            expires_at = parse_timestamp(expires_at).timestamp()
+        order_id = submit_order(
             timestamp_iso=data['timestamp'],
             price=float(data['price']),
             qty=int(data['quantity']),
             side=data['side'].lower(),
-            user_id=user_id
+            user_id=user_id,
+            time_in_force=data.get('time_in_force', 'GTC'),
+            expires_at=expires_at,
+            zone=data.get('zone'),
+            delivery_start=data.get('delivery_start')
         )
-        return jsonify(status="order queued", user_id=user_id)
+        return jsonify(status="order queued", user_id=user_id, order_id=order_id)
     except Exception as e:
         return jsonify(error=str(e)), 400
 
+MAX_BATCH_ORDERS = 10_000
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+@app.route('/orders', methods=['POST'])
+def place_orders():
+    """
+    Place a batch of energy orders in one request.
+    
+    Request body: a list of /order objects, or {"orders": [...]}, as JSON or
+    (Content-Type: application/msgpack, when msgpack is installed) MessagePack.
+    Timestamps may be ISO strings or epoch seconds. Orders are validated
+    individually; the response lists each order's result in request order.
+    """
+    if request.mimetype in MSGPACK_TYPES:
+        if not HAS_MSGPACK:
+            return jsonify(error="msgpack payloads need the msgpack package"), 415
+        try:
+            data = msgpack.unpackb(request.get_data(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            return jsonify(error=f"malformed msgpack: {e}"), 400
+    else:
+        data = request.get_json(silent=True)
+    orders = data.get('orders') if isinstance(data, dict) else data
+    if not isinstance(orders, list) or not all(isinstance(o, dict) for o in orders):
+        return jsonify(error="orders must be a list of objects"), 400
+    if len(orders) > MAX_BATCH_ORDERS:
+        return jsonify(error=f"at most {MAX_BATCH_ORDERS} orders per request"), 413
+
+    # One wallet lookup per distinct user rather than per order
+    try:
+        for user_id in {o['user_id'] for o in orders if isinstance(o.get('user_id'), str)}:
+            generate_wallet(user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    results = submit_orders(orders)
+    queued = sum(1 for r in results if r['status'] == 'queued')
+    return jsonify(received=len(results), queued=queued, results=results)
+
+@app.route('/order/<order_id>', methods=['GET'])
+def get_order_status(order_id: str):
+    """Get an order's current state (open, queued, filled, cancelled, ...)"""
+    order = get_order(order_id)
+    if order is None:
+        return jsonify(error="order not found"), 404
+    return jsonify(order)
+
+@app.route('/order/<order_id>', methods=['DELETE'])
+def delete_order(order_id: str):
+    """Cancel an open order and release its reserved balance"""
+    order = cancel_order(order_id)
+    if order is None:
+        return jsonify(error="order not found or already closed"), 404
+    return jsonify(status="order cancelled", order=order)
+
+@app.route('/order/<order_id>', methods=['PATCH'])
+def modify_order(order_id: str):
+    """
+    Amend an open order.
+    
+    Request body: {"price": 0.16, "quantity": 80}  (either field optional)
+    A quantity decrease keeps time priority; other changes re-queue the order.
+    """
+    data = request.json or {}
+    try:
+        order = amend_order(
+            order_id,
+            price=float(data['price']) if 'price' in data else None,
+            qty=int(data['quantity']) if 'quantity' in data else None
+        )
+    except (ValueError, OverflowError) as e:
+        return jsonify(error=str(e)), 400
+    if order is None:
+        return jsonify(error="order not found or already closed"), 404
+    return jsonify(status="order amended", order=order)
+
 @app.route('/book')
 def get_book():
-    """Get current order book"""
+    """Get current order book (aggregated levels, as /book/depth, with matching processes)"""
+    if MATCHING_PROCESSES:
+        # The shard keeps its orders to itself; serve the levels it shares instead
+        return jsonify(get_order_book_depth(20))
     with state_lock:
         return jsonify({
             'bids': order_book['bids'][:20],
             'asks': order_book['asks'][:20]
         })
 
+@app.route('/book/depth')
+def get_book_depth():
+    """Get aggregated depth: [price, total quantity, order count] per level (?market=<name>)"""
+    try:
+        levels = int(request.args.get('levels', 20))
+    except ValueError:
+        return jsonify(error="levels must be an integer"), 400
+    if not 1 <= levels <= 1000:
+        return jsonify(error="levels must be between 1 and 1000"), 400
+    depth = get_order_book_depth(levels, request.args.get('market'))
+    if depth is None:
+        return jsonify(error="market not found"), 404
+    return jsonify(depth)
+
+@app.route('/book/top')
+def get_book_top():
+    """Get best bid/ask with their level totals (?market=<name>)"""
+    top = get_top_of_book(request.args.get('market'))
+    if top is None:
+        return jsonify(error="market not found"), 404
+    return jsonify(top)
+
+@app.route('/markets')
+def list_markets():
+    """List open markets (grid zone x delivery interval) with best prices"""
+    return jsonify(get_markets_summary())
+
 @app.route('/book/summary')
 def get_book_summary():
     """Get order book summary"""
@@ -323,13 +550,21 @@ def get_full_chain():
                 'hash': b.hash,
                 'previous_hash': b.previous_hash,
                 'nonce': b.nonce,
+                'sealer': getattr(b, 'sealer', None),
                 'merkle_root': b.merkle_root,
                 'timestamp': b.timestamp
             } for b in blockchain.chain
         ],
-        'valid': blockchain.is_chain_valid()
+        'valid': blockchain.check_chain()
     })
 
+@app.route('/network/peers')
+def get_peers():
+    """List replication peers of this node"""
+    if not peer_node:
+        return jsonify(enabled=False, peers=[])
+    return jsonify(enabled=True, address=peer_node.address, peers=sorted(peer_node.peers))
+
 @app.route('/quantum/channel', methods=['POST'])
 def establish_channel():
     """Establish quantum channel between participants"""
@@ -340,12 +575,9 @@ def establish_channel():
     if not user_a or not user_b:
         return jsonify(error="Both user_a and user_b required"), 400
     
-    if user_a not in wallets:
+    try:
         generate_wallet(user_a)
-    if user_b not in wallets:
         generate_wallet(user_b)
-    
-    try:
         channel = blockchain.establish_quantum_channel(user_a, user_b)
         return jsonify(
             status="channel established",
@@ -370,15 +602,15 @@ def list_participants():
 @app.route('/stats')
 def get_stats():
     """Get platform statistics"""
-    with state_lock:
-        total_bids = len(order_book['bids'])
-        total_asks = len(order_book['asks'])
+    top = get_top_of_book()
+    total_bids, total_asks = top['total_bids'], top['total_asks']
     
     stats = {
         'blockchain': {
-            'height': len(blockchain.chain),
+            'height': blockchain.height,
+            'consensus': blockchain.consensus.name,
             'total_transactions': sum(len(b.transactions) for b in blockchain.chain),
-            'is_valid': blockchain.is_chain_valid(),
+            'is_valid': blockchain.check_chain(),
             'quantum_participants': len(blockchain.quantum_participants),
             'quantum_channels': len(blockchain.quantum_channels)
         },
@@ -388,7 +620,7 @@ def get_stats():
             'active_orders': total_bids + total_asks
         },
         'wallets': {
-            'total_wallets': len(wallets)
+            'total_wallets': len(wallet_manager.wallets)
         }
     }
     
@@ -409,8 +641,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'forecast_service': bool(forecast_service and forecast_service.models),
-        'blockchain_height': len(blockchain.chain),
-        'blockchain_valid': blockchain.is_chain_valid()
+        'blockchain_height': blockchain.height,
+        'blockchain_valid': blockchain.check_chain()
     })
 
 # ------------------------------------------------------------------
@@ -423,14 +655,15 @@ def on_connect():
     LOGGER.info(f"Client connected: {request.sid}")
     
     with state_lock:
+        bids, asks = book_entries(20)
         initial_data = {
             'market_update': {
                 'order_book': {
-                    'bids': [(p, q, str(t)) for p, q, t in order_book['bids'][:20]],
-                    'asks': [(p, q, str(t)) for p, q, t in order_book['asks'][:20]]
+                    'bids': bids,
+                    'asks': asks
                 },
                 'blockchain': {
-                    'height': len(blockchain.chain),
+                    'height': blockchain.height,
                     'latest_hash': blockchain.chain[-1].hash[:8] + '...'
                 }
             }
@@ -473,9 +706,46 @@ def on_forecast_request(data):
 # Background Engine
 # ------------------------------------------------------------------
 
+def start_peer_node():
+    """Start block gossip with local replicas and catch up from peers"""
+    global peer_node
+    if not P2P_PORT:
+        return
+    if CONSENSUS_MODE == "poa" and not SEALER_KEY_FILE:
+        # Peers pin our sealer key via QORCA_AUTHORITIES; an ephemeral key breaks that on restart
+        raise RuntimeError("A PoA peer node needs a persistent sealer key (set QORCA_SEALER_KEY)")
+    peer_node = PeerNode(blockchain, port=int(P2P_PORT))
+    for peer in P2P_PEERS:
+        peer_node.add_peer(peer)
+    peer_node.start()
+    peer_node.sync()
+    LOGGER.info(f"✅ Peer node {peer_node.address} synced with {len(P2P_PEERS)} peers")
+
+def _emit_block_event(topic, block):
+    """Push newly added blocks to WebSocket clients"""
+    socketio.emit('new_block', {
+        'index': block.index,
+        'hash': block.hash,
+        'prev': block.previous_hash,
+        'tx_count': len(block.transactions),
+        'timestamp': block.timestamp,
+        'sealer': getattr(block, 'sealer', None)
+    })
+
+def _emit_channel_event(topic, channel):
+    """Notify WebSocket clients about newly established quantum channels"""
+    socketio.emit('quantum_channel', {
+        'channel_id': channel.channel_id,
+        'participants': list(channel.participants),
+        'created_at': channel.created_at
+    })
+
 def start_background():
     """Start background order processing"""
+    start_peer_node()
     set_socketio(socketio)
+    blockchain.events.subscribe('block', _emit_block_event)
+    blockchain.events.subscribe('channel', _emit_channel_event)
     t = threading.Thread(target=background_order_engine, daemon=True)
     t.start()
     LOGGER.info("✅ Background order engine started")
@@ -493,9 +763,10 @@ if __name__ == '__main__':
     print(f"   Timezone: {PLANT_CONFIG.timezone}")
     
     print(f"\n🔗 Blockchain:")
+    print(f"   Consensus: {blockchain.consensus.name}")
     print(f"   Difficulty: {blockchain.difficulty}")
-    print(f"   Height: {len(blockchain.chain)}")
-    print(f"   Valid: {blockchain.is_chain_valid()}")
+    print(f"   Height: {blockchain.height}")
+    print(f"   Valid: {blockchain.check_chain()}")
     
     if forecast_service and forecast_service.models:
         print(f"\n🔮 Solar Forecasting:")
@@ -1,20 +1,112 @@
 # background_order_processor.py
+import itertools
+import math
+import os
 import threading
 import time
-from collections import deque
-from order_book import process_and_rank_orders, match_transaction, is_liquid, transacted_orders
-from block_chain_templates import Blockchain, Transaction
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from order_book import Order, TIME_IN_FORCE
+from call_auction import INTERVAL_SECONDS
+from market_registry import Market, MarketTick, MarketRegistry
+from market_shard import ShardedMarket
+from order_journal import OrderJournal
+from block_chain_templates import (
+    Blockchain, Transaction, ProofOfAuthority, QuantumParticipant, SimpleSigningKey
+)
+from ledger_checkpoint import CheckpointStore
+from wallet_manager import wallet_manager
 from flask_socketio import SocketIO
 
 # ------------------------------------------------------------------
 # Global shared state
 # ------------------------------------------------------------------
-order_queue = deque()  # (timestamp_iso, price, qty, side, user_id)
-order_book = {'bids': [], 'asks': []}
-state_lock = threading.Lock()
+_order_seq = itertools.count(1)
+
+# QORCA_MARKET_MODE=auction collects orders per 15-minute delivery interval
+# (by order timestamp) and clears each interval at one uniform price instead
+# of matching continuously
+MARKET_MODE = os.environ.get("QORCA_MARKET_MODE", "continuous").lower()
+if MARKET_MODE not in ("continuous", "auction"):
+    raise ValueError(f"Unknown QORCA_MARKET_MODE: {MARKET_MODE}")
+
+# QORCA_ORDER_JOURNAL=<path> journals accepted orders, cancels, amendments and
+# engine ticks for order_journal.replay(); QORCA_ORDER_JOURNAL_FSYNC=1 fsyncs
+# the journal once per tick
+ORDER_JOURNAL_PATH = os.environ.get("QORCA_ORDER_JOURNAL")
+order_journal = None
+if ORDER_JOURNAL_PATH:
+    order_journal = OrderJournal(ORDER_JOURNAL_PATH,
+                                 fsync=os.environ.get("QORCA_ORDER_JOURNAL_FSYNC", "0") == "1")
+    order_journal.append("start", market_mode=MARKET_MODE)
+
+# QORCA_MATCHING_PROCESSES=1 matches markets in a pool of at most
+# QORCA_SHARD_PROCESSES processes (see market_shard): orders and fills cross
+# shared-memory rings and the top of book is read from shared memory.
+# Reservations and settlement stay here.
+MATCHING_PROCESSES = os.environ.get("QORCA_MATCHING_PROCESSES", "0") == "1"
+
+# Grid zones orders may name, comma-separated (any well-formed zone when unset)
+ZONES = [zone.strip() for zone in os.environ.get("QORCA_ZONES", "").split(",") if zone.strip()] or None
+
+# One book, queue and lock per market (grid zone x delivery interval); orders
+# without a zone or delivery interval go to the default spot market
+markets = MarketRegistry(order_journal, auction_mode=MARKET_MODE == "auction",
+                         market_class=ShardedMarket if MATCHING_PROCESSES else Market, zones=ZONES)
+default_market = markets.default
+# The default market's state under the names it had before markets were split
+order_book = default_market.order_book
+call_auction = default_market.call_auction
+order_queue = default_market.order_queue
+queued_orders = default_market.queued_orders
+state_lock = default_market.lock
+
+# QORCA_ENGINE_WORKERS: threads ticking markets side by side
+ENGINE_WORKERS = int(os.environ.get("QORCA_ENGINE_WORKERS", "4"))
 
 # Blockchain instance (quantum-enabled)
-blockchain = Blockchain(difficulty=2, max_block_transactions=5)
+# QORCA_CONSENSUS=poa seals blocks with a local authority key instead of mining.
+# QORCA_SEALER_KEY is the file holding that key (created on first start); without
+# it the key is ephemeral. QORCA_AUTHORITIES ("label:pubkeyhex,...") lists the
+# other sealers whose blocks this node accepts.
+CONSENSUS_MODE = os.environ.get("QORCA_CONSENSUS", "pow").lower()
+SEALER_KEY_FILE = os.environ.get("QORCA_SEALER_KEY")
+AUTHORITIES = dict(entry.strip().split(":", 1)
+                   for entry in os.environ.get("QORCA_AUTHORITIES", "").split(",") if entry.strip())
+# QORCA_CHECKPOINT_DIR enables state checkpoints every QORCA_CHECKPOINT_INTERVAL blocks
+CHECKPOINT_DIR = os.environ.get("QORCA_CHECKPOINT_DIR")
+CHECKPOINT_INTERVAL = int(os.environ.get("QORCA_CHECKPOINT_INTERVAL", "100"))
+CHECKPOINT_PRUNE = os.environ.get("QORCA_CHECKPOINT_PRUNE", "0") == "1"
+
+def _build_blockchain() -> Blockchain:
+    consensus = None
+    if CONSENSUS_MODE == "poa":
+        key = SimpleSigningKey.from_file(SEALER_KEY_FILE) if SEALER_KEY_FILE else None
+        sealer = QuantumParticipant(os.environ.get("QORCA_SEALER", "CommunitySealer"), key)
+        consensus = ProofOfAuthority(sealer, AUTHORITIES)
+        print(f"[Engine] PoA sealer {sealer.label} public key {sealer.address}")
+    store = CheckpointStore(CHECKPOINT_DIR) if CHECKPOINT_DIR else None
+    chain = Blockchain(difficulty=2, max_block_transactions=5, consensus=consensus,
+                       checkpoint_store=store, checkpoint_interval=CHECKPOINT_INTERVAL,
+                       prune_on_checkpoint=CHECKPOINT_PRUNE)
+    if store is not None:
+        # Resume from the latest checkpoint (or genesis) and replay the block log
+        checkpoint = store.latest()
+        blocks = store.logged_blocks()
+        if checkpoint is not None:
+            restored = chain.restore_checkpoint(checkpoint, blocks)
+            print(f"[Engine] Resumed from checkpoint at height {checkpoint['height']}, "
+                  f"replayed to height {chain.height}")
+        else:
+            restored = chain.replay_blocks(blocks)
+            print(f"[Engine] Replayed block log to height {chain.height}")
+        if not restored:
+            print("[Engine] Block log failed validation; resumed without it")
+    return chain
+
+blockchain = _build_blockchain()
 
 # WebSocket
 socketio: SocketIO = None
@@ -26,160 +118,445 @@ def set_socketio(sio: SocketIO):
 # ------------------------------------------------------------------
 # Public API
 # ------------------------------------------------------------------
-def submit_order(timestamp_iso: str, price: float, qty: int, side: str, user_id: str):
-    """Submit an order to the queue"""
+def _reservation(side: str, price: float, qty: int) -> Dict[str, float]:
+    """Balance held for an order: energy for sells, fiat at the limit price for buys"""
+    return {'energy_kwh': qty} if side == 'sell' else {'fiat': price * qty}
+
+def _release(orders: List[Order]):
+    """Return the reservation for the unfilled part of closed orders"""
+    for order in orders:
+        if order.qty > 0:
+            wallet_manager.release(order.user_id, **_reservation(order.side, order.price, order.qty))
+
+def parse_timestamp(value: Union[str, float, datetime]) -> datetime:
+    """Order timestamp from ISO text, epoch seconds or a datetime (naive, local time)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace(' ', 'T'))
+    elif isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError("timestamp must be finite")
+        try:
+            value = datetime.fromtimestamp(value)
+        except (OverflowError, OSError):
+            raise ValueError(f"timestamp out of range: {value}")
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+def _new_order(timestamp: Union[str, float, datetime], price: float, qty: int, side: str, user_id: str,
+               time_in_force: str = 'GTC', expires_at: Optional[float] = None) -> Order:
+    """Validate an order, parse its timestamp and reserve its balance"""
     if side not in ('buy', 'sell'):
         raise ValueError("side must be 'buy' or 'sell'")
+    if not (math.isfinite(price) and math.isfinite(qty)):
+        raise ValueError("price/qty must be finite")
     if price <= 0 or qty <= 0:
         raise ValueError("price/qty must be positive")
+    if expires_at is not None and not math.isfinite(expires_at):
+        raise ValueError("expires_at must be finite")
+    time_in_force = time_in_force.upper()
+    if expires_at is not None and time_in_force == 'GTC':
+        time_in_force = 'GTD'
+    if time_in_force not in TIME_IN_FORCE:
+        raise ValueError(f"time_in_force must be one of {', '.join(TIME_IN_FORCE)}")
+    if time_in_force == 'GTD' and expires_at is None:
+        raise ValueError("GTD orders need expires_at")
+    if MARKET_MODE == "auction" and time_in_force in ('IOC', 'FOK'):
+        raise ValueError("IOC/FOK orders are not supported in auction mode")
+    # Parsed once here; the engine and book only ever see the datetime
+    timestamp = parse_timestamp(timestamp)
 
-    with state_lock:
-        order_queue.append((timestamp_iso, price, qty, side, user_id))
+    # Reserve up front so that settling a fill against the wallet can never fail
+    ok, message = wallet_manager.reserve(user_id, **_reservation(side, price, qty))
+    if not ok:
+        raise ValueError(message)
+
+    order_id = f"ORD-{time.time()}-{next(_order_seq)}"
+    return Order(order_id, side, price, qty, timestamp, user_id, time_in_force, expires_at)
+
+def _market_key(zone: Optional[str], delivery_start) -> Tuple[str, Optional[int]]:
+    """Checked market key for an incoming order; delivery_start is ISO text, epoch seconds or a datetime"""
+    if delivery_start is not None:
+        delivery_start = parse_timestamp(delivery_start).timestamp()
+        if delivery_start + INTERVAL_SECONDS <= time.time():
+            raise ValueError("delivery interval is already over")
+    return markets.key(zone, delivery_start)
+
+def _market_for(key: Tuple[str, Optional[int]], order: Order) -> Market:
+    """Market for an accepted order, created on first use; releases the order if it cannot be opened"""
+    try:
+        return markets.get_or_create(*key)
+    except ValueError:
+        _release([order])
+        raise
+
+def submit_order(timestamp_iso: Union[str, float, datetime], price: float, qty: int, side: str, user_id: str,
+                 time_in_force: str = 'GTC', expires_at: Optional[float] = None,
+                 zone: Optional[str] = None, delivery_start=None) -> str:
+    """Submit an order to its market's queue; returns its order id"""
+    key = _market_key(zone, delivery_start)
+    order = _new_order(timestamp_iso, price, qty, side, user_id, time_in_force, expires_at)
+    markets.enqueue(_market_for(key, order), [order])
+    return order.order_id
+
+def submit_orders(entries: List[dict]) -> List[dict]:
+    """
+    Submit a batch of orders (the /order request fields: user_id, side, price,
+    quantity, timestamp, optional time_in_force/expires_at/zone/delivery_start).
+    Each entry is validated and reserved on its own; accepted orders join
+    their market's queue in one step per market. Returns per-entry results:
+    {'status': 'queued', 'order_id': ..., 'market': ...} or
+    {'status': 'rejected', 'error': ...}.
+    """
+    accepted: Dict[Market, List[Order]] = {}
+    results = []
+    try:
+        for entry in entries:
+            try:
+                expires_at = entry.get('expires_at')
+                if expires_at is not None:
+                    expires_at = parse_timestamp(expires_at).timestamp()
+                key = _market_key(entry.get('zone'), entry.get('delivery_start'))
+                order = _new_order(
+                    entry['timestamp'],
+                    float(entry['price']),
+                    int(entry['quantity']),
+                    str(entry['side']).lower(),
+                    entry['user_id'],
+                    entry.get('time_in_force', 'GTC'),
+                    expires_at
+                )
+                # Only accepted orders open a market
+                market = _market_for(key, order)
+            except KeyError as e:
+                results.append({'status': 'rejected', 'error': f"missing field {e}"})
+                continue
+            except (AttributeError, TypeError, ValueError, OverflowError) as e:
+                results.append({'status': 'rejected', 'error': str(e)})
+                continue
+            accepted.setdefault(market, []).append(order)
+            results.append({'status': 'queued', 'order_id': order.order_id, 'market': market.name})
+    except BaseException:
+        # Nothing was queued yet: hand back what earlier entries reserved
+        for orders in accepted.values():
+            _release(orders)
+        raise
+    for market, orders in accepted.items():
+        markets.enqueue(market, orders)
+    return results
+
+def _order_dict(market: Market, order: Order) -> dict:
+    result = order.to_dict()
+    result['market'] = market.name
+    return result
+
+def cancel_order(order_id: str) -> Optional[dict]:
+    """Cancel a queued or resting order; returns it, or None if it is not open"""
+    market = markets.find(order_id)
+    if market is None:
+        return None
+    with market.lock:
+        order = market.locked_cancel(order_id)
+    if order is None:
+        return None
+    _release([order])
+    return _order_dict(market, order)
+
+def amend_order(order_id: str, price: Optional[float] = None, qty: Optional[int] = None) -> Optional[dict]:
+    """
+    Change an open order's price and/or quantity, adjusting its reservation.
+    Returns the amended order, None if it is not open; raises ValueError if
+    the new size cannot be reserved.
+    """
+    if any(v is not None and not math.isfinite(v) for v in (price, qty)):
+        raise ValueError("price/qty must be finite")
+    if (price is not None and price <= 0) or (qty is not None and qty <= 0):
+        raise ValueError("price/qty must be positive")
+    market = markets.find(order_id)
+    if market is None:
+        return None
+    with market.lock:
+        order = market.locked_open_order(order_id)
+        if order is None:
+            return None
+        old = _reservation(order.side, order.price, order.qty)
+        new = _reservation(order.side, order.price if price is None else price,
+                           order.qty if qty is None else qty)
+        delta = {k: new[k] - old[k] for k in new}
+        if any(v > 0 for v in delta.values()):
+            ok, message = wallet_manager.reserve(order.user_id, **delta)
+            if not ok:
+                raise ValueError(message)
+        market.locked_amend(order_id, price, qty)
+        if any(v < 0 for v in delta.values()):
+            wallet_manager.release(order.user_id, **{k: -v for k, v in delta.items()})
+        return _order_dict(market, order)
+
+def get_order(order_id: str) -> Optional[dict]:
+    market = markets.find(order_id)
+    if market is None:
+        return None
+    with market.lock:
+        order = market.locked_get(order_id)
+        return _order_dict(market, order) if order is not None else None
 
 # ------------------------------------------------------------------
 # Background Worker
 # ------------------------------------------------------------------
+def net_trades(trades: List[dict]) -> Dict[tuple, List[dict]]:
+    """Group a tick's settled trades by (seller, buyer), in first-execution order"""
+    pairs: Dict[tuple, List[dict]] = {}
+    for trade in trades:
+        pairs.setdefault((trade['seller'], trade['buyer']), []).append(trade)
+    return pairs
+
+def record_on_chain(seller_id: str, buyer_id: str, trades: List[dict]):
+    """Add one blockchain transaction for all of a pair's settled fills in this tick"""
+    amount_usd = sum(t['price'] * t['qty'] for t in trades)
+    fills = [{
+        'trade_id': t['trade_id'],
+        'buy_order_id': t['buy_order_id'],
+        'sell_order_id': t['sell_order_id'],
+        'price': t['price'],
+        'qty': t['qty']
+    } for t in trades]
+    try:
+        # Check if both parties are quantum participants
+        buyer_is_quantum = buyer_id in blockchain.quantum_participants
+        seller_is_quantum = seller_id in blockchain.quantum_participants
+        
+        if buyer_is_quantum and seller_is_quantum:
+            # Create quantum-secured transaction
+            print(f"[Engine] Creating quantum transaction: {seller_id} → {buyer_id}, "
+                  f"${amount_usd:.2f} ({len(fills)} fills)")
+            tx = blockchain.create_quantum_transaction(
+                sender_label=seller_id,
+                recipient_label=buyer_id,
+                amount=amount_usd,
+                fills=fills
+            )
+            transaction_type = 'quantum'
+        else:
+            # Create standard transaction
+            print(f"[Engine] Creating standard transaction: {seller_id} → {buyer_id}, "
+                  f"${amount_usd:.2f} ({len(fills)} fills)")
+            tx = Transaction(
+                sender=seller_id,
+                recipient=buyer_id,
+                amount=amount_usd,
+                fills=fills
+            )
+            transaction_type = 'standard'
+        
+        # Add to blockchain
+        blockchain.add_transaction(tx)
+        for trade in trades:
+            trade['transaction_type'] = transaction_type
+            trade['tx_added'] = True
+        
+    except Exception as e:
+        print(f"[Engine] Blockchain error: {e}")
+        for trade in trades:
+            trade['tx_added'] = False
+            trade['tx_error'] = str(e)
+
+
+def tick_market(market: Market, now: Optional[float] = None) -> MarketTick:
+    """
+    One pass over a market: expire, drain and match its queue, clear due
+    auctions under the market's lock, then release, settle and record fills.
+    Closed orders and fills have left the book once the tick returns, so they
+    are released and settled even if flushing the journal fails; a failing
+    settlement hands back the reservations it did not reach (see
+    WalletManager.settle_order_fills) and the error propagates.
+    """
+    with market.lock:
+        tick = market.locked_tick(time.time() if now is None else now)
+    try:
+        if order_journal is not None:
+            order_journal.flush()
+    finally:
+        _release(tick.closed)
+        # === SETTLEMENT: one lock round and one ledger record per tick ===
+        settlements = wallet_manager.settle_order_fills(tick.fills) if tick.fills else []
+    for result in tick.auctions:
+        print(f"[Engine] {market.name} auction {result.to_dict()['interval_start']}: "
+              f"{result.volume:.2f} kWh at {result.price}")
+    if tick.incoming:
+        print(f"[Engine] {market.name}: processed {tick.incoming} orders")
+
+    if tick.fills:
+        settled = []
+        trade = None
+        for fill, settlement in zip(tick.fills, settlements):
+            trade = fill.to_dict()
+            trade['market'] = market.name
+            trade['settled'] = settlement['status'] == 'completed'
+            if not trade['settled']:
+                print(f"[Engine] Settlement failed: {fill.seller_id} → {fill.buyer_id}, {fill.qty} kWh")
+                continue
+            trade['trade_id'] = settlement['trade_id']
+            settled.append(trade)
+
+        # One on-chain transaction per (seller, buyer) pair per tick
+        for (seller_id, buyer_id), pair_trades in net_trades(settled).items():
+            record_on_chain(seller_id, buyer_id, pair_trades)
+        print(f"[Engine] {market.name}: matched {len(tick.fills)} fills")
+        with market.lock:
+            market.last_trade = trade
+            market.unreported_fills += len(tick.fills)
+    return tick
+
+def book_entries(limit: int) -> Tuple[list, list]:
+    """
+    (bids, asks) of the default market for listings, best first (caller
+    holds state_lock): (price, qty, timestamp text) per order. A sharded
+    market shares only its best level, as (price, total qty, order count).
+    """
+    if MATCHING_PROCESSES:
+        return default_market.depth(1)
+    return ([(p, q, str(t)) for p, q, t, _ in order_book['bids'][:limit]],
+            [(p, q, str(t)) for p, q, t, _ in order_book['asks'][:limit]])
+
+_default_book: Optional[dict] = None  # last snapshot of the default book for market updates
+
+def _default_book_snapshot() -> dict:
+    """Top 20 levels, top of book and last auction of the default market; the previous snapshot while it is busy"""
+    global _default_book
+    if not state_lock.acquire(blocking=_default_book is None):
+        return _default_book
+    try:
+        bids, asks = book_entries(20)
+        _default_book = {
+            'bids': bids,
+            'asks': asks,
+            'top': default_market._top(),
+            'auction': call_auction.last_result.to_dict() if call_auction.last_result else None
+        }
+    finally:
+        state_lock.release()
+    return _default_book
+
+def _market_update() -> dict:
+    """
+    Market update payload: the default book in full, every market in summary.
+    Never waits for a market that is ticking: it is reported from its last
+    summary, and its fills are counted in a later update.
+    """
+    summaries = []
+    fills = 0
+    trade = None
+    for market in markets:
+        if market.lock.acquire(blocking=False):
+            try:
+                market.last_summary = market.summary()
+                fills += market.unreported_fills
+                market.unreported_fills = 0
+            finally:
+                market.lock.release()
+        if market.last_summary is not None:
+            summaries.append(market.last_summary)
+        last_trade = market.last_trade  # replaced whole, safe to read without the lock
+        if last_trade and (trade is None or last_trade['timestamp'] > trade['timestamp']):
+            trade = last_trade
+    book = _default_book_snapshot()
+    top = book['top']
+    best_bid, best_ask = top['best_bid'], top['best_ask']
+    spread = (best_ask - best_bid) / best_bid if best_bid is not None and best_ask is not None else None
+    # Prepare market update payload
+    return {
+        'order_book': {
+            'bids': book['bids'],
+            'asks': book['asks']
+        },
+        'last_trade': trade,
+        'fills': fills,
+        'market_mode': MARKET_MODE,
+        'auction': book['auction'],
+        'markets': summaries,
+        'stats': {
+            'total_bids': top['total_bids'],
+            'total_asks': top['total_asks'],
+            'liquidity': 'liquid' if (trade and trade.get('liquid')) else 'illiquid',
+            'spread': f"{spread * 100:.2f}%" if spread is not None else "N/A"
+        },
+        'blockchain': {
+            'height': blockchain.height,
+            'latest_hash': blockchain.chain[-1].hash[:8] + '...',
+            'mempool_size': len(blockchain.mempool),
+            'total_transactions': sum(len(b.transactions) for b in blockchain.chain),
+            'quantum_participants': len(blockchain.quantum_participants),
+            'quantum_channels': len(blockchain.quantum_channels)
+        }
+    }
+
+def engine_tick() -> dict:
+    """
+    Tick every market with work on the calling thread, one after another.
+    Returns the market update payload.
+    """
+    now = time.time()
+    for market in markets:
+        if market.has_work():
+            tick_market(market, now)
+    markets.prune(now)
+    return _market_update()
+
+def _run_market(market: Market):
+    try:
+        tick_market(market)
+    except Exception:
+        # Reservations were already settled or released by tick_market
+        print(f"[Engine] {market.name} tick failed:\n{traceback.format_exc()}")
+    finally:
+        market.scheduled = False
+
 def background_order_engine():
-    """Main order processing loop"""
+    """
+    Main order processing loop. Markets tick independently on a worker pool:
+    a market is scheduled again only once its previous tick has finished, so
+    a slow or busy market never delays the others. Market updates are
+    broadcast from a separate thread.
+    """
     print("[Engine] Started with quantum-enhanced blockchain")
-    print(f"[Engine] Blockchain height: {len(blockchain.chain)}")
+    print(f"[Engine] Blockchain height: {blockchain.height}")
     print(f"[Engine] Quantum participants: {list(blockchain.quantum_participants.keys())}")
-    
-    while True:
-        # 1. Drain queue and process new orders
-        incoming = []
-        with state_lock:
-            while order_queue:
-                incoming.append(order_queue.popleft())
+    print(f"[Engine] Ticking markets on {ENGINE_WORKERS} workers")
 
-        if incoming:
-            try:
-                # Process and rank orders
-                ranked = process_and_rank_orders(incoming)
-                with state_lock:
-                    order_book['bids'].extend(ranked['bids'])
-                    order_book['asks'].extend(ranked['asks'])
-                    # Re-sort order book
-                    order_book['bids'].sort(key=lambda x: (-x[0], x[2]))  # price desc, time asc
-                    order_book['asks'].sort(key=lambda x: (x[0], x[2]))   # price asc, time asc
-                print(f"[Engine] Processed {len(incoming)} orders")
-            except Exception as e:
-                print(f"[Engine] Ranking error: {e}")
-
-        # 2. Check for matches and create transactions
-        with state_lock:
-            current = {
-                'bids': order_book['bids'].copy(),
-                'asks': order_book['asks'].copy()
-            }
+    threading.Thread(target=_broadcast_market_updates, name="market-update", daemon=True).start()
+    with ThreadPoolExecutor(max_workers=ENGINE_WORKERS, thread_name_prefix="market") as pool:
+        while True:
+            for market in markets:
+                if not market.scheduled and market.has_work():
+                    market.scheduled = True
+                    pool.submit(_run_market, market)
+            markets.prune(time.time())
 
-        trade = None
-        if current['bids'] and current['asks']:
-            # Calculate market conditions
-            best_bid_p = current['bids'][0][0]
-            best_ask_p = current['asks'][0][0]
-            spread = (best_ask_p - best_bid_p) / best_bid_p if best_bid_p else 999
-            volume = sum(q for _, q, _ in transacted_orders[-100:])  # last 100 trades
-            liquid = is_liquid(volume, spread)
-
-            # Attempt to match
-            result = match_transaction(current, liquid)
-            
-            if result['transaction_price'] is not None:
-                # Match found!
-                buyer_id = current['bids'][0][2] if current['bids'] else "unknown"
-                seller_id = current['asks'][0][2] if current['asks'] else "unknown"
-                qty_matched = min(
-                    current['bids'][0][1] if current['bids'] else 0,
-                    current['asks'][0][1] if current['asks'] else 0
-                )
-                
-                trade = {
-                    'price': result['transaction_price'],
-                    'market_price': result['market_price'],
-                    'qty': qty_matched,
-                    'buyer': buyer_id,
-                    'seller': seller_id,
-                    'timestamp': time.time(),
-                    'liquid': liquid
-                }
-
-                # Update global order book
-                with state_lock:
-                    order_book['bids'] = result['order_book']['bids']
-                    order_book['asks'] = result['order_book']['asks']
-
-                # === BLOCKCHAIN TRANSACTION ===
-                try:
-                    amount_usd = trade['price'] * qty_matched
-                    
-                    # Check if both parties are quantum participants
-                    buyer_is_quantum = buyer_id in blockchain.quantum_participants
-                    seller_is_quantum = seller_id in blockchain.quantum_participants
-                    
-                    if buyer_is_quantum and seller_is_quantum:
-                        # Create quantum-secured transaction
-                        print(f"[Engine] Creating quantum transaction: {seller_id} → {buyer_id}, ${amount_usd:.2f}")
-                        tx = blockchain.create_quantum_transaction(
-                            sender_label=seller_id,
-                            recipient_label=buyer_id,
-                            amount=amount_usd
-                        )
-                        trade['transaction_type'] = 'quantum'
-                    else:
-                        # Create standard transaction
-                        print(f"[Engine] Creating standard transaction: {seller_id} → {buyer_id}, ${amount_usd:.2f}")
-                        tx = Transaction(
-                            sender=seller_id,
-                            recipient=buyer_id,
-                            amount=amount_usd
-                        )
-                        trade['transaction_type'] = 'standard'
-                    
-                    # Add to blockchain
-                    blockchain.add_transaction(tx)
-                    trade['tx_added'] = True
-                    
-                except Exception as e:
-                    print(f"[Engine] Blockchain error: {e}")
-                    trade['tx_added'] = False
-                    trade['tx_error'] = str(e)
-
-        # 3. Broadcast market update via WebSocket
-        with state_lock:
-            # Prepare market update payload
-            payload = {
-                'order_book': {
-                    'bids': [(p, q, str(t)) for p, q, t in order_book['bids'][:20]],
-                    'asks': [(p, q, str(t)) for p, q, t in order_book['asks'][:20]]
-                },
-                'last_trade': trade,
-                'stats': {
-                    'total_bids': len(order_book['bids']),
-                    'total_asks': len(order_book['asks']),
-                    'liquidity': 'liquid' if (trade and trade.get('liquid')) else 'illiquid',
-                    'spread': f"{spread * 100:.2f}%" if current['bids'] and current['asks'] else "N/A"
-                },
-                'blockchain': {
-                    'height': len(blockchain.chain),
-                    'latest_hash': blockchain.chain[-1].hash[:8] + '...',
-                    'mempool_size': len(blockchain.mempool),
-                    'total_transactions': sum(len(b.transactions) for b in blockchain.chain),
-                    'quantum_participants': len(blockchain.quantum_participants),
-                    'quantum_channels': len(blockchain.quantum_channels)
-                }
-            }
-
-        # Emit update to all connected clients
-        if socketio:
-            socketio.emit('market_update', payload)
-
-        # Sleep before next iteration
+            # Sleep before next iteration
+            time.sleep(0.3)
+
+def _broadcast_market_updates():
+    """Emit the market update to all connected clients, on its own thread so it never holds up scheduling"""
+    while True:
+        try:
+            payload = _market_update()
+            if socketio:
+                socketio.emit('market_update', payload)
+        except Exception as e:
+            print(f"[Engine] Market update failed: {e}")
         time.sleep(0.3)
 
 
 def get_order_book_summary():
-    """Get a snapshot of the current order book"""
+    """
+    Get a snapshot of the current order book. With matching processes the
+    per-order book stays in the shard: bids/asks hold its best level as
+    (price, total qty, order count) and the totals come from shared memory.
+    """
+    if MATCHING_PROCESSES:
+        top = default_market.top_of_book()
+        bids, asks = default_market.depth(1)
+        return {'bids': bids, 'asks': asks, 'total_bids': top['total_bids'], 'total_asks': top['total_asks']}
     with state_lock:
         return {
             'bids': order_book['bids'][:10],
@@ -189,15 +566,52 @@ def get_order_book_summary():
         }
 
 
+def get_order_book_depth(levels: int = 20, market_name: Optional[str] = None):
+    """
+    Aggregated depth per price level: (price, total qty, order count), best
+    first, for the named market (default market when None); None if unknown.
+    A sharded market shares only its best level.
+    """
+    market = default_market if market_name is None else markets.get(market_name)
+    if market is None:
+        return None
+    with market.lock:
+        bids, asks = market.depth(levels)
+    return {'market': market.name, 'bids': bids, 'asks': asks}
+
+
+def get_top_of_book(market_name: Optional[str] = None):
+    """
+    Best bid/ask of the named market (default market when None); None if
+    unknown. A sharded market serves it from shared memory without a lock.
+    """
+    market = default_market if market_name is None else markets.get(market_name)
+    if market is None:
+        return None
+    top = market.top_of_book()
+    top['market'] = market.name
+    return top
+
+
+def get_markets_summary():
+    """Every open market with its best prices and order counts"""
+    summaries = []
+    for market in markets:
+        with market.lock:
+            summaries.append(market.summary())
+    return summaries
+
+
 def get_blockchain_summary():
     """Get a snapshot of the blockchain state"""
     return {
-        'height': len(blockchain.chain),
+        'height': blockchain.height,
         'difficulty': blockchain.difficulty,
+        'consensus': blockchain.consensus.name,
         'total_transactions': sum(len(b.transactions) for b in blockchain.chain),
         'mempool_size': len(blockchain.mempool),
         'quantum_enabled': True,
         'quantum_participants': list(blockchain.quantum_participants.keys()),
         'quantum_channels': len(blockchain.quantum_channels),
-        'is_valid': blockchain.is_chain_valid()
+        'is_valid': blockchain.check_chain()
     }
@@ -0,0 +1,107 @@
+# bench_market_shard.py
+"""
+In-process vs process-sharded matching (market_shard.ShardedMarket).
+
+  - flow: the same synthetic order flow (bench_matching.OrderFlow) through
+          Market and ShardedMarket, a tick per burst (a sharded tick returns
+          with its fills); orders/s and p50/p99 per tick call
+  - top:  top-of-book reads, Market under its lock vs the shard's seqlock
+          in shared memory, while the engine thread keeps ticking
+
+Both runs must produce the same fills; the result is printed.
+
+Run from core_function/:
+    python benchmarks/bench_market_shard.py --orders 100000
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_matching import OrderFlow, percentiles
+from market_registry import Market
+from market_shard import ShardedMarket
+from order_book import Order
+
+
+def run_flow(market, orders: int, seed: int):
+    flow = OrderFlow(seed)
+    fills = []
+    latencies = []
+    now = 0.0
+    sent = 0
+    t0 = time.perf_counter()
+    while sent < orders:
+        burst = []
+        for _ in range(min(flow.burst(), orders - sent)):
+            side, price, qty, ts, user = flow.order()
+            burst.append(Order(f"FLOW-{sent}", side, price, qty, ts, user))
+            sent += 1
+        market.enqueue(burst)
+        now += 1.0
+        start = time.perf_counter_ns()
+        with market.lock:
+            fills.extend(market.locked_tick(now).fills)
+        latencies.append(time.perf_counter_ns() - start)
+    elapsed = time.perf_counter() - t0
+    p50, p99 = percentiles(latencies)
+    return fills, {'orders_per_s': orders / elapsed, 'tick_p50_us': p50, 'tick_p99_us': p99}
+
+
+def run_top(market, reads: int, seed: int):
+    """Top-of-book read latency while another thread keeps feeding and ticking the market"""
+    stop = threading.Event()
+
+    def feed():
+        flow = OrderFlow(seed)
+        n = 0
+        while not stop.is_set():
+            side, price, qty, ts, user = flow.order()
+            market.enqueue([Order(f"TOP-{n}", side, price, qty, ts, user)])
+            n += 1
+            if n % 20 == 0:
+                with market.lock:
+                    market.locked_tick(float(n))
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    latencies = []
+    for _ in range(reads):
+        start = time.perf_counter_ns()
+        market.top_of_book()
+        latencies.append(time.perf_counter_ns() - start)
+    stop.set()
+    feeder.join()
+    p50, p99 = percentiles(latencies)
+    return {'top_p50_us': p50, 'top_p99_us': p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--reads", type=int, default=50_000, help="top-of-book reads per market type")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for name, factory in (('in-process', Market), ('sharded', ShardedMarket)):
+        market = factory()
+        try:
+            fills, stats = run_flow(market, args.orders, args.seed)
+            results[name] = [(f.buy_order_id, f.sell_order_id, f.price, f.qty) for f in fills]
+            stats.update(run_top(market, args.reads, args.seed))
+        finally:
+            market.close()
+        print(f"{name:<11} {stats['orders_per_s']:>12,.0f} orders/s   "
+              f"tick p50 {stats['tick_p50_us']:.1f}us p99 {stats['tick_p99_us']:.1f}us   "
+              f"top p50 {stats['top_p50_us']:.2f}us p99 {stats['top_p99_us']:.2f}us   "
+              f"{len(fills)} fills")
+    print(f"same fills: {results['in-process'] == results['sharded']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# bench_matching.py
+"""
+Matching engine microbenchmarks on synthetic order flow.
+
+The flow is a random-walk mid price with orders placed around it (a share
+of them marketable), cancels of random resting orders, and bursty arrivals
+(orders per tick drawn from a heavy-tailed distribution). For each book
+depth it measures:
+  - legacy:  process_and_rank_orders over a book of crossing orders, then
+             match_transaction calls against it until it stops crossing
+  - book:    OrderBook.submit / cancel per flow event on a book already
+             holding `depth` resting orders (plus bytes per resting order)
+  - tick:    background_order_engine's full tick (matching, reservations,
+             settlement, on-chain recording) per burst of orders
+
+Latencies are per operation (per tick for "tick"). Results go to stdout and,
+with --output, to a JSON file for regression tracking.
+
+Run from core_function/:
+    python benchmarks/bench_matching.py --depths 100 1000 10000 100000 1000000
+    python benchmarks/bench_matching.py --benches book tick --output matching.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_book import Order, OrderBook, match_transaction, process_and_rank_orders
+
+START = datetime(2024, 1, 15, 12, 0, 0)
+
+
+class OrderFlow:
+    """Synthetic order events around a random-walk mid price"""
+
+    def __init__(self, seed: int = 7, mid: float = 0.25, volatility: float = 0.0005,
+                 spread: float = 0.01, marketable_ratio: float = 0.1, cancel_ratio: float = 0.2,
+                 burst_mean: float = 20.0, users: int = 200):
+        self.rng = random.Random(seed)
+        self.mid = mid
+        self.volatility = volatility
+        self.spread = spread
+        self.marketable_ratio = marketable_ratio
+        self.cancel_ratio = cancel_ratio
+        self.burst_mean = burst_mean
+        self.users = users
+        self.count = 0
+
+    def order(self, passive: bool = False, crossing: bool = False):
+        """
+        (side, price, qty, timestamp, user_id) for one new order; passive
+        orders never cross the mid, crossing orders always do
+        """
+        rng = self.rng
+        self.mid = max(0.05, self.mid + rng.gauss(0, self.volatility))
+        side = 'buy' if rng.random() < 0.5 else 'sell'
+        offset = abs(rng.gauss(0, self.spread)) + 0.001
+        if crossing or (not passive and rng.random() < self.marketable_ratio):
+            offset = -offset
+        price = round(self.mid - offset if side == 'buy' else self.mid + offset, 3)
+        self.count += 1
+        return (side, max(price, 0.001), rng.randint(1, 50),
+                START + timedelta(milliseconds=self.count), f"trader-{rng.randrange(self.users)}")
+
+    def burst(self) -> int:
+        """Orders arriving in one tick (Pareto tail: mostly small, occasionally huge)"""
+        return max(1, int(self.rng.paretovariate(1.5) * self.burst_mean / 3))
+
+    def is_cancel(self) -> bool:
+        return self.rng.random() < self.cancel_ratio
+
+
+def percentiles(samples_ns):
+    samples = sorted(samples_ns)
+    if not samples:
+        return None, None
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return p50 / 1000, p99 / 1000
+
+
+def result(bench: str, depth: int, ops: int, elapsed: float, latencies_ns, **extra):
+    p50, p99 = percentiles(latencies_ns)
+    return {'bench': bench, 'depth': depth, 'ops': ops,
+            'throughput_per_s': ops / elapsed if elapsed > 0 else None,
+            'p50_us': p50, 'p99_us': p99, **extra}
+
+
+def bench_legacy(depth: int, ops: int, seed: int):
+    flow = OrderFlow(seed)
+    incoming = []
+    for _ in range(depth):
+        side, price, qty, ts, user = flow.order(crossing=True)
+        incoming.append((ts.isoformat(), price, qty, side, user))
+
+    gc.collect()
+    t0 = time.perf_counter()
+    book = process_and_rank_orders(incoming)
+    rank_elapsed = time.perf_counter() - t0
+
+    latencies = []
+    t0 = time.perf_counter()
+    matched = 0
+    for _ in range(ops):
+        start = time.perf_counter_ns()
+        outcome = match_transaction(book, True)
+        latencies.append(time.perf_counter_ns() - start)
+        if outcome['transaction_price'] is None:
+            break
+        matched += 1
+    elapsed = time.perf_counter() - t0
+    return [
+        result('legacy_rank', depth, depth, rank_elapsed, []),
+        result('legacy_match', depth, len(latencies), elapsed, latencies, matched=matched)
+    ]
+
+
+def build_book(depth: int, flow: OrderFlow):
+    book = OrderBook()
+    fills = []
+    for i in range(depth):
+        side, price, qty, ts, user = flow.order(passive=True)
+        book.submit(Order(f"REST-{i}", side, price, qty, ts, user), fills)
+    return book
+
+
+def bench_book(depth: int, ops: int, seed: int):
+    flow = OrderFlow(seed)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    book = build_book(depth, flow)
+    bytes_per_order = (tracemalloc.get_traced_memory()[0] - base) / max(1, depth)
+    tracemalloc.stop()
+
+    resting = list(book.orders)
+    fills = []
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(ops):
+        if flow.is_cancel() and resting:
+            order_id = resting.pop(flow.rng.randrange(len(resting)))
+            start = time.perf_counter_ns()
+            book.cancel(order_id)
+        else:
+            side, price, qty, ts, user = flow.order()
+            order = Order(f"FLOW-{i}", side, price, qty, ts, user)
+            start = time.perf_counter_ns()
+            book.submit(order, fills)
+            resting.append(order.order_id)
+        latencies.append(time.perf_counter_ns() - start)
+    elapsed = time.perf_counter() - t0
+    return [result('book', depth, ops, elapsed, latencies, fills=len(fills),
+                   bytes_per_resting_order=round(bytes_per_order, 1))]
+
+
+def bench_tick(depth: int, ticks: int, seed: int):
+    # Heavy import: builds the blockchain and wallet manager singletons
+    import background_order_processor as engine
+    from wallet_manager import wallet_manager
+
+    flow = OrderFlow(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for u in range(flow.users):
+            user_id = f"trader-{u}"
+            wallet = wallet_manager.get_wallet(user_id) or wallet_manager.create_wallet(user_id, user_id)
+            wallet.add_energy(1e9, "benchmark")
+            wallet.add_fiat(1e9, "benchmark")
+        with engine.state_lock:
+            for order in list(engine.order_book.orders):
+                engine.order_book.cancel(order)
+        # Resting depth goes straight into the book, reserved like real orders
+        with engine.state_lock:
+            for _ in range(depth):
+                side, price, qty, ts, user = flow.order(passive=True)
+                engine.order_book.add(engine._new_order(ts, price, qty, side, user))
+
+    latencies = []
+    orders = 0
+    elapsed = 0.0
+    for _ in range(ticks):
+        burst = []
+        for _ in range(flow.burst()):
+            side, price, qty, ts, user = flow.order()
+            burst.append({'side': side, 'price': price, 'quantity': qty,
+                          'timestamp': ts, 'user_id': user})
+        engine.submit_orders(burst)
+        orders += len(burst)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter_ns()
+            engine.engine_tick()
+            latency = time.perf_counter_ns() - start
+        latencies.append(latency)
+        elapsed += latency / 1e9
+    return [result('tick', depth, ticks, elapsed, latencies, orders=orders,
+                   orders_per_s=orders / elapsed if elapsed > 0 else None)]
+
+
+BENCHES = {'legacy': bench_legacy, 'book': bench_book, 'tick': bench_tick}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depths", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--benches", nargs="+", choices=sorted(BENCHES), default=sorted(BENCHES))
+    parser.add_argument("--ops", type=int, default=20_000, help="flow events per legacy/book run")
+    parser.add_argument("--ticks", type=int, default=50, help="engine ticks per tick run")
+    parser.add_argument("--tick-max-depth", type=int, default=100_000,
+                        help="skip tick runs deeper than this (resting orders are reserved one by one)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'bench':<14}{'depth':>10}{'ops':>8}{'ops/s':>14}{'p50 us':>10}{'p99 us':>10}")
+    for depth in args.depths:
+        for name in args.benches:
+            if name == 'tick' and depth > args.tick_max_depth:
+                continue
+            count = args.ticks if name == 'tick' else args.ops
+            for row in BENCHES[name](depth, count, args.seed):
+                results.append(row)
+                fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+                print(f"{row['bench']:<14}{row['depth']:>10}{row['ops']:>8}"
+                      f"{fmt(row['throughput_per_s'], ',.0f'):>14}"
+                      f"{fmt(row['p50_us'], '.1f'):>10}{fmt(row['p99_us'], '.1f'):>10}")
+
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': vars(args)
+            },
+            'results': results
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_order_replay.py
+"""
+Order journal replay: feeds a journal through the matching engine at full
+speed and reports orders/s. Without --journal a synthetic journal is written
+first (random-walk prices, a share of cancels and amendments, several orders
+per tick). The journal is replayed twice to check the result is
+deterministic (same fills, same resting book).
+
+Run from core_function/:
+    python benchmarks/bench_order_replay.py --orders 200000
+    python benchmarks/bench_order_replay.py --journal /var/qorca/orders.journal
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_book import Order
+from order_journal import OrderJournal, replay
+
+
+def write_synthetic(path: str, orders: int, per_tick: int, cancel_ratio: float, seed: int):
+    rng = random.Random(seed)
+    journal = OrderJournal(path)
+    journal.append("start", market_mode="continuous")
+    start = datetime(2024, 1, 15, 12, 0, 0)
+    mid = 0.25
+    live = []
+    for i in range(orders):
+        mid = max(0.05, mid + rng.gauss(0, 0.0005))
+        side = rng.choice(("buy", "sell"))
+        # Mostly passive orders around the mid, a few marketable ones
+        offset = abs(rng.gauss(0, 0.01)) * (1 if rng.random() < 0.9 else -1)
+        price = round(mid - offset if side == "buy" else mid + offset, 3)
+        order = Order(f"ORD-{i}", side, max(price, 0.001), rng.randint(1, 50),
+                      start + timedelta(milliseconds=i), f"user-{rng.randrange(500)}")
+        journal.log_order(order)
+        live.append(order.order_id)
+        if rng.random() < cancel_ratio and live:
+            journal.append("cancel", order_id=live.pop(rng.randrange(len(live))))
+        elif rng.random() < 0.05 and live:
+            journal.append("amend", order_id=rng.choice(live), price=None, qty=rng.randint(1, 20))
+        if (i + 1) % per_tick == 0:
+            journal.append("tick", now=start.timestamp() + i / 1000)
+    journal.append("tick", now=start.timestamp() + orders / 1000)
+    journal.close()
+
+
+def fingerprint(result):
+    fills = [(f.buy_order_id, f.sell_order_id, f.price, f.qty) for f in result.fills]
+    book = [(o.order_id, o.qty) for side in (result.book.bids, result.book.asks) for o in side]
+    return fills, book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journal", help="replay this journal instead of a synthetic one")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--per-tick", type=int, default=100, help="synthetic orders per engine tick")
+    parser.add_argument("--cancel-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.journal
+        if path is None:
+            path = os.path.join(directory, "orders.journal")
+            write_synthetic(path, args.orders, args.per_tick, args.cancel_ratio, args.seed)
+        first = replay(path)
+        second = replay(path)
+
+    stats = first.to_dict()
+    print(f"{stats['records']} records, {stats['orders']} orders, {stats['fills']} fills")
+    print(f"resting: {stats['resting_bids']} bids / {stats['resting_asks']} asks")
+    print(f"replay: {stats['elapsed_s']:.3f}s, {stats['orders_per_s']:,.0f} orders/s")
+    print(f"deterministic: {fingerprint(first) == fingerprint(second)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_smart_home_sync.py
+"""
+Smart-home ingestion benchmark: per-reading sync_huawei_energy_data calls
+versus one sync_huawei_energy_batch call over the same readings.
+
+Run from core_function/:
+    python benchmarks/bench_smart_home_sync.py --households 5000 --readings 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+
+def build_manager(households: int) -> WalletManager:
+    manager = WalletManager(HistoryArchive(":memory:"))
+    for i in range(households):
+        wallet = manager.create_wallet(f"home-{i}", f"hw-{i}")
+        wallet.connect_huawei_smart_home(f"hw-{i}")
+    return manager
+
+
+def make_readings(households: int, per_household: int, seed: int):
+    rng = random.Random(seed)
+    start = time.time()
+    readings = []
+    for step in range(per_household):
+        for i in range(households):
+            readings.append((f"home-{i}", rng.uniform(0, 5), rng.uniform(0, 3), start + step * 900))
+    return readings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--households", type=int, default=5000)
+    parser.add_argument("--readings", type=int, default=4, help="readings per household")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    readings = make_readings(args.households, args.readings, args.seed)
+    print(f"{len(readings)} readings for {args.households} households")
+
+    manager = build_manager(args.households)
+    t0 = time.perf_counter()
+    for user_id, produced, consumed, _ in readings:
+        manager.sync_huawei_energy_data(user_id, produced, consumed)
+    single = time.perf_counter() - t0
+
+    manager = build_manager(args.households)
+    t0 = time.perf_counter()
+    results = manager.sync_huawei_energy_batch(readings)
+    batch = time.perf_counter() - t0
+
+    columns = {
+        'user_id': [r[0] for r in readings],
+        'produced_kwh': [r[1] for r in readings],
+        'consumed_kwh': [r[2] for r in readings],
+        'timestamp': [r[3] for r in readings],
+    }
+    manager = build_manager(args.households)
+    t0 = time.perf_counter()
+    manager.sync_huawei_energy_batch(columns)
+    columnar = time.perf_counter() - t0
+
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    print(f"per-reading : {single:8.3f}s  {len(readings) / single:12,.0f} readings/s")
+    print(f"batch rows  : {batch:8.3f}s  {len(readings) / batch:12,.0f} readings/s")
+    print(f"batch cols  : {columnar:8.3f}s  {len(readings) / columnar:12,.0f} readings/s")
+    print(f"applied {ok}/{len(results)}")
+
+
+if __name__ == "__main__":
+    main()
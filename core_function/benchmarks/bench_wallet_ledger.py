@@ -0,0 +1,70 @@
+# bench_wallet_ledger.py
+"""
+Wallet ledger benchmark: P2P trades/s with the write-ahead log fsynced per
+operation versus group-committed per batch (plus no fsync and no ledger for
+reference). Trades run on several threads, as concurrent API requests would.
+
+Run from core_function/:
+    python benchmarks/bench_wallet_ledger.py --threads 8 --trades 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wallet_history import HistoryArchive
+from wallet_ledger import WalletLedger
+from wallet_manager import WalletManager
+
+
+def run(sync, households: int, threads: int, trades_per_thread: int):
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = WalletLedger(directory, sync=sync) if sync else None
+        manager = WalletManager(HistoryArchive(":memory:"), ledger=ledger, snapshot_interval=10 ** 9)
+        wallets = manager.create_wallets([(f"home-{i}", f"hw-{i}") for i in range(households)])
+        for wallet in wallets:
+            wallet.connect_huawei_smart_home(wallet.huawei_id)
+        manager.sync_huawei_energy_batch([(w.user_id, 1000.0, 0.0, None) for w in wallets])
+
+        def trader(offset: int):
+            for i in range(trades_per_thread):
+                seller = (offset * 7 + i) % households
+                buyer = (seller + 1 + i % (households - 1)) % households
+                manager.execute_p2p_energy_trade(f"home-{seller}", f"home-{buyer}", 0.5, 0.1)
+
+        workers = [threading.Thread(target=trader, args=(t,)) for t in range(threads)]
+        t0 = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - t0
+        batches = ledger.batches if ledger is not None and sync == "batch" else None
+        if ledger is not None:
+            ledger.close()
+        return threads * trades_per_thread / elapsed, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--households", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=500, help="trades per thread")
+    args = parser.parse_args()
+
+    total = args.threads * args.trades
+    print(f"{total} trades on {args.threads} threads, {args.households} wallets")
+    for label, sync in (("no ledger", None), ("fsync per op", "op"),
+                        ("fsync per batch", "batch"), ("no fsync", "none")):
+        rate, batches = run(sync, args.households, args.threads, args.trades)
+        extra = f"  ({total / batches:.1f} records per fsync)" if batches else ""
+        print(f"{label:16s} {rate:10,.0f} trades/s{extra}")
+
+
+if __name__ == "__main__":
+    main()
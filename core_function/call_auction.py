@@ -0,0 +1,221 @@
+# call_auction.py
+"""
+Call-auction (uniform price) clearing for delivery-interval markets.
+
+Orders are collected per 15-minute delivery interval (the interval their
+timestamp falls in) and cleared together when the interval's gate closes:
+  1. aggregate demand D(p) (buy qty priced >= p) and supply S(p) (sell qty
+     priced <= p) at every submitted price, via NumPy cumulative sums
+  2. the clearing price maximises executed volume min(D, S); ties go to the
+     smallest imbalance |D - S|, then to the midpoint of the tied prices
+  3. every order strictly inside the price is filled in full; the long side
+     is rationed pro-rata at its marginal price level
+  4. allocations are paired buyer-to-seller by overlaying the two cumulative
+     allocation ranges, giving order_book.Fill records at the uniform price
+
+GTD orders leave the auction when their expires_at passes (expire()); one
+still present when its interval clears is not matched and closes 'expired'.
+"""
+
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from order_book import Fill, Order, record_transaction
+
+INTERVAL_SECONDS = 900  # 15-minute delivery intervals
+
+
+def delivery_interval(when: Union[datetime, float], interval_seconds: int = INTERVAL_SECONDS) -> int:
+    """Start (epoch seconds) of the delivery interval containing `when`"""
+    ts = when.timestamp() if isinstance(when, datetime) else when
+    return int(ts // interval_seconds) * interval_seconds
+
+
+def clearing_price(buy_prices: np.ndarray, buy_qty: np.ndarray,
+                   sell_prices: np.ndarray, sell_qty: np.ndarray) -> Tuple[Optional[float], float]:
+    """Uniform clearing price and executed volume (None, 0.0 when the curves do not cross)"""
+    if len(buy_prices) == 0 or len(sell_prices) == 0:
+        return None, 0.0
+    candidates = np.unique(np.concatenate([buy_prices, sell_prices]))
+
+    # Demand at p: buys priced >= p (sorted ascending, cumulated from the top)
+    buy_order = np.argsort(buy_prices, kind="stable")
+    sorted_buy_prices = buy_prices[buy_order]
+    buy_cum = np.concatenate([[0.0], np.cumsum(buy_qty[buy_order])])
+    demand = buy_cum[-1] - buy_cum[np.searchsorted(sorted_buy_prices, candidates, side="left")]
+
+    # Supply at p: sells priced <= p
+    sell_order = np.argsort(sell_prices, kind="stable")
+    sorted_sell_prices = sell_prices[sell_order]
+    sell_cum = np.concatenate([[0.0], np.cumsum(sell_qty[sell_order])])
+    supply = sell_cum[np.searchsorted(sorted_sell_prices, candidates, side="right")]
+
+    volume = np.minimum(demand, supply)
+    best_volume = volume.max()
+    if best_volume <= 0:
+        return None, 0.0
+    best = volume == best_volume
+    imbalance = np.abs(demand - supply)
+    best &= imbalance == imbalance[best].min()
+    tied = candidates[best]
+    return float((tied.min() + tied.max()) / 2), float(best_volume)
+
+
+def _ration(prices: np.ndarray, qty: np.ndarray, volume: float, descending: bool) -> np.ndarray:
+    """
+    Allocate `volume` across eligible orders in price priority: better price
+    levels in full, the marginal level pro-rata to order size.
+    """
+    keys = -prices if descending else prices
+    order = np.argsort(keys, kind="stable")
+    level_keys, level_starts = np.unique(keys[order], return_index=True)
+    level_totals = np.add.reduceat(qty[order], level_starts)
+    level_cum = np.cumsum(level_totals)
+    before = level_cum - level_totals
+    # Fraction of each level that executes: 1 inside, pro-rata at the margin, 0 beyond
+    # (ineligible orders arrive with qty 0, so a level can total 0)
+    fraction = np.zeros_like(level_totals)
+    np.divide(volume - before, level_totals, out=fraction, where=level_totals > 0)
+    fraction = np.clip(fraction, 0.0, 1.0)
+    level_of = np.repeat(np.arange(len(level_totals)), np.diff(np.append(level_starts, len(order))))
+    allocation = np.empty_like(qty)
+    allocation[order] = qty[order] * fraction[level_of]
+    return allocation
+
+
+def _pair(buy_alloc: np.ndarray, sell_alloc: np.ndarray) -> List[Tuple[int, int, float]]:
+    """Pair allocations by overlaying cumulative ranges: (buy index, sell index, qty) segments"""
+    buy_idx = np.flatnonzero(buy_alloc > 0)
+    sell_idx = np.flatnonzero(sell_alloc > 0)
+    buy_edges = np.cumsum(buy_alloc[buy_idx])
+    sell_edges = np.cumsum(sell_alloc[sell_idx])
+    edges = np.unique(np.concatenate([[0.0], buy_edges, sell_edges]))
+    starts, ends = edges[:-1], edges[1:]
+    mids = (starts + ends) / 2
+    keep = ends - starts > 1e-9
+    b = np.minimum(np.searchsorted(buy_edges, mids[keep], side="right"), len(buy_idx) - 1)
+    s = np.minimum(np.searchsorted(sell_edges, mids[keep], side="right"), len(sell_idx) - 1)
+    return list(zip(buy_idx[b].tolist(), sell_idx[s].tolist(), (ends - starts)[keep].tolist()))
+
+
+class AuctionResult:
+    """Outcome of clearing one delivery interval"""
+
+    def __init__(self, interval: int, price: Optional[float], volume: float,
+                 fills: List[Fill], orders: List[Order]):
+        self.interval = interval
+        self.price = price
+        self.volume = volume
+        self.fills = fills
+        self.orders = orders  # every order of the interval; qty is what was left unfilled
+
+    def to_dict(self) -> Dict:
+        return {
+            'interval_start': datetime.fromtimestamp(self.interval).isoformat(),
+            'clearing_price': self.price,
+            'volume': self.volume,
+            'fills': len(self.fills),
+            'orders': len(self.orders),
+            'unfilled_orders': sum(1 for o in self.orders if o.qty > 0)
+        }
+
+
+class CallAuction:
+    """
+    Order collection per delivery interval plus uniform-price clearing.
+    Not thread-safe on its own; the engine guards it with state_lock.
+    """
+
+    def __init__(self, interval_seconds: int = INTERVAL_SECONDS, gate_closure_seconds: float = 0.0):
+        self.interval_seconds = interval_seconds
+        # An interval clears gate_closure_seconds before its end
+        self.gate_closure_seconds = gate_closure_seconds
+        self.books: Dict[int, Dict[str, Order]] = {}
+        self.orders: Dict[str, int] = {}  # order_id -> interval
+        self._expiry_heap: List[Tuple[float, str]] = []  # (expires_at, order_id), lazily pruned
+        self.last_result: Optional[AuctionResult] = None
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def add(self, order: Order, interval: Optional[int] = None) -> int:
+        if interval is None:
+            interval = delivery_interval(order.timestamp, self.interval_seconds)
+        order.status = 'open'
+        self.books.setdefault(interval, {})[order.order_id] = order
+        self.orders[order.order_id] = interval
+        if order.expires_at is not None:
+            heapq.heappush(self._expiry_heap, (order.expires_at, order.order_id))
+        return interval
+
+    def get(self, order_id: str) -> Optional[Order]:
+        interval = self.orders.get(order_id)
+        return self.books[interval][order_id] if interval is not None else None
+
+    def remove(self, order_id: str) -> Optional[Order]:
+        interval = self.orders.pop(order_id, None)
+        if interval is None:
+            return None
+        return self.books[interval].pop(order_id)
+
+    def expire(self, now: float) -> List[Order]:
+        """Remove every order whose expires_at has passed; they come back with status 'expired'"""
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, order_id = heapq.heappop(heap)
+            order = self.get(order_id)
+            # Cleared, cancelled or amended orders leave stale heap entries
+            if order is not None and order.expires_at is not None and order.expires_at <= now:
+                self.remove(order_id)
+                order.status = 'expired'
+                expired.append(order)
+        return expired
+
+    def due(self, now: float) -> List[int]:
+        """Intervals whose gate has closed, oldest first"""
+        return sorted(i for i in self.books
+                      if i + self.interval_seconds - self.gate_closure_seconds <= now)
+
+    def clear(self, interval: int, timestamp: float) -> AuctionResult:
+        """Clear one interval in a single vectorised pass and close all its orders"""
+        book = self.books.pop(interval, {})
+        for order_id in book:
+            self.orders.pop(order_id, None)
+        live = []
+        for order in book.values():
+            if order.expires_at is not None and order.expires_at <= timestamp:
+                order.status = 'expired'
+            else:
+                live.append(order)
+        buys = [o for o in live if o.side == 'buy']
+        sells = [o for o in live if o.side == 'sell']
+
+        buy_prices = np.array([o.price for o in buys], dtype=float)
+        buy_qty = np.array([o.qty for o in buys], dtype=float)
+        sell_prices = np.array([o.price for o in sells], dtype=float)
+        sell_qty = np.array([o.qty for o in sells], dtype=float)
+
+        price, volume = clearing_price(buy_prices, buy_qty, sell_prices, sell_qty)
+        fills: List[Fill] = []
+        if price is not None:
+            buy_eligible = np.where(buy_prices >= price, buy_qty, 0.0)
+            sell_eligible = np.where(sell_prices <= price, sell_qty, 0.0)
+            buy_alloc = _ration(buy_prices, buy_eligible, volume, descending=True)
+            sell_alloc = _ration(sell_prices, sell_eligible, volume, descending=False)
+            for b, s, qty in _pair(buy_alloc, sell_alloc):
+                fill = Fill(buys[b], sells[s], price, qty, price, True, timestamp)
+                fill.aggressor = 'auction'
+                fills.append(fill)
+            for orders, alloc in ((buys, buy_alloc), (sells, sell_alloc)):
+                for order, filled in zip(orders, alloc.tolist()):
+                    order.qty -= filled
+            record_transaction(price, volume)
+        for order in book.values():
+            if order.qty <= 1e-9:
+                order.qty = 0
+        self.last_result = AuctionResult(interval, price, volume, fills, list(book.values()))
+        return self.last_result
@@ -0,0 +1,334 @@
+# chain_network.py
+"""
+Local peer replication for the Q-ORCA blockchain.
+
+Each PeerNode serves its chain over TCP (length-prefixed JSON, one request per
+connection) and replicates from its peers:
+  - block announcement: new tips are announced as headers only
+  - header-first sync: headers are fetched from the last common block and
+    checked for linkage before any block body is downloaded
+  - batch download: bodies are pulled in batches of BLOCK_BATCH
+  - fork resolution: the longest valid chain wins (Blockchain.replace_chain)
+
+Announcements are unauthenticated, so their origin only becomes a peer once
+it has served us a valid block or chain.
+"""
+
+import json
+import logging
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from block_chain_templates import Block, Blockchain
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_HEADERS = 500
+BLOCK_BATCH = 64
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# Cap on peers learned from announcements (configured peers are not counted)
+MAX_LEARNED_PEERS = 64
+
+
+def _send_message(sock: socket.socket, message: Dict[str, Any]):
+    data = json.dumps(message).encode()
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("Peer closed connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = struct.unpack(">I", _recv_exact(sock, 4))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message too large: {size} bytes")
+    return json.loads(_recv_exact(sock, size).decode())
+
+
+def _field(message: Any, key: str, kind) -> Any:
+    # Peer replies are untrusted JSON: check shape before use, reject otherwise
+    value = message.get(key) if isinstance(message, dict) else None
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ValueError(f"Malformed peer message: bad {key!r}")
+    return value
+
+
+def _check_header(header: Any) -> Dict[str, Any]:
+    _field(header, "index", int)
+    _field(header, "hash", str)
+    _field(header, "previous_hash", str)
+    return header
+
+
+def _blocks_from(reply: Any) -> List[Block]:
+    blocks = _field(reply, "blocks", list)
+    if not all(isinstance(data, dict) for data in blocks):
+        raise ValueError("Malformed peer message: bad 'blocks'")
+    return [Block.from_dict(data) for data in blocks]
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class _PeerRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            message = _recv_message(self.request)
+            reply = self.server.node.handle_message(message)
+            _send_message(self.request, reply)
+        except Exception as e:
+            LOGGER.debug(f"Peer request failed: {e!r}")
+
+
+class _PeerServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PeerNode:
+    """Replicates a Blockchain with other processes on the same machine."""
+
+    def __init__(self, blockchain: Blockchain, host: str = "127.0.0.1", port: int = 0,
+                 timeout: float = 5.0):
+        self.blockchain = blockchain
+        self.timeout = timeout
+        self.peers: Set[str] = set()
+        self._learned_peers: Set[str] = set()
+        self._server = _PeerServer((host, port), _PeerRequestHandler)
+        self._server.node = self
+        self._tasks: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._running = True
+        self.blockchain.events.subscribe("block", self._on_block_event)
+        for target in (self._server.serve_forever, self._worker_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        LOGGER.info(f"Peer node listening on {self.address}")
+
+    def stop(self):
+        self._running = False
+        self.blockchain.events.unsubscribe("block", self._on_block_event)
+        self._tasks.put(("stop", None))
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_peer(self, address: str):
+        if address == self.address:
+            return
+        self.peers.add(address)
+        self.blockchain.add_node(address)
+
+    def _learn_peer(self, address: str):
+        # An announcer that just served us valid blocks; bounded, unlike add_peer
+        if address in self.peers or address == self.address:
+            return
+        if len(self._learned_peers) >= MAX_LEARNED_PEERS:
+            LOGGER.debug(f"Not adding {address}: {MAX_LEARNED_PEERS} learned peers already")
+            return
+        self._learned_peers.add(address)
+        self.add_peer(address)
+
+    # ------------------------------------------------------------------
+    # Client side
+    # ------------------------------------------------------------------
+    def request(self, peer: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        with socket.create_connection(parse_address(peer), timeout=self.timeout) as sock:
+            _send_message(sock, message)
+            return _recv_message(sock)
+
+    def announce_block(self, block: Block):
+        # Queue for the peer worker so slow peers never hold up the event bus
+        self._tasks.put(("announce", block.header()))
+
+    def _on_block_event(self, topic: str, block: Block):
+        self.announce_block(block)
+
+    def sync(self) -> bool:
+        """Sync against every known peer; returns True if our chain changed."""
+        changed = False
+        for peer in list(self.peers):
+            try:
+                changed = self.sync_with(peer) or changed
+            except Exception as e:
+                LOGGER.warning(f"Sync with {peer} failed: {e}")
+        return changed
+
+    def sync_with(self, peer: str) -> bool:
+        status = self.request(peer, {"type": "status"})
+        if _field(status, "height", int) <= self.blockchain.height:
+            return False
+
+        # 1. Header-first: find the fork point and collect the peer's headers
+        reply = self.request(peer, {
+            "type": "get_headers",
+            "locator": self.blockchain.block_locator(),
+            "limit": MAX_HEADERS
+        })
+        fork_height = _field(reply, "fork_height", int)
+        if fork_height < 0:
+            raise ValueError(f"Peer {peer} does not share our genesis block")
+        headers = [_check_header(header) for header in _field(reply, "headers", list)]
+        while headers and len(headers) % MAX_HEADERS == 0 and fork_height + len(headers) + 1 < status["height"]:
+            more = [_check_header(header) for header in _field(self.request(peer, {
+                "type": "get_headers",
+                "locator": [headers[-1]["hash"]],
+                "limit": MAX_HEADERS
+            }), "headers", list)]
+            if not more:
+                break
+            headers.extend(more)
+
+        if fork_height + 1 + len(headers) <= self.blockchain.height:
+            return False
+        # Our chain may be pruned, so slice by position relative to chain[0]
+        local = self.blockchain.chain
+        fork_position = fork_height - local[0].index
+        if fork_position < 0:
+            raise ValueError(f"Fork with {peer} is below our pruned checkpoint")
+        previous_hash = local[fork_position].hash
+        for header in headers:
+            if header["previous_hash"] != previous_hash or Block.header_hash(header) != header["hash"]:
+                raise ValueError(f"Peer {peer} sent a broken header chain at {header['index']}")
+            previous_hash = header["hash"]
+
+        # 2. Batch body download, checked against the verified headers
+        blocks: List[Block] = []
+        for start in range(0, len(headers), BLOCK_BATCH):
+            batch = headers[start:start + BLOCK_BATCH]
+            reply = self.request(peer, {
+                "type": "get_blocks",
+                "start": batch[0]["index"],
+                "count": len(batch)
+            })
+            received = _blocks_from(reply)
+            if [b.hash for b in received] != [h["hash"] for h in batch]:
+                raise ValueError(f"Peer {peer} sent blocks that do not match its headers")
+            blocks.extend(received)
+
+        # 3. Fork resolution: replace_chain re-validates and keeps the longest valid chain
+        candidate = local[:fork_position + 1] + blocks
+        adopted = self.blockchain.replace_chain(candidate)
+        if adopted:
+            LOGGER.info(f"Adopted chain from {peer}: height {self.blockchain.height} (fork at {fork_height})")
+        return adopted
+
+    def _worker_loop(self):
+        while self._running:
+            kind, payload = self._tasks.get()
+            try:
+                if kind == "announce":
+                    for peer in list(self.peers):
+                        self._announce_to(peer, payload)
+                elif kind == "fetch":
+                    self._fetch_announced(*payload)
+                elif kind == "sync":
+                    if self.sync_with(payload):
+                        self._learn_peer(payload)
+            except Exception as e:
+                # Whatever a peer sends, the worker keeps serving the queue
+                LOGGER.warning(f"Peer task {kind} failed: {e!r}")
+
+    def _announce_to(self, peer: str, header: Dict[str, Any]):
+        try:
+            self.request(peer, {"type": "announce", "header": header, "origin": self.address})
+        except OSError as e:
+            LOGGER.debug(f"Announce to {peer} failed: {e}")
+
+    def _fetch_announced(self, origin: str, header: Dict[str, Any]):
+        reply = self.request(origin, {"type": "get_blocks", "start": header["index"], "count": 1})
+        blocks = _blocks_from(reply)
+        if not blocks:
+            return
+        block = blocks[0]
+        if block.hash == header["hash"] and self.blockchain.receive_block(block):
+            self._learn_peer(origin)
+        elif self.sync_with(origin):
+            # Could not attach directly (race or fork): fell back to a full sync
+            self._learn_peer(origin)
+
+    # ------------------------------------------------------------------
+    # Server side
+    # ------------------------------------------------------------------
+    def handle_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(message, dict):
+            return {"error": "malformed message"}
+        kind = message.get("type")
+        if kind == "status":
+            return self._status()
+        if kind == "get_headers":
+            return self._get_headers(message.get("locator", []), int(message.get("limit", MAX_HEADERS)))
+        if kind == "get_blocks":
+            return self._get_blocks(int(message["start"]), int(message.get("count", BLOCK_BATCH)))
+        if kind == "announce":
+            return self._on_announce(message.get("header"), message.get("origin"))
+        return {"error": f"unknown message type: {kind}"}
+
+    def _status(self) -> Dict[str, Any]:
+        with self.blockchain.lock:
+            return {
+                "height": self.blockchain.height,
+                "tip": self.blockchain.chain[-1].hash,
+                "consensus": self.blockchain.consensus.name
+            }
+
+    def _get_headers(self, locator: List[str], limit: int) -> Dict[str, Any]:
+        fork_height = -1
+        for block_hash in locator:
+            block = self.blockchain.get_block(block_hash)
+            if block is not None:
+                fork_height = block.index
+                break
+        if fork_height < 0:
+            return {"fork_height": -1, "headers": []}
+        limit = max(1, min(limit, MAX_HEADERS))
+        headers = [b.header() for b in self.blockchain.blocks_from(fork_height + 1, limit)]
+        return {"fork_height": fork_height, "headers": headers}
+
+    def _get_blocks(self, start: int, count: int) -> Dict[str, Any]:
+        count = max(1, min(count, BLOCK_BATCH))
+        if start < self.blockchain.chain[0].index:
+            # Pruned into the checkpoint archive; peers must start from a checkpoint
+            return {"blocks": []}
+        return {"blocks": [b.to_dict() for b in self.blockchain.blocks_from(start, count)]}
+
+    def _on_announce(self, header: Dict[str, Any], origin: Optional[str]) -> Dict[str, Any]:
+        try:
+            _check_header(header)
+        except ValueError as e:
+            return {"error": str(e)}
+        if not isinstance(origin, str) or origin == self.address:
+            return {"status": "known"}
+        # Tip read under the lock so it cannot interleave with replace_chain
+        with self.blockchain.lock:
+            if self.blockchain.get_block(header["hash"]) is not None:
+                return {"status": "known"}
+            height = self.blockchain.height
+            extends_tip = header["index"] == height and header["previous_hash"] == self.blockchain.chain[-1].hash
+        if extends_tip:
+            self._tasks.put(("fetch", (origin, header)))
+        elif header["index"] >= height:
+            self._tasks.put(("sync", origin))
+        return {"status": "ok"}
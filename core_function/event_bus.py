@@ -0,0 +1,101 @@
+# event_bus.py
+"""
+In-process publish/subscribe bus.
+
+publish() only enqueues, so it is safe to call while holding Blockchain.lock;
+handlers run on a single daemon worker thread in publish order. Subscribe to
+"*" to receive every topic.
+
+Topics used by the blockchain: "block", "transaction", "channel". The
+blockchain buses are unbounded: checkpointing and gossip are driven by
+"block" events, so losing one would lose a checkpoint or an announcement.
+"""
+
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+Handler = Callable[[str, Any], None]
+
+_STOP = object()
+
+
+class EventBus:
+    """
+    Asynchronous topic-based event dispatcher.
+
+    Unbounded by default, so no event is ever dropped. With max_pending > 0
+    the queue is bounded and publish() drops (and counts) events once it is
+    full rather than block the publisher.
+    """
+
+    def __init__(self, name: str = "event-bus", max_pending: int = 0):
+        self.name = name
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._handlers_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def subscribe(self, topic: str, handler: Handler) -> Handler:
+        with self._handlers_lock:
+            self._handlers[topic].append(handler)
+        return handler
+
+    def unsubscribe(self, topic: str, handler: Handler):
+        with self._handlers_lock:
+            if handler in self._handlers.get(topic, []):
+                self._handlers[topic].remove(handler)
+
+    def publish(self, topic: str, payload: Any = None):
+        """Queue an event; never blocks the caller (drops only on a bounded, full bus)."""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((topic, payload))
+        except queue.Full:
+            # Slow subscribers must not stall block production
+            self.dropped += 1
+            LOGGER.warning(f"{self.name}: queue full, dropped {topic} event")
+
+    def flush(self):
+        """Block until every queued event has been dispatched."""
+        if self._worker is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
+            self._worker = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._handlers_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                topic, payload = item
+                with self._handlers_lock:
+                    handlers = self._handlers.get(topic, []) + self._handlers.get("*", [])
+                for handler in handlers:
+                    try:
+                        handler(topic, payload)
+                    except Exception as e:
+                        LOGGER.error(f"{self.name}: handler for {topic} failed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,109 @@
+# ledger_checkpoint.py
+"""
+On-disk ledger checkpoints for the Q-ORCA blockchain.
+
+A checkpoint captures the ledger state at one block (balances, public keys
+of known identities, quantum channels, height/hash) so a node can restart
+from it and replay only the blocks that follow. Every block added to the
+chain is appended to the block log; saving a checkpoint drops the entries it
+covers. Blocks older than a checkpoint can be moved to the archive directory
+to keep the in-memory chain short.
+
+Layout:
+    <directory>/checkpoint_<height>.json
+    <directory>/blocks.jsonl
+    <directory>/archive/blocks_<first>_<last>.pkl
+"""
+
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from block_chain_templates import Block
+
+
+class CheckpointStore:
+    """Directory of JSON checkpoints plus an archive of pruned blocks."""
+
+    def __init__(self, directory, keep: int = 3):
+        self.directory = Path(directory)
+        self.archive_dir = self.directory / "archive"
+        self.block_log = self.directory / "blocks.jsonl"
+        self.keep = keep
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+
+    def _checkpoint_files(self) -> List[Path]:
+        return sorted(self.directory.glob("checkpoint_*.json"))
+
+    def save(self, checkpoint: Dict[str, Any]) -> Path:
+        """Write a checkpoint atomically and drop the oldest beyond `keep`."""
+        path = self.directory / f"checkpoint_{checkpoint['height']:010d}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        files = self._checkpoint_files()
+        for old in files[:-self.keep] if self.keep > 0 else []:
+            old.unlink()
+        self._compact_log(checkpoint["block"]["index"])
+        return path
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Return the most recent checkpoint, or None if there is none."""
+        files = self._checkpoint_files()
+        if not files:
+            return None
+        with open(files[-1]) as f:
+            return json.load(f)
+
+    def append_blocks(self, blocks: List[Block]):
+        """Durably log blocks as they join the chain (one JSON object per line)."""
+        with open(self.block_log, "a") as f:
+            for block in blocks:
+                f.write(json.dumps(block.to_dict()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def logged_blocks(self) -> List[Block]:
+        """Blocks logged since the last checkpoint, in write order."""
+        if not self.block_log.exists():
+            return []
+        blocks = []
+        with open(self.block_log) as f:
+            for line in f:
+                try:
+                    blocks.append(Block.from_dict(json.loads(line)))
+                except ValueError:
+                    break  # torn last line from a crash mid-append
+        return blocks
+
+    def _compact_log(self, checkpoint_index: int):
+        # Keep only blocks the latest checkpoint does not cover
+        kept = [b for b in self.logged_blocks() if b.index > checkpoint_index]
+        tmp_path = self.block_log.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            for block in kept:
+                f.write(json.dumps(block.to_dict()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.block_log)
+
+    def archive_blocks(self, blocks: List[Block]) -> Optional[Path]:
+        """Move blocks off the hot path; same pickle format as save_chain."""
+        if not blocks:
+            return None
+        path = self.archive_dir / f"blocks_{blocks[0].index:010d}_{blocks[-1].index:010d}.pkl"
+        with open(path, "wb") as f:
+            pickle.dump(blocks, f)
+        return path
+
+    def archived_blocks(self) -> Iterator[Block]:
+        """Iterate archived blocks in height order (for audits or full replays)."""
+        for path in sorted(self.archive_dir.glob("blocks_*.pkl")):
+            with open(path, "rb") as f:
+                yield from pickle.load(f)
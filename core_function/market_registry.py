@@ -0,0 +1,372 @@
+# market_registry.py
+"""
+Independent markets for the order engine, keyed by grid zone and delivery
+interval.
+
+Each Market owns its book, call auction, incoming queue and lock, so markets
+never contend with each other: the engine ticks them separately on a worker
+pool and a burst on one market does not hold up matching on another. The
+default market (zone "default", no delivery interval) is the continuous spot
+market that existed before markets were split.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from call_auction import INTERVAL_SECONDS, AuctionResult, CallAuction, delivery_interval
+from order_book import Fill, Order, OrderBook
+
+DEFAULT_ZONE = "default"
+# Zones and delivery times come from clients; these bound how many markets they can open
+ZONE_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,32}")
+DELIVERY_HORIZON = 2 * 24 * 3600   # seconds ahead a delivery interval may be traded
+MAX_MARKETS = 1024
+IDLE_SECONDS = 3600                # an empty zone market without delivery interval is dropped after this
+
+
+def market_name(zone: str, delivery_start: Optional[int]) -> str:
+    if delivery_start is None:
+        return zone
+    return f"{zone}@{datetime.fromtimestamp(delivery_start).isoformat()}"
+
+
+class MarketTick:
+    """What one locked pass over a market did"""
+
+    def __init__(self):
+        self.fills: List[Fill] = []
+        self.closed: List[Order] = []   # orders whose unfilled reservation must be released
+        self.incoming = 0
+        self.auctions: List[AuctionResult] = []
+
+
+class Market:
+    """
+    One market: book, call auction and queue behind a single lock. Methods
+    whose name does not start with "locked" take the lock themselves.
+    Changes are journaled (with this market's name) when a journal is given.
+    """
+
+    def __init__(self, zone: str = DEFAULT_ZONE, delivery_start: Optional[int] = None,
+                 journal=None, auction_mode: bool = False):
+        self.zone = zone
+        self.delivery_start = delivery_start
+        self.name = market_name(zone, delivery_start)
+        self.journal = journal
+        self.auction_mode = auction_mode
+        self.order_book = OrderBook()
+        self.call_auction = CallAuction()
+        self.order_queue: "deque[Order]" = deque()  # waiting for the engine, in arrival order
+        self.queued_orders: Dict[str, Order] = {}   # the same orders by id
+        self.lock = threading.Lock()
+        self.scheduled = False   # a worker owns this market's next tick
+        self.dirty = False       # amended since the last tick; the book may cross
+        self.last_trade: Optional[dict] = None
+        self.unreported_fills = 0  # fills since the last market update broadcast
+        self.last_summary: Optional[Dict] = None  # served while a tick holds the lock
+        self.retired = False     # dropped by MarketRegistry.prune; takes no more orders
+        self.last_active = time.time()  # last time orders were queued through the registry
+
+    def has_work(self) -> bool:
+        return bool(self.order_queue or self.dirty or self.order_book.orders or len(self.call_auction))
+
+    def is_empty(self) -> bool:
+        return not (self.order_queue or self.order_book.orders or len(self.call_auction))
+
+    def delivered(self, now: float) -> bool:
+        """Whether this market's delivery interval is over"""
+        return self.delivery_start is not None and self.delivery_start + INTERVAL_SECONDS <= now
+
+    def locked_get(self, order_id: str) -> Optional[Order]:
+        return (self.queued_orders.get(order_id) or self.call_auction.get(order_id)
+                or self.order_book.get(order_id))
+
+    def locked_open_order(self, order_id: str) -> Optional[Order]:
+        return (self.order_book.orders.get(order_id) or self.call_auction.get(order_id)
+                or self.queued_orders.get(order_id))
+
+    def _log(self, op: str, **fields):
+        if self.journal is not None:
+            self.journal.append(op, market=self.name, **fields)
+
+    def enqueue(self, orders: List[Order]) -> bool:
+        """Queue orders for the next tick; False (nothing queued) once the market is retired"""
+        with self.lock:
+            if self.retired:
+                return False
+            self.order_queue.extend(orders)
+            self.queued_orders.update((order.order_id, order) for order in orders)
+            if self.journal is not None:
+                for order in orders:
+                    self.journal.log_order(order, zone=self.zone, delivery_start=self.delivery_start)
+        return True
+
+    def locked_cancel(self, order_id: str) -> Optional[Order]:
+        """Cancel a queued, resting or auction order; None if it is not open"""
+        order = self.order_book.cancel(order_id)
+        if order is None:
+            order = self.call_auction.remove(order_id) or self.queued_orders.pop(order_id, None)
+            if order is None:
+                return None
+            # A queued order is still in order_queue; the tick skips it by status
+            self.order_book.retire(order, 'cancelled')
+        self._log("cancel", order_id=order_id)
+        return order
+
+    def locked_amend(self, order_id: str, price: Optional[float], qty: Optional[int]) -> Optional[Order]:
+        """Apply an amendment whose reservation change has been made already"""
+        order = self.locked_open_order(order_id)
+        if order is None:
+            return None
+        if order_id in self.order_book.orders:
+            self.order_book.amend(order_id, price, qty)
+            self.dirty = True
+        else:
+            order.price = order.price if price is None else price
+            order.qty = order.qty if qty is None else qty
+        self._log("amend", order_id=order_id, price=price, qty=qty)
+        return order
+
+    def locked_tick(self, now: float) -> MarketTick:
+        """Expire, drain and match the queue, clear due auctions (caller holds the lock)"""
+        tick = MarketTick()
+        # 1. Expire GTD orders, resting or waiting for their auction
+        tick.closed.extend(self.order_book.expire(now))
+        for order in self.call_auction.expire(now):
+            self.order_book.retire(order, 'expired')
+            tick.closed.append(order)
+
+        # 2. Drain the queue; each order matches on arrival (time-in-force applies)
+        incoming = []
+        while self.order_queue:
+            incoming.append(self.order_queue.popleft())
+        tick.incoming = len(incoming)
+        for order in sorted(incoming, key=lambda o: o.timestamp):
+            if self.queued_orders.pop(order.order_id, None) is None:
+                continue  # cancelled while queued
+            if self.auction_mode:
+                # A delivery market clears its own interval, whatever the order's timestamp
+                self.call_auction.add(order, self.delivery_start)
+                continue
+            unfilled = self.order_book.submit(order, tick.fills)
+            if unfilled is not None:
+                tick.closed.append(unfilled)
+        # Amendments may have crossed the book since the last tick
+        self.order_book.match_crossing(tick.fills)
+        self.dirty = False
+
+        # 3. Clear delivery intervals whose auction gate has closed
+        for interval in self.call_auction.due(now):
+            result = self.call_auction.clear(interval, now)
+            tick.fills.extend(result.fills)
+            for order in result.orders:
+                status = 'expired' if order.status == 'expired' else 'filled' if order.qty == 0 else 'unfilled'
+                self.order_book.retire(order, status)
+                tick.closed.append(order)
+            tick.auctions.append(result)
+
+        # 4. Delivery is over: whatever is still open can no longer trade
+        if self.delivered(now):
+            tick.closed.extend(self._expire_all())
+
+        # Ticks that changed nothing are not journaled
+        if self.journal is not None and (tick.incoming or tick.closed or tick.fills or tick.auctions):
+            self._log("tick", now=now)
+        return tick
+
+    def _expire_all(self) -> List[Order]:
+        """Close every resting and auction order as 'expired' (caller holds the lock; the queue was just drained)"""
+        expired = [self.order_book.close(order_id, 'expired') for order_id in list(self.order_book.orders)]
+        for order_id in list(self.call_auction.orders):
+            order = self.call_auction.remove(order_id)
+            self.order_book.retire(order, 'expired')
+            expired.append(order)
+        return expired
+
+    def _top(self) -> Dict:
+        """Best bid/ask with their level's qty and order count, and each side's order count (caller holds the lock)"""
+        bids, asks = self.order_book.bids, self.order_book.asks
+        bid, ask = bids.best_level(), asks.best_level()
+        return {
+            'best_bid': bid.price if bid else None,
+            'bid_qty': bid.total_qty if bid else 0,
+            'bid_orders': bid.count if bid else 0,
+            'total_bids': len(bids),
+            'best_ask': ask.price if ask else None,
+            'ask_qty': ask.total_qty if ask else 0,
+            'ask_orders': ask.count if ask else 0,
+            'total_asks': len(asks)
+        }
+
+    def top_of_book(self) -> Dict:
+        with self.lock:
+            return self._top()
+
+    def depth(self, levels: Optional[int] = None) -> Tuple[list, list]:
+        """(bids, asks) as (price, total qty, order count) per level, best first (caller holds the lock)"""
+        return self.order_book.bids.depth(levels), self.order_book.asks.depth(levels)
+
+    def close(self):
+        """Release what the market holds outside this process (nothing, for an in-process book)"""
+
+    def summary(self) -> Dict:
+        top = self._top()
+        return {
+            'market': self.name,
+            'zone': self.zone,
+            'delivery_start': (datetime.fromtimestamp(self.delivery_start).isoformat()
+                               if self.delivery_start is not None else None),
+            'best_bid': top['best_bid'],
+            'best_ask': top['best_ask'],
+            'total_bids': top['total_bids'],
+            'total_asks': top['total_asks'],
+            'queued': len(self.order_queue),
+            'auction_orders': len(self.call_auction)
+        }
+
+
+class MarketRegistry:
+    """
+    Markets by name, created on first use and dropped once delivered and
+    empty (the first tick after delivery end expires what is left, and the
+    engine releases those reservations). market_class builds each market (Market, or
+    market_shard.ShardedMarket to match in a separate process).
+
+    Zones must match ZONE_PATTERN (and be in `zones`, when given), delivery
+    intervals may start at most `horizon` seconds ahead and at most
+    `max_markets` markets are open at once (None lifts a limit). Empty zone
+    markets without a delivery interval are dropped after `idle_seconds`
+    without orders.
+
+    Orders queued through enqueue() are indexed by id, so find() is a dict
+    lookup. Entries whose order has left its market (archive included) are
+    swept once the index outgrows index_size, and twice the live count after.
+    """
+
+    def __init__(self, journal=None, auction_mode: bool = False, market_class: Type[Market] = Market,
+                 index_size: int = 100_000, zones: Optional[Iterable[str]] = None,
+                 horizon: Optional[float] = DELIVERY_HORIZON, max_markets: Optional[int] = MAX_MARKETS,
+                 idle_seconds: float = IDLE_SECONDS):
+        self.journal = journal
+        self.auction_mode = auction_mode
+        self.market_class = market_class
+        self.markets: Dict[str, Market] = {}
+        self._lock = threading.Lock()
+        self.index_size = index_size
+        self._order_markets: Dict[str, Market] = {}  # order id -> market, under _index_lock
+        self._index_lock = threading.Lock()           # never held while taking another lock
+        self._sweep_at = index_size
+        self.zones = None if zones is None else set(zones) | {DEFAULT_ZONE}
+        self.horizon = horizon
+        self.max_markets = max_markets
+        self.idle_seconds = idle_seconds
+        self.default = self.get_or_create(DEFAULT_ZONE, None)
+
+    def __iter__(self) -> Iterator[Market]:
+        return iter(list(self.markets.values()))
+
+    def __len__(self) -> int:
+        return len(self.markets)
+
+    def key(self, zone: Optional[str], delivery_start) -> Tuple[str, Optional[int]]:
+        """
+        Normalise a zone and delivery time (epoch seconds, snapped to its
+        interval); raises ValueError for a zone or interval no market may have.
+        """
+        zone = zone or DEFAULT_ZONE
+        if not isinstance(zone, str) or not ZONE_PATTERN.fullmatch(zone):
+            raise ValueError("zone must be 1-32 letters, digits, '.', '_' or '-'")
+        if self.zones is not None and zone not in self.zones:
+            raise ValueError(f"unknown zone: {zone}")
+        if delivery_start is not None:
+            delivery_start = delivery_interval(delivery_start)
+            if self.horizon is not None and delivery_start > time.time() + self.horizon:
+                raise ValueError(f"delivery interval starts more than {self.horizon:.0f}s ahead")
+        return zone, delivery_start
+
+    def get_or_create(self, zone: Optional[str], delivery_start=None) -> Market:
+        """Market for a zone and delivery time; raises ValueError when it may not be opened"""
+        return self._get_or_create(*self.key(zone, delivery_start))
+
+    def _get_or_create(self, zone: str, delivery_start: Optional[int], capped: bool = True) -> Market:
+        name = market_name(zone, delivery_start)
+        market = self.markets.get(name)
+        if market is None:
+            with self._lock:
+                market = self.markets.get(name)
+                if market is None:
+                    if capped and self.max_markets is not None and len(self.markets) >= self.max_markets:
+                        raise ValueError(f"too many open markets ({self.max_markets})")
+                    market = self.market_class(zone, delivery_start, self.journal, self.auction_mode)
+                    self.markets[name] = market
+        return market
+
+    def get(self, name: str) -> Optional[Market]:
+        return self.markets.get(name)
+
+    def enqueue(self, market: Market, orders: List[Order]) -> Market:
+        """
+        Queue orders on a market and index them; returns the market that took
+        them. A market pruned since it was looked up is replaced by a fresh
+        one for the same zone and interval, whose first tick expires them.
+        """
+        while not market.enqueue(orders):
+            # Accepted orders are reserved already, so the market cap does not apply here
+            market = self._get_or_create(market.zone, market.delivery_start, capped=False)
+        market.last_active = time.time()
+        with self._index_lock:
+            self._order_markets.update((order.order_id, market) for order in orders)
+            sweep = len(self._order_markets) > self._sweep_at
+        if sweep:
+            self._sweep_index()
+        return market
+
+    def _sweep_index(self):
+        """Drop index entries for orders their market no longer holds or archives"""
+        with self._index_lock:
+            by_market: Dict[Market, List[str]] = {}
+            for order_id, market in self._order_markets.items():
+                by_market.setdefault(market, []).append(order_id)
+        for market, order_ids in by_market.items():
+            # Under the market's lock: an order moving from the queue to the book is briefly in neither
+            with market.lock:
+                gone = [order_id for order_id in order_ids
+                        if market.retired or market.locked_get(order_id) is None]
+            with self._index_lock:
+                for order_id in gone:
+                    if self._order_markets.get(order_id) is market:
+                        del self._order_markets[order_id]
+        with self._index_lock:
+            self._sweep_at = max(self.index_size, 2 * len(self._order_markets))
+
+    def find(self, order_id: str) -> Optional[Market]:
+        """Market holding (or having archived) an order; re-check under the market's lock"""
+        with self._index_lock:
+            market = self._order_markets.get(order_id)
+        return market if market is not None and not market.retired else None
+
+    def prune(self, now: float) -> List[str]:
+        """Drop empty markets whose delivery interval is over, or that have been idle too long"""
+        dropped = []
+        with self._lock:
+            for name, market in list(self.markets.items()):
+                if market is self.default or market.scheduled:
+                    continue
+                if market.delivery_start is not None:
+                    if not market.delivered(now):
+                        continue
+                elif now - market.last_active < self.idle_seconds:
+                    continue
+                # Retired under its lock, so no order can be queued after the emptiness check
+                with market.lock:
+                    if not market.is_empty():
+                        continue
+                    market.retired = True
+                del self.markets[name]
+                market.close()
+                dropped.append(name)
+        return dropped
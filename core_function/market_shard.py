@@ -0,0 +1,717 @@
+# market_shard.py
+"""
+Process-sharded matching: market books run in a pool of shard processes.
+
+The API process keeps validation, reservations, settlement and the chain;
+a shard process owns market_registry.Market instances and does the
+matching. Per market the two share three blocks of shared memory:
+  - commands: a ring of fixed-size records written by the API process
+    (orders, cancels, amendments, ticks, sync barriers), read by the shard
+  - events:   a ring written by the shard (fills, closed orders, replies),
+    read by the API process
+  - top:      best bid/ask under a seqlock, rewritten by the shard after
+    every change and readable by anyone without a lock or a round trip
+Each ring has one producer and one consumer, and each side writes only its
+own position counter. The shard changes a book only in response to a
+command, and ticks are answered once their fills and closed orders have been
+emitted, so a tick hands out its own results and the API process's mirror
+of the open orders is exact between ticks.
+
+ShardPool runs at most QORCA_SHARD_PROCESSES shard processes (default: CPU
+count, at most 4) as `python market_shard.py --doorbell FD`; each market is
+attached to the process hosting the fewest. An idle shard process sleeps in
+select() on its control pipe (stdin: market attachments, EOF when the API
+process is gone) and a doorbell pipe the API process writes to after queuing
+commands. The API process waits for replies by yielding, then sleeping with
+exponential backoff.
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import math
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional
+
+from call_auction import AuctionResult
+from market_registry import DEFAULT_ZONE, Market, MarketTick
+from order_book import TIME_IN_FORCE, Fill, Order, record_transaction
+
+# Records per ring; each market has two in /dev/shm (88-byte commands, 136-byte events).
+# A full ring only makes its writer wait for the reader, so this bounds memory, not batch size
+RING_CAPACITY = int(os.environ.get("QORCA_SHARD_RING_CAPACITY", "4096"))
+REPLY_TIMEOUT = 5.0     # seconds to wait for the shard to answer a command
+SPIN_POLLS = 256        # empty polls that only yield before a waiter starts sleeping
+MIN_BACKOFF = 0.00002   # first sleep after that, doubled per empty poll
+MAX_BACKOFF = 0.0005
+SHARD_PROCESSES = int(os.environ.get("QORCA_SHARD_PROCESSES", min(4, os.cpu_count() or 1)))
+
+# Commands (API process -> shard):
+#   kind, side, time in force, price, qty, timestamp (tick: now), expires_at, order id
+# NaN stands for None (an amendment's unchanged price or qty, no expiry)
+CMD_ORDER, CMD_CANCEL, CMD_AMEND, CMD_TICK, CMD_SYNC, CMD_STOP = range(1, 7)
+COMMAND = struct.Struct("<BBB5xdddd48s")
+
+# Events (shard -> API process):
+#   kind, code (aggressor or status), liquid, price, qty, market price, timestamp,
+#   order id (buy side for fills), sell order id (fills only)
+(EVT_FILL, EVT_CLOSED, EVT_AUCTION, EVT_CANCELLED, EVT_AMENDED, EVT_REJECTED, EVT_SYNCED,
+ EVT_TICKED, EVT_STOPPED) = range(1, 10)
+EVENT = struct.Struct("<BBB5xdddd48s48s")
+# Replies answer the command the API process is waiting on; the rest arrive unasked
+REPLIES = (EVT_CANCELLED, EVT_AMENDED, EVT_REJECTED, EVT_SYNCED, EVT_TICKED, EVT_STOPPED)
+
+SIDES = ('buy', 'sell')
+AGGRESSORS = ('buy', 'sell', 'auction')
+STATUSES = ('filled', 'cancelled', 'expired', 'killed', 'unfilled')
+NAN = float('nan')
+
+
+def _id(order_id: str) -> bytes:
+    encoded = order_id.encode()
+    if len(encoded) > 48:
+        raise ValueError(f"order id too long for a shard record: {order_id}")
+    return encoded
+
+
+def _str(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode()
+
+
+def _num(value: float):
+    """Quantities travel as doubles; whole ones come back as ints"""
+    return int(value) if value.is_integer() else value
+
+
+def _opt(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _nan(value: Optional[float]) -> float:
+    return NAN if value is None else float(value)
+
+
+def _backoff(polls: int):
+    """Wait before the next poll of an empty (or full) ring: yield at first, then sleep longer each time"""
+    if polls < SPIN_POLLS:
+        time.sleep(0)
+    else:
+        time.sleep(min(MAX_BACKOFF, MIN_BACKOFF * 2 ** min(polls - SPIN_POLLS, 16)))
+
+
+def _attach(name: str) -> SharedMemory:
+    """Attach to a block the other process created, without taking over its cleanup"""
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedRing:
+    """
+    Single-producer, single-consumer ring of fixed-size struct records in
+    shared memory. head (next record to read) and tail (next to write) are
+    ever-increasing counters on separate cache lines; a record is published
+    by advancing tail only after it has been written.
+    """
+    # Counters are 8-byte words set through a memoryview, one store each
+    # (struct.pack_into zeroes its target first, so the other side could read 0)
+    HEAD, TAIL, CAPACITY = 0, 8, 16   # word indices: 64 bytes apart
+    DATA = 192                        # byte offset of the first record
+
+    def __init__(self, record: struct.Struct, capacity: int = RING_CAPACITY, name: Optional[str] = None):
+        self.record = record
+        self.owner = name is None
+        if self.owner:
+            self.shm = SharedMemory(create=True, size=self.DATA + record.size * capacity)
+        else:
+            self.shm = _attach(name)
+        self.buf = self.shm.buf
+        self.words = self.buf[:self.DATA].cast('Q')
+        if self.owner:
+            self.words[self.HEAD] = self.words[self.TAIL] = 0
+            self.words[self.CAPACITY] = capacity
+        self.capacity = self.words[self.CAPACITY]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def put(self, *values) -> bool:
+        """Append one record; False if the ring is full"""
+        tail = self.words[self.TAIL]
+        if tail - self.words[self.HEAD] >= self.capacity:
+            return False
+        self.record.pack_into(self.buf, self.DATA + (tail % self.capacity) * self.record.size, *values)
+        self.words[self.TAIL] = tail + 1
+        return True
+
+    def get(self) -> Optional[tuple]:
+        """Take the oldest record; None if the ring is empty"""
+        head = self.words[self.HEAD]
+        if head == self.words[self.TAIL]:
+            return None
+        values = self.record.unpack_from(self.buf, self.DATA + (head % self.capacity) * self.record.size)
+        self.words[self.HEAD] = head + 1
+        return values
+
+    def __len__(self) -> int:
+        return self.words[self.TAIL] - self.words[self.HEAD]
+
+    def close(self):
+        self.words.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class TopOfBook:
+    """
+    Best bid/ask in shared memory behind a seqlock: the single writer makes
+    the sequence odd, writes the fields and makes it even again; readers
+    retry until they see the same even sequence before and after reading.
+    """
+    # best bid, its level qty and orders, bids in total; the same for asks
+    BODY = struct.Struct("<ddQQddQQ")
+    FIELDS = ('best_bid', 'bid_qty', 'bid_orders', 'total_bids',
+              'best_ask', 'ask_qty', 'ask_orders', 'total_asks')
+    MAX_RETRIES = 100_000
+
+    def __init__(self, name: Optional[str] = None):
+        self.owner = name is None
+        if self.owner:
+            self.shm = SharedMemory(create=True, size=8 + self.BODY.size)
+        else:
+            self.shm = _attach(name)
+        self.buf = self.shm.buf
+        self.seq = self.buf[:8].cast('Q')  # set in one store, like SharedRing's counters
+        if self.owner:
+            self.seq[0] = 0
+            self.BODY.pack_into(self.buf, 8, NAN, 0.0, 0, 0, NAN, 0.0, 0, 0)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, *values):
+        seq = self.seq[0]
+        self.seq[0] = seq + 1
+        self.BODY.pack_into(self.buf, 8, *values)
+        self.seq[0] = seq + 2
+
+    def read(self) -> Dict:
+        for _ in range(self.MAX_RETRIES):
+            seq = self.seq[0]
+            if seq & 1:
+                continue  # a write is in progress
+            values = self.BODY.unpack_from(self.buf, 8)
+            if self.seq[0] == seq:
+                top = dict(zip(self.FIELDS, values))
+                top['best_bid'] = _opt(top['best_bid'])
+                top['best_ask'] = _opt(top['best_ask'])
+                top['bid_qty'] = _num(top['bid_qty'])
+                top['ask_qty'] = _num(top['ask_qty'])
+                return top
+        raise RuntimeError("top of book is not settling; is its shard still running?")
+
+    def close(self):
+        self.seq.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class MarketShard:
+    """The shard process's side of one market: applies commands to its Market and reports the outcome"""
+
+    def __init__(self, market: Market, commands: SharedRing, events: SharedRing, top: TopOfBook):
+        self.market = market
+        self.commands = commands
+        self.events = events
+        self.top = top
+
+    def emit(self, *values):
+        # Every command that emits is awaited, so the API process is draining a full ring
+        polls = 0
+        while not self.events.put(*values):
+            _backoff(polls)
+            polls += 1
+
+    def publish(self):
+        book = self.market.order_book
+        bid, ask = book.bids.best_level(), book.asks.best_level()
+        self.top.write(bid.price if bid else NAN, bid.total_qty if bid else 0.0,
+                       bid.count if bid else 0, len(book.bids),
+                       ask.price if ask else NAN, ask.total_qty if ask else 0.0,
+                       ask.count if ask else 0, len(book.asks))
+
+    def handle(self, record: tuple) -> bool:
+        """Apply one command; False once told to stop"""
+        kind, side, tif, price, qty, timestamp, expires_at, raw_id = record
+        # Single-threaded: the locked_* methods are safe to call without the lock
+        market = self.market
+        if kind == CMD_ORDER:
+            market.enqueue([Order(_str(raw_id), SIDES[side], price, _num(qty), datetime.fromtimestamp(timestamp),
+                                  "", TIME_IN_FORCE[tif], _opt(expires_at))])
+            return True  # queued orders do not move the top of book
+        if kind == CMD_TICK:
+            tick = market.locked_tick(timestamp)
+            for fill in tick.fills:
+                self.emit(EVT_FILL, AGGRESSORS.index(fill.aggressor), fill.liquid, fill.price, fill.qty,
+                          fill.market_price, fill.timestamp, _id(fill.buy_order_id), _id(fill.sell_order_id))
+            for result in tick.auctions:
+                self.emit(EVT_AUCTION, 0, 0, _nan(result.price), result.volume, NAN, result.interval, b"", b"")
+            for order in tick.closed:
+                self.emit(EVT_CLOSED, STATUSES.index(order.status), 0, order.price, order.qty, NAN,
+                          timestamp, _id(order.order_id), b"")
+            self.publish()
+            self.emit(EVT_TICKED, 0, 0, NAN, NAN, NAN, timestamp, b"", b"")
+            return True
+        elif kind == CMD_CANCEL:
+            order = market.locked_cancel(_str(raw_id))
+            if order is None:
+                self.emit(EVT_REJECTED, 0, 0, NAN, NAN, NAN, NAN, raw_id, b"")
+            else:
+                self.emit(EVT_CANCELLED, 0, 0, order.price, order.qty, NAN, NAN, raw_id, b"")
+        elif kind == CMD_AMEND:
+            order = market.locked_amend(_str(raw_id), _opt(price), None if math.isnan(qty) else _num(qty))
+            if order is None:
+                self.emit(EVT_REJECTED, 0, 0, NAN, NAN, NAN, NAN, raw_id, b"")
+            else:
+                self.emit(EVT_AMENDED, 0, 0, order.price, order.qty, NAN, NAN, raw_id, b"")
+        elif kind == CMD_SYNC:
+            self.emit(EVT_SYNCED, 0, 0, NAN, qty, NAN, NAN, b"", b"")
+            return True
+        elif kind == CMD_STOP:
+            self.emit(EVT_STOPPED, 0, 0, NAN, NAN, NAN, NAN, b"", b"")
+            return False
+        self.publish()
+        return True
+
+    def close(self):
+        self.commands.close()
+        self.events.close()
+        self.top.close()
+
+
+class ShardHost:
+    """
+    A shard process: runs the markets the API process attaches. While every
+    command ring is empty it sleeps in select() until the doorbell rings or
+    a control message arrives; EOF on the control pipe means the API
+    process is gone.
+    """
+    BATCH = 256  # commands per market per pass, so a busy market cannot starve the others
+
+    def __init__(self, control: int, doorbell: int):
+        self.control = control
+        self.doorbell = doorbell
+        self.shards: Dict[str, MarketShard] = {}  # by command ring name
+        self._partial = b""
+
+    def attach(self, spec: Dict):
+        attached = []
+        try:
+            attached.append(SharedRing(COMMAND, name=spec["commands"]))
+            attached.append(SharedRing(EVENT, name=spec["events"]))
+            attached.append(TopOfBook(spec["top"]))
+        except FileNotFoundError:
+            # Closed by the API process before it got here
+            for block in attached:
+                block.close()
+            return
+        market = Market(spec["zone"], spec["delivery_start"], auction_mode=spec["auction"])
+        self.shards[spec["commands"]] = MarketShard(market, *attached)
+
+    def read_control(self) -> bool:
+        """Apply the control messages (one JSON object per line) that arrived; False on EOF"""
+        data = os.read(self.control, 65536)
+        if not data:
+            return False
+        *lines, self._partial = (self._partial + data).split(b"\n")
+        for line in lines:
+            message = json.loads(line)
+            if message["op"] == "attach":
+                self.attach(message)
+        return True
+
+    def run(self):
+        busy = False
+        while True:
+            # Block only when the last pass found nothing to do
+            readable, _, _ = select.select([self.control, self.doorbell], [], [], 0 if busy else None)
+            if self.doorbell in readable:
+                os.read(self.doorbell, 65536)
+            if self.control in readable and not self.read_control():
+                return
+            busy = False
+            for name, shard in list(self.shards.items()):
+                for _ in range(self.BATCH):
+                    record = shard.commands.get()
+                    if record is None:
+                        break
+                    busy = True
+                    if not shard.handle(record):
+                        del self.shards[name]
+                        shard.close()
+                        break
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+        self.shards.clear()
+
+
+class ShardProcess:
+    """The API process's handle on one pooled shard process"""
+
+    def __init__(self):
+        doorbell, self._doorbell = os.pipe()
+        os.set_blocking(self._doorbell, False)
+        try:
+            self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--doorbell", str(doorbell)],
+                                            stdin=subprocess.PIPE, pass_fds=(doorbell,))
+        finally:
+            os.close(doorbell)
+        self._lock = threading.Lock()
+        self.markets = 0  # attached and not yet closed
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def attach(self, spec: Dict):
+        with self._lock:
+            self.process.stdin.write(json.dumps({"op": "attach", **spec}).encode() + b"\n")
+            self.process.stdin.flush()
+            self.markets += 1
+        self.ring()
+
+    def detach(self):
+        with self._lock:
+            self.markets -= 1
+
+    def ring(self):
+        """Wake the shard process if it is sleeping"""
+        doorbell = self._doorbell
+        if doorbell is None:
+            return
+        try:
+            os.write(doorbell, b"\0")
+        except BlockingIOError:
+            pass  # the pipe is full of wake-ups it has not read yet
+        except OSError:
+            pass  # it has exited; the next command reports that
+
+    def close(self):
+        with self._lock:
+            if self.process.stdin.closed:
+                return
+            try:
+                self.process.stdin.close()  # EOF: the shard process exits
+            except OSError:
+                pass
+            doorbell, self._doorbell = self._doorbell, None
+            os.close(doorbell)
+        try:
+            self.process.wait(REPLY_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class ShardPool:
+    """
+    At most `size` shard processes, started as markets need them. A market
+    goes to the live process hosting the fewest markets. One exit hook
+    closes the markets still open (held weakly, so pruned markets are not
+    kept alive), then the processes.
+    """
+
+    def __init__(self, size: int = SHARD_PROCESSES):
+        self.size = max(1, size)
+        self.processes: List[ShardProcess] = []
+        self.markets: "weakref.WeakSet[ShardedMarket]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def attach(self, **spec) -> ShardProcess:
+        with self._lock:
+            # A process that died takes its markets with it; new markets go elsewhere
+            self.processes = [p for p in self.processes if p.alive()]
+            if len(self.processes) < self.size:
+                process = ShardProcess()
+                self.processes.append(process)
+            else:
+                process = min(self.processes, key=lambda p: p.markets)
+            process.attach(spec)
+            return process
+
+    def close(self):
+        atexit.unregister(self.close)
+        for market in list(self.markets):
+            market.close()
+        with self._lock:
+            for process in self.processes:
+                process.close()
+            self.processes = []
+
+
+_default_pool: Optional[ShardPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> ShardPool:
+    """The pool ShardedMarkets use unless given one"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ShardPool()
+        return _default_pool
+
+
+class ShardedMarket(Market):
+    """
+    A Market whose book lives in a pooled shard process, with Market's
+    interface and locking. Orders, cancels, amendments and ticks become
+    commands; fills and closed orders come back as events, and a tick
+    returns once the shard has reported everything it did. Open orders are
+    mirrored here for reservations and lookups, closed ones go to
+    order_book's archive (its sides stay empty).
+    """
+
+    def __init__(self, zone: str = DEFAULT_ZONE, delivery_start: Optional[int] = None,
+                 journal=None, auction_mode: bool = False, capacity: int = RING_CAPACITY,
+                 pool: Optional[ShardPool] = None):
+        super().__init__(zone, delivery_start, journal, auction_mode)
+        self.open_orders: Dict[str, Order] = {}
+        self._sent = []          # orders sent since the last tick
+        self._tick = MarketTick()  # events received since the last tick
+        self._sync_token = itertools.count(1)
+        self.commands = SharedRing(COMMAND, capacity)
+        self.events = SharedRing(EVENT, capacity)
+        self.top = TopOfBook()
+        self.pool = pool or default_pool()
+        self.shard = self.pool.attach(
+            zone=zone, delivery_start=delivery_start, auction=auction_mode,
+            commands=self.commands.name, events=self.events.name, top=self.top.name)
+        self._closed = False
+        self.pool.markets.add(self)
+
+    @property
+    def process(self) -> subprocess.Popen:
+        """The shard process this market runs in (shared with the other markets it hosts)"""
+        return self.shard.process
+
+    # -- plumbing -------------------------------------------------------
+    def _check_alive(self):
+        code = self.process.poll()
+        if code is not None:
+            raise RuntimeError(f"matching shard for {self.name} exited with code {code}")
+
+    def _send(self, *values):
+        # While the ring is full keep draining events, so the shard is never stuck emitting
+        polls = 0
+        while not self.commands.put(*values):
+            self._check_alive()
+            self.shard.ring()
+            self._drain()
+            _backoff(polls)
+            polls += 1
+
+    def _request(self, *values) -> tuple:
+        self._send(*values)
+        self.shard.ring()
+        return self._await_reply()
+
+    def _handle(self, event: tuple):
+        kind, code, liquid, price, qty, market_price, timestamp, first_id, second_id = event
+        qty = _num(qty)
+        if kind == EVT_FILL:
+            bid, ask = self.open_orders[_str(first_id)], self.open_orders[_str(second_id)]
+            fill = Fill(bid, ask, price, qty, market_price, bool(liquid), timestamp)
+            fill.aggressor = AGGRESSORS[code]
+            self._tick.fills.append(fill)
+            record_transaction(price, qty)
+            for order in (bid, ask):
+                order.qty -= qty
+                if order.qty <= 1e-9:
+                    # The shard does not report fully filled orders as closed
+                    order.qty = 0
+                    self._retire(order, 'filled')
+        elif kind == EVT_CLOSED:
+            order = self.open_orders.get(_str(first_id))
+            if order is not None:
+                order.qty = qty
+                self._retire(order, STATUSES[code])
+                self._tick.closed.append(order)
+        elif kind == EVT_AUCTION:
+            self._tick.auctions.append(AuctionResult(int(timestamp), _opt(price), qty, [], []))
+
+    def _drain(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            self._handle(event)
+
+    def _await_reply(self) -> tuple:
+        """Handle events until the reply to the command just sent arrives"""
+        deadline = time.monotonic() + REPLY_TIMEOUT
+        polls = 0
+        while True:
+            event = self.events.get()
+            if event is None:
+                if time.monotonic() > deadline:
+                    self._check_alive()
+                    raise TimeoutError(f"matching shard for {self.name} did not reply")
+                if polls % SPIN_POLLS == SPIN_POLLS - 1:
+                    self._check_alive()
+                _backoff(polls)
+                polls += 1
+                continue
+            if event[0] in REPLIES:
+                return event
+            self._handle(event)
+
+    def _sync(self):
+        """Wait until every event the shard has produced so far is handled"""
+        self._request(CMD_SYNC, 0, 0, NAN, float(next(self._sync_token)), NAN, NAN, b"")
+
+    def _retire(self, order: Order, status: str):
+        del self.open_orders[order.order_id]
+        self.order_book.retire(order, status)
+
+    # -- Market interface ---------------------------------------------
+    def has_work(self) -> bool:
+        return bool(self.open_orders or self._tick.fills or self._tick.closed or self._tick.auctions)
+
+    def is_empty(self) -> bool:
+        # Events handled while waiting on a cancel or amend are handed out by the next tick
+        return not (self.open_orders or self._tick.fills or self._tick.closed or self._tick.auctions)
+
+    def locked_get(self, order_id: str) -> Optional[Order]:
+        return self.open_orders.get(order_id) or self.order_book.get(order_id)
+
+    def locked_open_order(self, order_id: str) -> Optional[Order]:
+        # Fills already made in the shard must be applied before a reservation is recomputed
+        self._sync()
+        return self.open_orders.get(order_id)
+
+    def enqueue(self, orders) -> bool:
+        with self.lock:
+            if self.retired:
+                return False
+            for order in orders:
+                self._send(CMD_ORDER, SIDES.index(order.side), TIME_IN_FORCE.index(order.tif),
+                           order.price, order.qty, order.timestamp.timestamp(), _nan(order.expires_at),
+                           _id(order.order_id))
+                self.open_orders[order.order_id] = order
+                self._sent.append(order)
+                if self.journal is not None:
+                    self.journal.log_order(order, zone=self.zone, delivery_start=self.delivery_start)
+        # Queued orders wait for the tick, but the shard can take them off the ring now
+        self.shard.ring()
+        return True
+
+    def locked_cancel(self, order_id: str) -> Optional[Order]:
+        if order_id not in self.open_orders:
+            return None
+        # Fills made before the cancel are handled on the way, so the mirror's qty is what was left
+        if self._request(CMD_CANCEL, 0, 0, NAN, NAN, NAN, NAN, _id(order_id))[0] != EVT_CANCELLED:
+            return None
+        order = self.open_orders[order_id]
+        self._retire(order, 'cancelled')
+        self._log("cancel", order_id=order_id)
+        return order
+
+    def locked_amend(self, order_id: str, price: Optional[float], qty: Optional[int]) -> Optional[Order]:
+        if order_id not in self.open_orders:
+            return None
+        if self._request(CMD_AMEND, 0, 0, _nan(price), _nan(qty), NAN, NAN, _id(order_id))[0] != EVT_AMENDED:
+            return None
+        order = self.open_orders[order_id]
+        order.price = order.price if price is None else price
+        order.qty = order.qty if qty is None else qty
+        self._log("amend", order_id=order_id, price=price, qty=qty)
+        return order
+
+    def locked_tick(self, now: float) -> MarketTick:
+        """Ask the shard to tick and wait for its fills, closed orders and auctions"""
+        self._check_alive()
+        self._send(CMD_TICK, 0, 0, NAN, NAN, now, NAN, b"")
+        # Before the results arrive: those close some of these orders
+        for order in self._sent:
+            if order.status == 'queued':
+                order.status = 'open'
+        self.shard.ring()
+        self._await_reply()
+        tick, self._tick = self._tick, MarketTick()
+        tick.incoming = len(self._sent)
+        self._sent = []
+        # Ticks that changed nothing are not journaled, as in Market
+        if self.journal is not None and (tick.incoming or tick.closed or tick.fills or tick.auctions):
+            self._log("tick", now=now)
+        return tick
+
+    def _top(self) -> Dict:
+        return self.top.read()
+
+    def top_of_book(self) -> Dict:
+        """Read from shared memory: no lock, no round trip to the shard"""
+        return self.top.read()
+
+    def depth(self, levels: Optional[int] = None):
+        """Only the best level is shared by the shard"""
+        top = self.top.read()
+        bids = [(top['best_bid'], top['bid_qty'], top['bid_orders'])] if top['best_bid'] is not None else []
+        asks = [(top['best_ask'], top['ask_qty'], top['ask_orders'])] if top['best_ask'] is not None else []
+        return bids[:levels], asks[:levels]
+
+    def close(self):
+        """Detach from the shard process and free the shared memory"""
+        if self._closed:
+            return
+        self._closed = True
+        self.pool.markets.discard(self)
+        if self.shard.alive():
+            try:
+                self._request(CMD_STOP, 0, 0, NAN, NAN, NAN, NAN, b"")
+            except (RuntimeError, TimeoutError):
+                pass  # exited meanwhile, or stuck: the blocks are unlinked either way
+        self.shard.detach()
+        self.commands.close()
+        self.events.close()
+        self.top.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching shard process (started by ShardPool)")
+    parser.add_argument("--doorbell", type=int, required=True, help="pipe fd written to after queuing commands")
+    args = parser.parse_args()
+
+    host = ShardHost(sys.stdin.fileno(), args.doorbell)
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.close()
+
+
+if __name__ == "__main__":
+    main()
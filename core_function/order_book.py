@@ -1,16 +1,34 @@
 # order_book.py
+import bisect
+import heapq
+import itertools
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 
 # In-memory storage for order history
 order_storage: List[Dict[str, Any]] = []
-transacted_orders: List[Tuple[datetime, float, float]] = []   # (ts, price, qty)
+# Recent trades, (ts, price, qty), oldest first: only the volume window is kept
+TRANSACTED_WINDOW = timedelta(minutes=5)
+transacted_orders: "deque[Tuple[datetime, float, float]]" = deque()
+
+def record_transaction(price: float, qty: float, now: datetime = None):
+    """Note a trade for volume_in_last_5min, dropping trades older than the window"""
+    now = now or datetime.now()
+    transacted_orders.append((now, price, qty))
+    cutoff = now - TRANSACTED_WINDOW
+    try:
+        while transacted_orders[0][0] < cutoff:
+            transacted_orders.popleft()
+    except IndexError:
+        pass  # emptied by another thread
 
 def volume_in_last_5min(now: datetime = None) -> float:
     """Calculate trading volume in the last 5 minutes"""
     now = now or datetime.now()
-    cutoff = now - timedelta(minutes=5)
-    return sum(qty for ts, _, qty in transacted_orders if cutoff <= ts < now)
+    cutoff = now - TRANSACTED_WINDOW
+    return sum(qty for ts, _, qty in list(transacted_orders) if cutoff <= ts < now)
 
 def is_liquid(trading_volume: float, bid_ask_spread: float,
               min_volume: float = 100_000.0, max_spread: float = 0.01) -> bool:
@@ -114,7 +132,7 @@ def match_transaction(book: Dict[str, list], is_liquid_flag: bool) -> Dict[str,
         book['asks'][0] = (best_ask[0], best_ask[1] - qty, best_ask[2], best_ask[3])
 
     # Record transaction
-    transacted_orders.append((now, price, qty))
+    record_transaction(price, qty, now)
 
     # Determine market price based on liquidity
     if is_liquid_flag:
@@ -131,3 +149,385 @@ def match_transaction(book: Dict[str, list], is_liquid_flag: bool) -> Dict[str,
         'transaction_price': price,
         'market_price': market_price
     }
+
+
+# ------------------------------------------------------------------
+# Order lifecycle: ids, price-time priority book, O(1) cancellation
+# ------------------------------------------------------------------
+# GTC: rest until filled or cancelled; GTD: rest until expires_at
+# IOC: fill what crosses now, cancel the rest; FOK: fill completely now or cancel
+TIME_IN_FORCE = ('GTC', 'GTD', 'IOC', 'FOK')
+
+
+class Order:
+    """A resting or queued order; also a node in its price level's FIFO list"""
+    __slots__ = ('order_id', 'side', 'price', 'qty', 'timestamp', 'user_id',
+                 'tif', 'expires_at', 'status', 'seq', 'level', 'prev', 'next')
+
+    def __init__(self, order_id: str, side: str, price: float, qty: int, timestamp: datetime,
+                 user_id: str, tif: str = 'GTC', expires_at: Optional[float] = None):
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.tif = tif
+        self.expires_at = expires_at
+        self.status = 'queued'
+        self.seq = 0  # book arrival sequence, set by OrderBook.add
+        self.level: Optional['PriceLevel'] = None
+        self.prev: Optional['Order'] = None
+        self.next: Optional['Order'] = None
+
+    def as_entry(self) -> Tuple[float, int, datetime, str]:
+        """Legacy book entry: (price, qty, timestamp, user_id)"""
+        return (self.price, self.qty, self.timestamp, self.user_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'order_id': self.order_id,
+            'side': self.side,
+            'price': self.price,
+            'quantity': self.qty,
+            'timestamp': self.timestamp.isoformat(),
+            'user_id': self.user_id,
+            'time_in_force': self.tif,
+            'expires_at': self.expires_at,
+            'status': self.status
+        }
+
+
+class Fill:
+    """One execution between a resting order and the order that crossed it"""
+    __slots__ = ('buy_order_id', 'sell_order_id', 'buyer_id', 'seller_id', 'price', 'qty',
+                 'bid_price', 'aggressor', 'market_price', 'liquid', 'timestamp')
+
+    def __init__(self, bid: Order, ask: Order, price: float, qty: int, market_price: float,
+                 liquid: bool, timestamp: float):
+        self.buy_order_id = bid.order_id
+        self.sell_order_id = ask.order_id
+        self.buyer_id = bid.user_id
+        self.seller_id = ask.user_id
+        self.price = price
+        self.qty = qty
+        self.bid_price = bid.price  # the buyer's reservation was made at this price
+        # The later arrival took liquidity
+        self.aggressor = 'buy' if bid.seq > ask.seq else 'sell'
+        self.market_price = market_price
+        self.liquid = liquid
+        self.timestamp = timestamp
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'price': self.price,
+            'market_price': self.market_price,
+            'qty': self.qty,
+            'buyer': self.buyer_id,
+            'seller': self.seller_id,
+            'buy_order_id': self.buy_order_id,
+            'sell_order_id': self.sell_order_id,
+            'aggressor': self.aggressor,
+            'timestamp': self.timestamp,
+            'liquid': self.liquid
+        }
+
+
+class PriceLevel:
+    """
+    FIFO of orders at one price (doubly linked, O(1) append/unlink), with
+    the level's total quantity and order count kept up to date as it changes
+    """
+    __slots__ = ('price', 'head', 'tail', 'total_qty', 'count')
+
+    def __init__(self, price: float):
+        self.price = price
+        self.head: Optional[Order] = None
+        self.tail: Optional[Order] = None
+        self.total_qty = 0
+        self.count = 0
+
+    def append(self, order: Order):
+        order.level = self
+        order.prev, order.next = self.tail, None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+        self.total_qty += order.qty
+        self.count += 1
+
+    def unlink(self, order: Order):
+        self.total_qty -= order.qty
+        self.count -= 1
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.level = order.prev = order.next = None
+
+    def __iter__(self) -> Iterator[Order]:
+        order = self.head
+        while order is not None:
+            yield order
+            order = order.next
+
+
+class BookSide:
+    """
+    One side of the book: price -> PriceLevel, plus a sorted price list.
+    Iterates in priority order (best price first, then arrival order);
+    len() and slicing give legacy (price, qty, timestamp, user_id) entries.
+    """
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.levels: Dict[float, PriceLevel] = {}
+        self._prices: List[float] = []   # ascending
+        self._count = 0
+        self._version = 0  # bumped on every change, invalidates the depth cache
+        self._depth_cache: Tuple[int, List[Tuple[float, int, int]]] = (-1, [])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def best_level(self) -> Optional[PriceLevel]:
+        if not self._prices:
+            return None
+        return self.levels[self._prices[-1] if self.is_bid else self._prices[0]]
+
+    def best(self) -> Optional[Order]:
+        level = self.best_level()
+        return level.head if level is not None else None
+
+    def add(self, order: Order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = PriceLevel(order.price)
+            bisect.insort(self._prices, order.price)
+        level.append(order)
+        self._count += 1
+        self._version += 1
+
+    def remove(self, order: Order):
+        level = order.level
+        level.unlink(order)
+        self._count -= 1
+        self._version += 1
+        if level.head is None:
+            del self.levels[level.price]
+            del self._prices[bisect.bisect_left(self._prices, level.price)]
+
+    def reduce(self, order: Order, qty: int):
+        """Take `qty` off a resting order in place (partial fill or size decrease)"""
+        order.qty -= qty
+        order.level.total_qty -= qty
+        self._version += 1
+
+    def depth(self, levels: Optional[int] = None) -> List[Tuple[float, int, int]]:
+        """
+        Market-by-price view: (price, total qty, order count) per level, best
+        first. Served from a cache until the side changes.
+        """
+        wanted = len(self._prices) if levels is None else min(levels, len(self._prices))
+        version, cached = self._depth_cache
+        if version != self._version or len(cached) < wanted:
+            cached = [(level.price, level.total_qty, level.count)
+                      for level in itertools.islice(self.price_levels(), wanted)]
+            self._depth_cache = (self._version, cached)
+        return cached[:wanted]
+
+    def price_levels(self) -> Iterator[PriceLevel]:
+        prices = reversed(self._prices) if self.is_bid else iter(self._prices)
+        for price in prices:
+            yield self.levels[price]
+
+    def __iter__(self) -> Iterator[Order]:
+        for level in self.price_levels():
+            yield from level
+
+    def entries(self, limit: Optional[int] = None) -> List[Tuple[float, int, datetime, str]]:
+        return [order.as_entry() for order in itertools.islice(self, limit)]
+
+    def __getitem__(self, index):
+        # book['bids'][:20] walks only the first 20 orders
+        if isinstance(index, slice) and index.start in (None, 0) and index.step in (None, 1) \
+                and (index.stop is None or index.stop >= 0):
+            return self.entries(index.stop)
+        return self.entries()[index]
+
+
+class OrderBook:
+    """
+    Price-time priority order book with an order-id index.
+
+    orders maps order_id -> Order, and each Order is a node in its level's
+    linked list, so cancel/amend touch only that node (plus the sorted price
+    list when a level empties). Closed orders go to a bounded archive.
+    Not thread-safe on its own; the engine guards it with state_lock.
+    """
+
+    def __init__(self, archive_size: int = 10_000):
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.orders: Dict[str, Order] = {}
+        self.archive: Dict[str, Order] = {}
+        self._archive_order: deque = deque()
+        self._archive_size = archive_size
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._seq = itertools.count(1)
+        # This book's last 100 trade sizes, for the liquidity check (per book so
+        # matching never depends on other books or earlier runs in the process)
+        self.recent_qty: deque = deque(maxlen=100)
+
+    def __getitem__(self, side: str) -> BookSide:
+        # Legacy dict-style access: order_book['bids'] / order_book['asks']
+        return self.bids if side == 'bids' else self.asks
+
+    def side_of(self, order: Order) -> BookSide:
+        return self.bids if order.side == 'buy' else self.asks
+
+    def opposite(self, order: Order) -> BookSide:
+        return self.asks if order.side == 'buy' else self.bids
+
+    def get(self, order_id: str) -> Optional[Order]:
+        return self.orders.get(order_id) or self.archive.get(order_id)
+
+    def add(self, order: Order):
+        order.status = 'open'
+        order.seq = next(self._seq)
+        self.orders[order.order_id] = order
+        self.side_of(order).add(order)
+        if order.expires_at is not None:
+            heapq.heappush(self._expiry_heap, (order.expires_at, order.order_id))
+
+    def close(self, order_id: str, status: str) -> Optional[Order]:
+        """Take an order out of the book (filled, cancelled, expired)"""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        self.side_of(order).remove(order)
+        self.retire(order, status)
+        return order
+
+    def cancel(self, order_id: str) -> Optional[Order]:
+        return self.close(order_id, 'cancelled')
+
+    def amend(self, order_id: str, price: Optional[float] = None, qty: Optional[int] = None) -> Optional[Order]:
+        """
+        Change price and/or quantity. A pure quantity decrease keeps time
+        priority; a price change or quantity increase re-queues the order.
+        """
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        new_price = order.price if price is None else price
+        new_qty = order.qty if qty is None else qty
+        if new_price == order.price and new_qty <= order.qty:
+            self.side_of(order).reduce(order, order.qty - new_qty)
+            return order
+        side = self.side_of(order)
+        side.remove(order)
+        order.price, order.qty = new_price, new_qty
+        order.seq = next(self._seq)
+        side.add(order)
+        return order
+
+    def expire(self, now: float) -> List[Order]:
+        """Close every order whose expires_at has passed"""
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, order_id = heapq.heappop(heap)
+            order = self.orders.get(order_id)
+            # Closed or amended orders leave stale heap entries
+            if order is not None and order.expires_at is not None and order.expires_at <= now:
+                expired.append(self.close(order_id, 'expired'))
+        return expired
+
+    def fillable(self, order: Order) -> bool:
+        """Whether the opposite side can fill `order` completely right now"""
+        needed = order.qty
+        for level in self.opposite(order).price_levels():
+            if (order.side == 'buy' and level.price > order.price) or \
+               (order.side == 'sell' and level.price < order.price):
+                return False
+            for resting in level:
+                needed -= resting.qty
+                if needed <= 0:
+                    return True
+        return False
+
+    def submit(self, order: Order, fills: List[Fill]) -> Optional[Order]:
+        """
+        Add an incoming order and match it, applying its time in force.
+        Fills are appended to `fills`; returns the order if it was closed
+        without resting (FOK killed, IOC/FOK remainder cancelled).
+        """
+        if order.tif == 'FOK' and not self.fillable(order):
+            self.retire(order, 'killed')
+            return order
+        self.add(order)
+        self.match_crossing(fills)
+        if order.tif in ('IOC', 'FOK') and order.order_id in self.orders:
+            return self.cancel(order.order_id)
+        return None
+
+    def match_crossing(self, fills: List[Fill]):
+        """Match the top of the book until it no longer crosses"""
+        while True:
+            best_bid, best_ask = self.bids.best(), self.asks.best()
+            if best_bid is None or best_ask is None:
+                return
+            # Calculate market conditions
+            spread = (best_ask.price - best_bid.price) / best_bid.price
+            volume = sum(self.recent_qty)  # last 100 trades in this book
+            fill = self.match_top(is_liquid(volume, spread))
+            if fill is None:
+                return
+            fills.append(fill)
+
+    def match_top(self, is_liquid_flag: bool) -> Optional[Fill]:
+        """
+        Match the best bid against the best ask once (same pricing rule as
+        match_transaction: trade at the ask, market price = trade price when
+        liquid, mid-price otherwise). Returns the Fill, or None if no cross.
+        """
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None or bid.price < ask.price:
+            return None
+
+        price = ask.price
+        qty = min(bid.qty, ask.qty)
+        # Parties are captured before the orders are reduced or closed
+        fill = Fill(bid, ask, price, qty, price, is_liquid_flag, time.time())
+        for order in (bid, ask):
+            self.side_of(order).reduce(order, qty)
+            if order.qty == 0:
+                self.close(order.order_id, 'filled')
+
+        self.recent_qty.append(qty)
+        record_transaction(price, qty)
+
+        if not is_liquid_flag:
+            # In illiquid markets, use mid-price
+            best_bid, best_ask = self.bids.best(), self.asks.best()
+            if best_bid and best_ask:
+                fill.market_price = (best_bid.price + best_ask.price) / 2
+        return fill
+
+    def retire(self, order: Order, status: str):
+        """Record a final status for an order that is not (or no longer) in the book"""
+        order.status = status
+        self.archive[order.order_id] = order
+        self._archive_order.append(order.order_id)
+        while len(self._archive_order) > self._archive_size:
+            self.archive.pop(self._archive_order.popleft(), None)
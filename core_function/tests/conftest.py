@@ -0,0 +1,10 @@
+# conftest.py
+"""Shared setup: import the core_function modules and keep their data out of ~/.qorca"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# wallet_history reads this at import time, so set it before any test imports it
+os.environ.setdefault("QORCA_DATA_DIR", tempfile.mkdtemp(prefix="qorca-tests-"))
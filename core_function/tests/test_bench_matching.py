@@ -0,0 +1,49 @@
+# test_bench_matching.py
+"""Smoke runs of benchmarks/bench_matching.py with tiny parameters"""
+
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+BENCH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "benchmarks", "bench_matching.py")
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("bench_matching", BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_order_flow_is_reproducible(bench):
+    first, second = bench.OrderFlow(seed=3), bench.OrderFlow(seed=3)
+    assert [first.order() for _ in range(50)] == [second.order() for _ in range(50)]
+
+
+def test_legacy_and_book_benches_report_rows(bench):
+    rows = bench.bench_legacy(50, 20, seed=1) + bench.bench_book(50, 200, seed=1)
+    assert [row['bench'] for row in rows] == ['legacy_rank', 'legacy_match', 'book']
+    book = rows[-1]
+    assert book['ops'] == 200 and book['throughput_per_s'] > 0
+    assert book['p50_us'] <= book['p99_us'] and book['bytes_per_resting_order'] > 0
+
+
+def test_main_writes_a_json_report(bench, tmp_path, monkeypatch, capsys):
+    output = tmp_path / "bench.json"
+    monkeypatch.setattr(sys, "argv", ["bench_matching.py", "--depths", "20", "--benches", "book",
+                                      "--ops", "50", "--output", str(output)])
+    bench.main()
+    report = json.loads(output.read_text())
+    assert report['meta']['args']['depths'] == [20]
+    assert [(row['bench'], row['depth'], row['ops']) for row in report['results']] == [('book', 20, 50)]
+
+
+def test_tick_bench(bench):
+    pytest.importorskip("flask_socketio")
+    rows = bench.bench_tick(20, 3, seed=1)
+    assert rows[0]['bench'] == 'tick' and rows[0]['ops'] == 3 and rows[0]['orders'] > 0
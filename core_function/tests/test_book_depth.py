@@ -0,0 +1,56 @@
+# test_book_depth.py
+"""Market-by-price depth: per-level aggregates and the cached depth view"""
+
+from datetime import datetime, timedelta
+
+from order_book import Order, OrderBook
+
+T0 = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def order(order_id, side, price, qty, seconds=0) -> Order:
+    return Order(order_id, side, price, qty, T0 + timedelta(seconds=seconds), f"u-{order_id}")
+
+
+def rest(book: OrderBook, *orders):
+    fills = []
+    for o in orders:
+        book.submit(o, fills)
+    return fills
+
+
+def test_levels_aggregate_qty_and_count_best_first():
+    book = OrderBook()
+    rest(book, order("b1", "buy", 0.20, 5), order("b2", "buy", 0.22, 3), order("b3", "buy", 0.20, 4),
+         order("s1", "sell", 0.30, 2), order("s2", "sell", 0.25, 6))
+    assert book.bids.depth() == [(0.22, 3, 1), (0.20, 9, 2)]
+    assert book.asks.depth() == [(0.25, 6, 1), (0.30, 2, 1)]
+    assert book.bids.depth(1) == [(0.22, 3, 1)]
+
+
+def test_aggregates_follow_fills_cancels_and_amendments():
+    book = OrderBook()
+    rest(book, order("s1", "sell", 0.25, 5), order("s2", "sell", 0.25, 5), order("s3", "sell", 0.30, 1))
+    assert book.asks.depth() == [(0.25, 10, 2), (0.30, 1, 1)]
+    rest(book, order("b1", "buy", 0.25, 7, seconds=1))   # fills s1, partially fills s2
+    assert book.asks.depth() == [(0.25, 3, 1), (0.30, 1, 1)]
+    book.amend("s2", qty=2)
+    assert book.asks.depth() == [(0.25, 2, 1), (0.30, 1, 1)]
+    book.cancel("s2")
+    assert book.asks.depth() == [(0.30, 1, 1)]
+    book.amend("s3", price=0.28)
+    assert book.asks.depth() == [(0.28, 1, 1)]
+
+
+def test_cache_is_reused_until_the_side_changes():
+    book = OrderBook()
+    rest(book, order("b1", "buy", 0.20, 5), order("b2", "buy", 0.21, 5))
+    assert book.bids.depth() == [(0.21, 5, 1), (0.20, 5, 1)]
+    cached = book.bids._depth_cache
+    book.bids.depth()
+    assert book.bids._depth_cache is cached
+    rest(book, order("b3", "buy", 0.19, 1))
+    assert book.bids.depth() == [(0.21, 5, 1), (0.20, 5, 1), (0.19, 1, 1)]
+    assert book.bids._depth_cache is not cached
+    # A smaller request than the cached one is served from it
+    assert book.bids.depth(2) == [(0.21, 5, 1), (0.20, 5, 1)]
@@ -0,0 +1,81 @@
+# test_call_auction.py
+"""Uniform-price clearing of delivery intervals (call_auction.CallAuction)"""
+
+from datetime import datetime
+
+import numpy as np
+
+from call_auction import INTERVAL_SECONDS, CallAuction, clearing_price, delivery_interval
+from market_registry import Market
+from order_book import Order
+
+INTERVAL = delivery_interval(1_000_000.0)
+
+
+def order(order_id, side, price, qty, **kwargs) -> Order:
+    return Order(order_id, side, price, qty, datetime.fromtimestamp(INTERVAL + 1), f"u-{order_id}", **kwargs)
+
+
+def test_clearing_price_maximises_volume():
+    price, volume = clearing_price(np.array([0.30, 0.25, 0.20]), np.array([5.0, 5.0, 5.0]),
+                                   np.array([0.18, 0.24, 0.28]), np.array([5.0, 5.0, 5.0]))
+    assert volume == 10.0
+    assert 0.24 <= price <= 0.25
+
+
+def test_no_cross_no_price():
+    price, volume = clearing_price(np.array([0.10]), np.array([5.0]), np.array([0.20]), np.array([5.0]))
+    assert price is None and volume == 0
+
+
+def test_clear_fills_everyone_at_one_price():
+    auction = CallAuction()
+    for o in (order("b1", "buy", 0.30, 5), order("b2", "buy", 0.25, 5), order("b3", "buy", 0.10, 5),
+              order("s1", "sell", 0.18, 4), order("s2", "sell", 0.24, 4)):
+        auction.add(o)
+    assert auction.due(INTERVAL + INTERVAL_SECONDS - 1) == []
+    assert auction.due(INTERVAL + INTERVAL_SECONDS) == [INTERVAL]
+
+    result = auction.clear(INTERVAL, INTERVAL + INTERVAL_SECONDS)
+    assert result.volume == 8.0
+    assert {f.price for f in result.fills} == {result.price}
+    assert all(f.aggressor == 'auction' for f in result.fills)
+    assert sum(f.qty for f in result.fills) == result.volume
+    left = {o.order_id: o.qty for o in result.orders}
+    assert left["s1"] == 0 and left["s2"] == 0 and left["b3"] == 5
+    assert len(auction) == 0
+
+
+def test_expired_orders_do_not_clear():
+    auction = CallAuction()
+    auction.add(order("b1", "buy", 0.30, 5, tif='GTD', expires_at=INTERVAL + 60))
+    auction.add(order("s1", "sell", 0.20, 5))
+    assert [o.order_id for o in auction.expire(INTERVAL + 60)] == ["b1"]
+    result = auction.clear(INTERVAL, INTERVAL + INTERVAL_SECONDS)
+    assert result.fills == [] and result.price is None
+
+
+def test_auction_market_reports_closed_orders():
+    market = Market(auction_mode=True)
+    market.enqueue([order("b1", "buy", 0.30, 5), order("s1", "sell", 0.20, 3),
+                    order("b2", "buy", 0.40, 2, tif='GTD', expires_at=INTERVAL + 60)])
+    with market.lock:
+        assert market.locked_tick(INTERVAL + 10).fills == []
+        expired = market.locked_tick(INTERVAL + 60).closed
+        tick = market.locked_tick(INTERVAL + INTERVAL_SECONDS)
+    assert [(o.order_id, o.status) for o in expired] == [("b2", 'expired')]
+    assert len(tick.auctions) == 1 and tick.auctions[0].volume == 3
+    assert {(o.order_id, o.status) for o in tick.closed} == {("b1", 'unfilled'), ("s1", 'filled')}
+    assert market.is_empty()
+
+
+def test_delivery_market_clears_its_own_interval():
+    delivery = INTERVAL + 4 * INTERVAL_SECONDS
+    market = Market("north", delivery, auction_mode=True)
+    # Timestamped in an earlier interval, submitted for this market's delivery
+    market.enqueue([order("b1", "buy", 0.30, 5), order("s1", "sell", 0.20, 5)])
+    with market.lock:
+        assert market.locked_tick(INTERVAL + INTERVAL_SECONDS).auctions == []
+        assert market.call_auction.orders == {"b1": delivery, "s1": delivery}
+        tick = market.locked_tick(delivery + INTERVAL_SECONDS)
+    assert [r.interval for r in tick.auctions] == [delivery] and tick.auctions[0].volume == 5
@@ -0,0 +1,97 @@
+# test_chain_network.py
+"""PeerNode replication over loopback: header-first sync, announcements, peer learning"""
+
+import time
+
+import pytest
+
+from block_chain_templates import Blockchain, ProofOfWork
+from chain_network import PeerNode
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def nodes():
+    started = []
+
+    def make() -> PeerNode:
+        node = PeerNode(Blockchain(consensus=ProofOfWork(1)), timeout=2.0)
+        node.start()
+        started.append(node)
+        return node
+
+    yield make
+    for node in started:
+        node.stop()
+
+
+def mine(node: PeerNode, blocks: int):
+    for _ in range(blocks):
+        node.blockchain.mine_pending_transactions()
+
+
+def test_sync_adopts_the_longer_chain(nodes):
+    a, b = nodes(), nodes()
+    mine(a, 3)
+    assert b.sync_with(a.address)
+    assert b.blockchain.height == a.blockchain.height == 4
+    assert b.blockchain.chain[-1].hash == a.blockchain.chain[-1].hash
+    assert b.blockchain.balances == a.blockchain.balances
+    assert not b.sync_with(a.address)
+
+
+def test_sync_resolves_a_fork_to_the_longest_chain(nodes):
+    a, b = nodes(), nodes()
+    mine(a, 3)
+    mine(b, 1)
+    assert b.sync_with(a.address)
+    assert [blk.hash for blk in b.blockchain.chain] == [blk.hash for blk in a.blockchain.chain]
+
+
+def test_announced_blocks_replicate_and_teach_the_origin(nodes):
+    a, b = nodes(), nodes()
+    a.add_peer(b.address)
+    mine(a, 2)
+    assert wait_for(lambda: b.blockchain.height == 3)
+    assert a.address in b.peers
+
+
+def test_unverified_announcements_do_not_add_peers(nodes):
+    b = nodes()
+    header = dict(b.blockchain.chain[-1].header(), index=5, hash="f" * 64)
+    for port in range(1, 200):
+        assert b.handle_message({"type": "announce", "header": header,
+                                 "origin": f"127.0.0.1:{port}"})["status"] == "ok"
+    assert b.peers == set()
+    assert b.handle_message({"type": "announce", "header": header})["status"] == "known"
+
+
+def test_malformed_announcements_are_rejected(nodes):
+    b = nodes()
+    for header in (None, [1], {"index": "5", "hash": "f" * 64, "previous_hash": "0"},
+                   {"index": True, "hash": "f" * 64, "previous_hash": "0"}):
+        assert "error" in b.handle_message({"type": "announce", "header": header, "origin": "127.0.0.1:1"})
+    assert "error" in b.handle_message(["announce"])
+    assert b._tasks.empty()
+
+
+@pytest.mark.parametrize("reply", [{"blocks": [1]}, {"blocks": {"0": {}}}, [], {"blocks": [{}]}])
+def test_worker_survives_malformed_replies(nodes, reply):
+    a, b = nodes(), nodes()
+    real_request = b.request
+    b.request = lambda peer, message: reply if peer == "127.0.0.1:1" else real_request(peer, message)
+    header = dict(b.blockchain.chain[-1].header(), index=1, hash="f" * 64)
+    b._tasks.put(("fetch", ("127.0.0.1:1", header)))
+    b._tasks.put(("sync", "127.0.0.1:1"))
+    # The worker keeps running and still replicates from an honest peer
+    a.add_peer(b.address)
+    mine(a, 1)
+    assert wait_for(lambda: b.blockchain.height == 2)
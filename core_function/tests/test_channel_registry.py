@@ -0,0 +1,82 @@
+# test_channel_registry.py
+"""QuantumChannelRegistry LRU eviction, dormant records and key rotation"""
+
+import time
+
+from block_chain_templates import QuantumChannelRegistry, QuantumHybridChannel
+
+
+def channel(a: str, b: str) -> QuantumHybridChannel:
+    return QuantumHybridChannel(a, b)
+
+
+def test_least_recently_used_channel_goes_dormant():
+    registry = QuantumChannelRegistry(max_active=2, idle_seconds=None)
+    for pair in (("a", "b"), ("a", "c"), ("a", "d")):
+        registry.add(channel(*pair))
+    assert registry.active_count == 2 and registry.dormant_count == 1
+    assert ("a", "b") in registry and registry.evictions == 1
+
+    registry.get(("a", "c"))
+    registry.add(channel("a", "e"))
+    assert registry.dormant_count == 2
+    assert registry.get(("a", "c")) is not None and registry.active_count == 2
+
+
+def test_payloads_decrypt_after_eviction():
+    registry = QuantumChannelRegistry(max_active=1, idle_seconds=None)
+    original = channel("a", "b")
+    registry.add(original)
+    envelope = original.encrypt(b"trade")
+    registry.add(channel("c", "d"))
+
+    revived = registry.get(("a", "b"))
+    assert revived is not original
+    assert revived.channel_id == original.channel_id
+    assert revived.session_key != original.session_key
+    assert revived.decrypt(envelope) == b"trade"
+
+
+def test_dormant_records_are_bounded():
+    registry = QuantumChannelRegistry(max_active=1, idle_seconds=None, max_dormant=2)
+    for peer in "bcde":
+        registry.add(channel("a", peer))
+    assert len(registry) == 3 and registry.dropped == 1
+    assert ("a", "b") not in registry
+
+
+def test_idle_channels_are_evicted():
+    registry = QuantumChannelRegistry(max_active=10, idle_seconds=0.05)
+    registry.add(channel("a", "b"))
+    time.sleep(0.1)
+    registry.add(channel("a", "c"))
+    assert registry.active_count == 1 and registry.dormant_count == 1
+
+
+def test_acquire_rotates_after_the_message_budget():
+    registry = QuantumChannelRegistry(rotate_after_messages=2, rotate_after_seconds=None)
+    live = channel("a", "b")
+    registry.add(live)
+    sealed = [registry.acquire(("a", "b")).encrypt(bytes([i])) for i in range(5)]
+    assert registry.rotations == 2 and live.key_epoch == 2
+    assert [live.decrypt(envelope) for envelope in sealed] == [bytes([i]) for i in range(5)]
+
+
+def test_unused_keys_are_not_kept():
+    live = channel("a", "b")
+    live.rotate_key()
+    live.rotate_key()
+    assert list(live.key_history) == [2]
+
+
+def test_states_round_trip_through_dormant_records():
+    registry = QuantumChannelRegistry(max_active=1, idle_seconds=None)
+    first = channel("a", "b")
+    registry.add(first)
+    envelope = first.encrypt(b"x")
+    registry.add(channel("c", "d"))
+
+    restored = QuantumChannelRegistry()
+    restored.load_states(registry.states())
+    assert restored.active_count == 0 and restored.dormant_count == 2
+    assert restored.get(("a", "b")).decrypt(envelope) == b"x"
@@ -0,0 +1,128 @@
+# test_consensus.py
+"""Pluggable consensus: PoW mining, PoA sealing and cross-node seal checks"""
+
+import pytest
+
+from block_chain_templates import (
+    Blockchain, ProofOfAuthority, ProofOfWork, QuantumParticipant, Transaction, MINING_REWARD
+)
+
+
+def poa_chain(sealer: QuantumParticipant, authorities=None) -> Blockchain:
+    return Blockchain(consensus=ProofOfAuthority(sealer, authorities))
+
+
+def test_pow_seal_meets_the_difficulty():
+    chain = Blockchain(consensus=ProofOfWork(2))
+    chain.mine_pending_transactions()
+    block = chain.chain[-1]
+    assert block.hash.startswith("00") and block.hash == block.calculate_hash()
+    assert chain.is_chain_valid()
+
+
+def test_pow_rejects_an_unmined_block():
+    chain = Blockchain(consensus=ProofOfWork(3))
+    chain.mine_pending_transactions()
+    block = chain.chain[-1]
+    while block.hash.startswith("000"):
+        block.nonce += 1
+        block.hash = block.calculate_hash()
+    assert not chain.is_chain_valid()
+
+
+def test_poa_seals_without_mining():
+    sealer = QuantumParticipant("sealer-a")
+    chain = poa_chain(sealer)
+    chain.mine_pending_transactions()
+    block = chain.chain[-1]
+    assert block.nonce == 0
+    assert block.sealer == "sealer-a" and block.seal_signature
+    assert chain.is_chain_valid()
+
+
+def test_poa_verifies_a_foreign_seal_by_public_key():
+    sealer_a, sealer_b = QuantumParticipant("sealer-a"), QuantumParticipant("sealer-b")
+    node_a = poa_chain(sealer_a)
+    node_a.mine_pending_transactions()
+    block = node_a.chain[-1]
+
+    trusting = poa_chain(sealer_b, {"sealer-a": sealer_a.address})
+    assert trusting.consensus.verify(block, trusting)
+    assert trusting.receive_block(block)
+    assert trusting.balances == {"miner_address": MINING_REWARD}
+
+    # Unknown authority, or a label pinned to another key
+    assert not poa_chain(sealer_b).consensus.verify(block, node_a)
+    impostor = QuantumParticipant("sealer-a")
+    pinned = poa_chain(sealer_b, {"sealer-a": impostor.address})
+    assert not pinned.consensus.verify(block, pinned)
+
+
+def test_poa_rejects_a_forged_seal():
+    sealer_a = QuantumParticipant("sealer-a")
+    node = poa_chain(sealer_a)
+    node.mine_pending_transactions()
+    block = node.chain[-1]
+    block.seal_signature = QuantumParticipant("other").signing_key.sign(block.hash.encode())
+    assert not node.is_chain_valid()
+
+
+def test_poa_authority_key_must_match_the_local_sealer():
+    sealer = QuantumParticipant("sealer-a")
+    with pytest.raises(ValueError):
+        ProofOfAuthority(sealer, {"sealer-a": QuantumParticipant("x").address})
+    with pytest.raises(ValueError):
+        ProofOfAuthority(sealer).revoke("sealer-a")
+
+
+def test_difficulty_comes_from_the_pow_engine():
+    assert Blockchain(consensus=ProofOfWork(2)).difficulty == 2
+    assert Blockchain(difficulty=2, consensus=ProofOfWork(2)).difficulty == 2
+    assert Blockchain(difficulty=2).consensus.difficulty == 2
+
+
+def test_conflicting_difficulty_raises():
+    with pytest.raises(ValueError):
+        Blockchain(difficulty=3, consensus=ProofOfWork(2))
+
+
+def test_signed_transactions_are_sealed_into_blocks():
+    chain = poa_chain(QuantumParticipant("sealer-a"))
+    tx = chain.create_quantum_transaction("Alice", "Bob", 5.0)
+    assert chain.add_transaction(tx)
+    chain.mine_pending_transactions()
+    assert [t.sender for t in chain.chain[-1].transactions] == ["network", "Alice"]
+    assert chain.is_chain_valid()
+    assert not chain.add_transaction(Transaction("network", "Bob", MINING_REWARD))
+
+
+def counted_seal_checks(chain: Blockchain) -> list:
+    checked = []
+    verify = chain.consensus.verify
+    chain.consensus.verify = lambda block, blockchain: checked.append(block.index) or verify(block, blockchain)
+    return checked
+
+
+def test_check_chain_validates_only_new_blocks():
+    chain = Blockchain(consensus=ProofOfWork(1))
+    for _ in range(3):
+        chain.mine_pending_transactions()
+    checked = counted_seal_checks(chain)
+    assert chain.check_chain() and checked == [1, 2, 3]
+    assert chain.check_chain() and checked == [1, 2, 3]
+    chain.mine_pending_transactions()
+    assert chain.check_chain() and checked == [1, 2, 3, 4]
+    # A bad block past the validated tip is still caught
+    chain.mine_pending_transactions()
+    chain.chain[-1].transactions[0].amount = 2 * MINING_REWARD
+    assert not chain.check_chain()
+
+
+def test_replace_chain_runs_the_full_check_once():
+    ours, theirs = Blockchain(consensus=ProofOfWork(1)), Blockchain(consensus=ProofOfWork(1))
+    for _ in range(3):
+        theirs.mine_pending_transactions()
+    checked = counted_seal_checks(ours)
+    assert ours.replace_chain(theirs.chain)
+    assert checked == [1, 2, 3]
+    assert ours.check_chain() and checked == [1, 2, 3]
@@ -0,0 +1,71 @@
+# test_event_bus.py
+"""EventBus dispatch order, wildcard subscribers, failure isolation and backpressure"""
+
+import threading
+
+from block_chain_templates import Blockchain, ProofOfWork
+from event_bus import EventBus
+
+
+def test_handlers_run_in_publish_order():
+    bus = EventBus()
+    seen = []
+    bus.subscribe("block", lambda topic, payload: seen.append(payload))
+    bus.subscribe("*", lambda topic, payload: seen.append((topic, payload)))
+    for i in range(3):
+        bus.publish("block", i)
+    bus.publish("transaction", "tx")
+    bus.flush()
+    assert seen == [0, ("block", 0), 1, ("block", 1), 2, ("block", 2), ("transaction", "tx")]
+    bus.close()
+
+
+def test_a_failing_handler_does_not_stop_the_others():
+    bus = EventBus()
+    seen = []
+
+    def broken(topic, payload):
+        raise RuntimeError("boom")
+
+    bus.subscribe("block", broken)
+    bus.subscribe("block", lambda topic, payload: seen.append(payload))
+    bus.publish("block", 1)
+    bus.flush()
+    assert seen == [1]
+    bus.unsubscribe("block", broken)
+    bus.close()
+
+
+def test_default_bus_never_drops():
+    bus = EventBus()
+    gate = threading.Event()
+    seen = []
+    bus.subscribe("block", lambda topic, payload: (gate.wait(), seen.append(payload)))
+    for i in range(200_000):
+        bus.publish("block", i)
+    gate.set()
+    bus.flush()
+    assert bus.dropped == 0 and len(seen) == 200_000
+    bus.close()
+
+
+def test_bounded_bus_drops_when_full():
+    bus = EventBus(max_pending=2)
+    gate = threading.Event()
+    bus.subscribe("block", lambda topic, payload: gate.wait())
+    for i in range(10):
+        bus.publish("block", i)
+    assert bus.dropped > 0
+    gate.set()
+    bus.flush()
+    bus.close()
+
+
+def test_blockchain_publishes_every_block():
+    chain = Blockchain(consensus=ProofOfWork(1))
+    heights = []
+    chain.events.subscribe("block", lambda topic, block: heights.append(block.index))
+    for _ in range(5):
+        chain.mine_pending_transactions()
+    chain.events.flush()
+    assert heights == [1, 2, 3, 4, 5]
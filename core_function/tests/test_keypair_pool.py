@@ -0,0 +1,56 @@
+# test_keypair_pool.py
+"""KeypairPool background generation and bulk wallet creation"""
+
+import time
+
+import pytest
+
+from wallet_crypto import KeypairPool
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_take_generates_inline_when_empty_and_refills_in_background():
+    pool = KeypairPool(size=8, low_water=4)
+    keys = pool.take_many(3)
+    assert len(keys) == 3 and pool.generated_inline == 3
+    assert wait_for(lambda: len(pool) == 8)
+    assert len(pool.take_many(5)) == 5 and pool.generated_inline == 3
+    assert wait_for(lambda: len(pool) == 8)
+
+
+def test_keys_are_distinct():
+    pool = KeypairPool(size=16)
+    pool.fill()
+    keys = pool.take_many(32)
+    assert len({key.to_string() for key in keys}) == 32
+
+
+def test_create_wallets_uses_pooled_keys():
+    pool = KeypairPool(size=4, low_water=1)
+    pool.fill()
+    pooled = {key.to_string() for key in pool._keys}
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"), keypair_pool=pool)
+    wallets = manager.create_wallets([(f"u{i}", f"h{i}") for i in range(4)])
+    assert {w.private_key.to_string() for w in wallets} == pooled
+    assert [manager.get_wallet(f"u{i}") for i in range(4)] == wallets
+
+
+def test_create_wallets_is_all_or_nothing():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallet("taken", "h-taken")
+    with pytest.raises(ValueError):
+        manager.create_wallets([("new", "h-new"), ("taken", "h-other")])
+    with pytest.raises(ValueError):
+        manager.create_wallets([("a", "h-same"), ("b", "h-same")])
+    assert sorted(manager.wallets) == ["taken"]
+    assert manager.get_wallet_by_huawei_id("h-new") is None
@@ -0,0 +1,73 @@
+# test_ledger_checkpoint.py
+"""Checkpoint, block log replay and pruning through ledger_checkpoint.CheckpointStore"""
+
+import json
+
+from block_chain_templates import Blockchain, ProofOfWork
+from ledger_checkpoint import CheckpointStore
+
+
+def open_chain(directory, interval: int = 2, prune: bool = False) -> Blockchain:
+    return Blockchain(consensus=ProofOfWork(1), checkpoint_store=CheckpointStore(directory),
+                      checkpoint_interval=interval, prune_on_checkpoint=prune)
+
+
+def grow(chain: Blockchain, blocks: int):
+    for _ in range(blocks):
+        assert chain.add_transaction(chain.create_quantum_transaction("Alice", "Bob", 1.5))
+        chain.mine_pending_transactions()
+    chain.checkpoint_events.flush()
+
+
+def restart(directory) -> Blockchain:
+    store = CheckpointStore(directory)
+    chain = Blockchain(consensus=ProofOfWork(1))
+    assert chain.restore_checkpoint(store.latest(), store.logged_blocks())
+    return chain
+
+
+def test_checkpoints_every_interval_and_compacts_the_log(tmp_path):
+    chain = open_chain(tmp_path)
+    grow(chain, 5)
+    store = chain.checkpoint_store
+    checkpoint = store.latest()
+    assert checkpoint["height"] == 5 and checkpoint["hash"] == chain.block_at(4).hash
+    assert [b.index for b in store.logged_blocks()] == [5]
+
+
+def test_restart_replays_the_log_after_the_checkpoint(tmp_path):
+    chain = open_chain(tmp_path)
+    grow(chain, 5)
+    restored = restart(tmp_path)
+    assert restored.height == chain.height
+    assert restored.chain[-1].hash == chain.chain[-1].hash
+    assert restored.balances == chain.balances
+    assert restored.balances["Bob"] == 7.5
+    # Restoring checked the replayed blocks; read paths start from its tip
+    assert restored._validated == (restored.chain[-1].index, restored.chain[-1].hash)
+
+
+def test_checkpoints_hold_public_keys_only(tmp_path):
+    chain = open_chain(tmp_path)
+    grow(chain, 2)
+    alice = chain.quantum_participants["Alice"]
+    text = (sorted(tmp_path.glob("checkpoint_*.json"))[-1]).read_text()
+    assert alice.signing_key.to_string().hex() not in text
+    identities = {entry["label"]: entry["public_key"] for entry in json.loads(text)["identities"]}
+    assert identities["Alice"] == alice.address
+
+
+def test_prune_archives_blocks_before_the_checkpoint(tmp_path):
+    chain = open_chain(tmp_path, prune=True)
+    grow(chain, 4)
+    store = chain.checkpoint_store
+    assert chain.chain[0].index == 4 and chain.height == 5
+    assert [b.index for b in store.archived_blocks()] == [0, 1, 2, 3]
+    assert chain.is_chain_valid()
+    assert chain.blocks_from(0, 10)[0].index == 4
+
+
+def test_old_checkpoints_are_rotated(tmp_path):
+    chain = open_chain(tmp_path, interval=1)
+    grow(chain, 5)
+    assert len(list(tmp_path.glob("checkpoint_*.json"))) == chain.checkpoint_store.keep
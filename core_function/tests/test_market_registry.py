@@ -0,0 +1,123 @@
+# test_market_registry.py
+"""MarketRegistry: the order index behind find(), limits on new markets and pruning"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+from call_auction import INTERVAL_SECONDS
+from market_registry import DELIVERY_HORIZON, MarketRegistry
+from order_book import Order
+
+
+def order(order_id, side="buy", price=0.25, qty=5) -> Order:
+    return Order(order_id, side, price, qty, datetime.now(), f"u-{order_id}")
+
+
+def tick(market, now=None):
+    with market.lock:
+        return market.locked_tick(time.time() if now is None else now)
+
+
+def test_find_is_an_index_lookup():
+    registry = MarketRegistry()
+    zone = registry.get_or_create("north", None)
+    registry.enqueue(zone, [order("n1")])
+    registry.enqueue(registry.default, [order("d1"), order("d2", side="sell", price=0.3)])
+    assert registry.find("n1") is zone
+    assert registry.find("d2") is registry.default
+    assert registry.find("missing") is None
+    tick(zone)
+    with zone.lock:
+        zone.locked_cancel("n1")
+    assert registry.find("n1") is zone  # archived orders stay findable
+
+
+def test_sweep_drops_orders_that_left_the_archive():
+    registry = MarketRegistry(index_size=4)
+    market = registry.default
+    market.order_book._archive_size = 2
+    for i in range(4):
+        registry.enqueue(market, [order(f"o{i}")])
+        tick(market)
+        with market.lock:
+            market.locked_cancel(f"o{i}")
+    registry.enqueue(market, [order("live")])
+    # o0 and o1 were evicted from the archive; the sweep forgets them
+    assert registry.find("o0") is None and registry.find("o1") is None
+    assert registry.find("o3") is market and registry.find("live") is market
+    assert len(registry._order_markets) == 3
+
+
+def test_prune_drops_delivered_empty_markets():
+    registry = MarketRegistry()
+    start = time.time() - 2 * INTERVAL_SECONDS
+    market = registry.get_or_create("north", start)
+    registry.enqueue(market, [order("late")])
+    now = time.time()
+    assert registry.prune(now) == []   # still holds an order
+    closed = tick(market, now).closed
+    assert [o.order_id for o in closed] == ["late"] and closed[0].status == 'expired'
+    assert registry.prune(now) == [market.name]
+    assert market.retired and registry.find("late") is None
+
+
+def test_enqueue_on_a_pruned_market_uses_a_fresh_one():
+    registry = MarketRegistry()
+    start = time.time() - 2 * INTERVAL_SECONDS
+    stale = registry.get_or_create("north", start)
+    assert registry.prune(time.time()) == [stale.name]
+    assert not stale.enqueue([order("x")])
+
+    market = registry.enqueue(stale, [order("y")])
+    assert market is not stale and market.name == stale.name
+    assert registry.get(stale.name) is market and registry.find("y") is market
+    # The interval is over, so its first tick hands the order back for release
+    assert [o.order_id for o in tick(market).closed] == ["y"]
+
+
+@pytest.mark.parametrize("zone", [" ", "a" * 33, "north@2025", "nörth", 7])
+def test_malformed_zones_are_rejected(zone):
+    registry = MarketRegistry()
+    with pytest.raises(ValueError):
+        registry.get_or_create(zone, None)
+    assert len(registry) == 1
+
+
+def test_configured_zones_and_delivery_horizon():
+    registry = MarketRegistry(zones=["north", "south"])
+    assert registry.get_or_create(None, None) is registry.default
+    assert registry.get_or_create("north", time.time() + 3600).zone == "north"
+    with pytest.raises(ValueError, match="unknown zone"):
+        registry.get_or_create("east", None)
+    with pytest.raises(ValueError, match="ahead"):
+        registry.get_or_create("north", time.time() + DELIVERY_HORIZON + 2 * INTERVAL_SECONDS)
+    assert len(registry) == 2
+
+
+def test_market_cap_counts_open_markets():
+    registry = MarketRegistry(max_markets=3)
+    markets = [registry.get_or_create(f"z{i}", None) for i in range(2)]
+    with pytest.raises(ValueError, match="too many"):
+        registry.get_or_create("z2", None)
+    assert registry.get_or_create("z1", None) is markets[1]
+    # Queuing on a market pruned meanwhile still finds a home past the cap
+    registry.idle_seconds = 0
+    assert registry.prune(time.time()) == ["z0", "z1"]
+    registry.get_or_create("z2", None)
+    registry.get_or_create("z3", None)
+    assert registry.enqueue(markets[0], [order("o")]).name == "z0"
+    assert len(registry) == 4
+
+
+def test_prune_drops_idle_zone_markets():
+    registry = MarketRegistry(idle_seconds=60)
+    idle, busy = registry.get_or_create("idle", None), registry.get_or_create("busy", None)
+    registry.enqueue(busy, [order("rest")])
+    tick(busy)
+    now = time.time()
+    assert registry.prune(now) == []
+    # Idle and empty goes; a resting order or recent orders keep a market open
+    assert registry.prune(now + 61) == ["idle"]
+    assert idle.retired and registry.get("busy") is busy and registry.get("default") is registry.default
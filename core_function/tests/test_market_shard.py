@@ -0,0 +1,136 @@
+# test_market_shard.py
+"""ShardedMarket round trips: pooled shard processes must match exactly like an in-process Market"""
+
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from market_registry import Market
+from market_shard import ShardedMarket, ShardPool
+from order_book import Order
+
+T0 = 1_000_000.0
+
+
+def order(order_id, side, price, qty, at=0.0, **kwargs) -> Order:
+    return Order(order_id, side, price, qty, datetime.fromtimestamp(T0 + at), f"u-{order_id}", **kwargs)
+
+
+def flow():
+    return [order("s1", "sell", 0.20, 5), order("s2", "sell", 0.22, 5, at=0.1),
+            order("b1", "buy", 0.21, 3, at=0.2), order("b2", "buy", 0.25, 6, at=0.3),
+            order("b3", "buy", 0.19, 4, at=0.4), order("s3", "sell", 0.19, 2, at=0.5, tif='IOC')]
+
+
+def drain(market, now: float):
+    with market.lock:
+        return market.locked_tick(now)
+
+
+@pytest.fixture
+def pool():
+    pool = ShardPool(2)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def sharded(pool):
+    market = ShardedMarket(pool=pool)
+    yield market
+    market.close()
+
+
+def test_same_fills_and_top_as_in_process(sharded):
+    local = Market()
+    for market in (local, sharded):
+        market.enqueue(flow())
+    expected, got = drain(local, T0 + 1), drain(sharded, T0 + 1)
+    key = lambda fills: [(f.buy_order_id, f.sell_order_id, f.price, f.qty, f.aggressor) for f in fills]
+    assert key(got.fills) == key(expected.fills)
+    assert sorted(o.order_id for o in got.closed) == sorted(o.order_id for o in expected.closed)
+    assert sharded.top_of_book() == local.top_of_book()
+    assert sharded.open_orders.keys() == local.order_book.orders.keys()
+
+
+def test_cancel_and_amend_round_trip(sharded):
+    sharded.enqueue([order("b1", "buy", 0.20, 5), order("b2", "buy", 0.18, 5)])
+    drain(sharded, T0 + 1)
+    with sharded.lock:
+        assert sharded.locked_cancel("b1").status == 'cancelled'
+        assert sharded.locked_cancel("b1") is None
+        assert sharded.locked_amend("b2", 0.19, 3).qty == 3
+        sharded._sync()
+    top = sharded.top_of_book()
+    assert (top['best_bid'], top['bid_qty'], top['total_bids']) == (0.19, 3, 1)
+
+
+def test_fills_come_back_with_their_tick(sharded):
+    sharded.enqueue([order("b1", "buy", 0.20, 5), order("s1", "sell", 0.20, 5)])
+    assert not sharded.is_empty()
+    tick = drain(sharded, T0 + 1)
+    assert [(f.buy_order_id, f.sell_order_id, f.qty) for f in tick.fills] == [("b1", "s1", 5)]
+    assert tick.incoming == 2 and sharded.is_empty()
+    assert drain(sharded, T0 + 2).fills == []
+
+
+def test_markets_share_a_bounded_pool(pool):
+    markets = [ShardedMarket(f"zone-{i}", pool=pool) for i in range(5)]
+    try:
+        assert len(pool.processes) == 2
+        assert sorted(p.markets for p in pool.processes) == [2, 3]
+        for i, market in enumerate(markets):
+            market.enqueue([order(f"s{i}", "sell", 0.20, 1 + i), order(f"b{i}", "buy", 0.30, 1 + i, at=0.1)])
+        for i, market in enumerate(markets):
+            assert [(f.sell_order_id, f.qty) for f in drain(market, T0 + 1).fills] == [(f"s{i}", 1 + i)]
+    finally:
+        for market in markets:
+            market.close()
+    assert sorted(p.markets for p in pool.processes) == [0, 0]
+
+
+def test_small_rings_carry_larger_ticks(pool):
+    market = ShardedMarket(pool=pool, capacity=8)
+    try:
+        market.enqueue([order(f"s{i}", "sell", 0.20, 1, at=i * 0.01) for i in range(40)])
+        market.enqueue([order("b1", "buy", 0.25, 40, at=1)])
+        tick = drain(market, T0 + 2)
+        assert len(tick.fills) == 40 and [o.order_id for o in tick.closed] == []
+        assert market.open_orders == {}
+    finally:
+        market.close()
+
+
+def test_pool_exit_hook_closes_open_markets():
+    pool = ShardPool(1)
+    kept, pruned = ShardedMarket("kept", pool=pool), ShardedMarket("pruned", pool=pool)
+    pruned.close()
+    del pruned
+    assert list(pool.markets) == [kept]
+    pool.close()
+    assert kept._closed and pool.processes == []
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc")
+def test_idle_shard_process_sleeps(sharded):
+    sharded.enqueue([order("b1", "buy", 0.20, 5)])
+    drain(sharded, T0 + 1)
+
+    def cpu_ticks():
+        with open(f"/proc/{sharded.process.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[11]) + int(fields[12])  # utime + stime
+
+    before = cpu_ticks()
+    time.sleep(0.5)
+    assert cpu_ticks() - before <= 2   # a busy-polling shard would burn ~50 ticks here
+
+
+def test_dead_shard_is_reported(sharded):
+    sharded.process.kill()
+    sharded.process.wait()
+    with pytest.raises(RuntimeError):
+        with sharded.lock:
+            sharded.locked_tick(T0 + 1)
@@ -0,0 +1,66 @@
+# test_market_statistics.py
+"""Running market aggregates agree with a full recount of wallets and trades"""
+
+from datetime import datetime
+
+from order_book import Fill, Order
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+
+def recount(manager: WalletManager) -> dict:
+    wallets = manager.wallets.values()
+    trades = manager.completed_p2p_trades
+    volume = sum(t['energy_kwh'] for t in trades)
+    value = sum(t['total_cost'] for t in trades)
+    return {
+        'total_wallets': len(manager.wallets),
+        'total_energy_in_system_kwh': round(sum(w.energy_balance for w in wallets), 2),
+        'total_fiat_in_system_usd': round(sum(w.fiat_balance for w in wallets), 2),
+        'completed_trades': len(trades),
+        'total_energy_traded_kwh': round(volume, 2),
+        'total_value_traded_usd': round(value, 2),
+        'average_price_per_kwh': round(value / volume if volume else 0.0, 4),
+    }
+
+
+def current(manager: WalletManager) -> dict:
+    stats = manager.get_market_statistics()
+    del stats['timestamp'], stats['active_offers']
+    return stats
+
+
+def test_empty_market():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    assert current(manager) == recount(manager)
+    assert current(manager)['average_price_per_kwh'] == 0.0
+
+
+def test_aggregates_follow_every_balance_path():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("a", "h-a"), ("b", "h-b"), ("c", "h-c")])
+    manager.get_wallet("a").connect_huawei_smart_home("h-a")
+    assert manager.sync_huawei_energy_data("a", produced_kwh=40.0, consumed_kwh=2.5)
+    manager.get_wallet("b").add_energy(12.0)
+    manager.get_wallet("c").deduct_fiat(30.0)
+    assert current(manager) == recount(manager)
+
+    assert manager.execute_p2p_energy_trade("a", "b", 10.0, 0.25)[0]
+    assert manager.execute_p2p_energy_trade("b", "c", 4.0, 0.40)[0]
+    assert not manager.execute_p2p_energy_trade("c", "a", 100.0, 0.1)[0]
+    assert current(manager) == recount(manager)
+    assert current(manager)['average_price_per_kwh'] == round((2.5 + 1.6) / 14.0, 4)
+
+
+def test_exchange_settlement_updates_aggregates():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("buyer", "h-b"), ("seller", "h-s")])
+    manager.get_wallet("seller").add_energy(10.0)
+    assert manager.reserve("seller", energy_kwh=5.0)[0]
+    assert manager.reserve("buyer", fiat=5.0 * 0.3)[0]
+    now = datetime.now()
+    bid = Order("b1", "buy", 0.3, 5, now, "buyer")
+    ask = Order("s1", "sell", 0.25, 5, now, "seller")
+    fill = Fill(bid, ask, 0.25, 5, 0.25, False, now.timestamp())
+    assert manager.settle_order_fills([fill])[0]['status'] == 'completed'
+    assert current(manager) == recount(manager)
@@ -0,0 +1,60 @@
+# test_matching.py
+"""OrderBook matching: buyer/seller attribution per fill and the recent-volume window"""
+
+from datetime import datetime, timedelta
+
+import order_book
+from order_book import Order, OrderBook, match_transaction, process_and_rank_orders
+
+T0 = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def order(order_id, side, price, qty, user, seconds=0) -> Order:
+    return Order(order_id, side, price, qty, T0 + timedelta(seconds=seconds), user)
+
+
+def parties(fills):
+    return [(f.buyer_id, f.seller_id, f.buy_order_id, f.sell_order_id, f.price, f.qty, f.aggressor)
+            for f in fills]
+
+
+def test_sweep_attributes_each_fill_to_its_resting_seller():
+    book = OrderBook()
+    fills = []
+    for o in (order("s1", "sell", 0.20, 3, "ann"), order("s2", "sell", 0.21, 3, "ben"),
+              order("s3", "sell", 0.20, 2, "cat", seconds=1)):
+        assert book.submit(o, fills) is None
+    book.submit(order("b1", "buy", 0.25, 7, "dan", seconds=2), fills)
+    assert parties(fills) == [
+        ("dan", "ann", "b1", "s1", 0.20, 3, 'buy'),
+        ("dan", "cat", "b1", "s3", 0.20, 2, 'buy'),
+        ("dan", "ben", "b1", "s2", 0.21, 2, 'buy'),
+    ]
+    assert book.get("s2").qty == 1 and book.get("b1").status == 'filled'
+
+
+def test_incoming_sell_is_the_aggressor():
+    book = OrderBook()
+    fills = []
+    book.submit(order("b1", "buy", 0.30, 4, "dan"), fills)
+    book.submit(order("s1", "sell", 0.25, 4, "ann", seconds=1), fills)
+    assert parties(fills) == [("dan", "ann", "b1", "s1", 0.25, 4, 'sell')]
+
+
+def test_legacy_match_transaction_trades_at_the_ask():
+    book = process_and_rank_orders([(T0.isoformat(), 0.30, 5, 'buy', 'dan'),
+                                    (T0.isoformat(), 0.20, 3, 'sell', 'ann')])
+    outcome = match_transaction(book, True)
+    assert outcome['transaction_price'] == 0.20 and outcome['market_price'] == 0.20
+    assert book['bids'] == [(0.30, 2, T0, 'dan')] and book['asks'] == []
+
+
+def test_recent_trades_keep_only_the_volume_window():
+    order_book.transacted_orders.clear()
+    now = datetime.now()
+    order_book.record_transaction(0.2, 5.0, now - timedelta(minutes=10))
+    order_book.record_transaction(0.2, 3.0, now - timedelta(minutes=1))
+    order_book.record_transaction(0.2, 2.0, now)
+    assert len(order_book.transacted_orders) == 2
+    assert order_book.volume_in_last_5min(now + timedelta(seconds=1)) == 5.0
+    order_book.transacted_orders.clear()
@@ -0,0 +1,80 @@
+# test_offer_book.py
+"""P2POfferBook price/expiry indexes and the WalletManager offer flow"""
+
+import pytest
+
+from wallet_history import HistoryArchive
+from wallet_manager import P2POfferBook, WalletManager
+
+
+def offer(offer_id: str, price: float, expires: float) -> dict:
+    return {'offer_id': offer_id, 'price_per_kwh': price, 'expiry_timestamp': expires, 'status': 'pending'}
+
+
+def test_active_offers_are_cheapest_first():
+    book = P2POfferBook()
+    for offer_id, price in (("a", 0.30), ("b", 0.10), ("c", 0.20), ("d", 0.10)):
+        book.add(offer(offer_id, price, 100.0))
+    assert [o['offer_id'] for o in book.active()] == ["b", "d", "c", "a"]
+
+
+def test_claimed_offers_leave_the_price_index_until_released():
+    book = P2POfferBook()
+    book.add(offer("a", 0.1, 100.0))
+    book.add(offer("b", 0.2, 100.0))
+    book.claim("a")
+    assert book.active_count == 1 and book.get("a")['status'] == 'accepting'
+    book.release("a")
+    assert [o['offer_id'] for o in book.active()] == ["a", "b"]
+
+
+def test_expire_only_touches_due_pending_offers():
+    book = P2POfferBook()
+    book.add(offer("due", 0.1, 10.0))
+    book.add(offer("inflight", 0.1, 10.0))
+    book.add(offer("later", 0.1, 50.0))
+    book.claim("inflight")
+    assert book.expire(20.0) == 1
+    assert book.get("due") is None and book.archive[-1]['status'] == 'expired'
+    assert book.get("inflight")['status'] == 'accepting'
+    assert [o['offer_id'] for o in book.active()] == ["later"]
+
+
+def test_archive_is_bounded():
+    book = P2POfferBook(archive_size=3)
+    for i in range(10):
+        book.add(offer(str(i), 0.1, 100.0))
+        book.close(str(i), 'completed')
+    assert len(book) == 0 and [o['offer_id'] for o in book.archive] == ["7", "8", "9"]
+
+
+@pytest.fixture
+def manager():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("seller", "h-s"), ("buyer", "h-b")])
+    manager.get_wallet("seller").add_energy(20.0)
+    return manager
+
+
+def test_accepting_an_offer_executes_the_trade(manager):
+    ok, _, offer_id = manager.create_p2p_trade_offer("seller", 5.0, 0.2)
+    assert ok
+    assert [o['offer_id'] for o in manager.get_active_offers()] == [offer_id]
+    ok, message, trade = manager.accept_p2p_trade_offer(offer_id, "buyer")
+    assert ok, message
+    assert trade['energy_kwh'] == 5.0 and manager.get_wallet("buyer").energy_balance == 5.0
+    assert manager.get_active_offers() == []
+    assert not manager.accept_p2p_trade_offer(offer_id, "buyer")[0]
+
+
+def test_failed_acceptance_puts_the_offer_back(manager):
+    ok, _, offer_id = manager.create_p2p_trade_offer("seller", 5.0, 1000.0)
+    ok, message, _ = manager.accept_p2p_trade_offer(offer_id, "buyer")
+    assert not ok and "Insufficient fiat" in message
+    assert [o['offer_id'] for o in manager.get_active_offers()] == [offer_id]
+
+
+def test_expired_offers_are_not_listed(manager):
+    manager.create_p2p_trade_offer("seller", 5.0, 0.2, expiry_minutes=-1)
+    assert manager.get_active_offers() == []
+    assert manager.get_market_statistics()['active_offers'] == 0
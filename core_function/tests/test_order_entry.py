@@ -0,0 +1,67 @@
+# test_order_entry.py
+"""Order entry: timestamp parsing and per-entry validation of submit_orders batches"""
+
+import math
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("flask_socketio")
+
+import background_order_processor as engine  # noqa: E402
+from background_order_processor import cancel_order, parse_timestamp, submit_orders  # noqa: E402
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+def test_parse_timestamp_accepts_iso_epoch_and_datetimes():
+    assert parse_timestamp(NOW.isoformat(sep=' ')) == NOW
+    assert parse_timestamp(NOW.timestamp()) == NOW
+    assert parse_timestamp(NOW) == NOW
+    utc = datetime(2025, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+    parsed = parse_timestamp("2025-06-01T12:00:00+00:00")
+    assert parsed.tzinfo is None and parsed.timestamp() == utc.timestamp()
+
+
+@pytest.mark.parametrize("value", [math.inf, math.nan, 1e20, "soon"])
+def test_parse_timestamp_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_submit_orders_validates_and_reserves_each_entry():
+    user_id = f"entry-{uuid.uuid4().hex[:8]}"
+    wallet = engine.wallet_manager.create_wallet(user_id, f"h-{user_id}")
+    base = {'user_id': user_id, 'side': 'buy', 'price': 0.2, 'quantity': 10, 'timestamp': NOW.isoformat()}
+    results = submit_orders([
+        base,
+        {**base, 'price': 'nan'},
+        {**base, 'side': 'hold'},
+        {key: value for key, value in base.items() if key != 'timestamp'},
+        {**base, 'expires_at': "not a time"},
+        {**base, 'user_id': "nobody-" + user_id},
+        {**base, 'side': 'SELL', 'quantity': 10 ** 9},
+    ])
+    assert [r['status'] for r in results] == ['queued'] + ['rejected'] * 6
+    assert results[0]['market'] == engine.default_market.name
+    assert results[3]['error'] == "missing field 'timestamp'"
+    assert wallet.reserved_fiat == pytest.approx(2.0)
+
+    assert cancel_order(results[0]['order_id'])['status'] == 'cancelled'
+    assert wallet.reserved_fiat == 0.0
+
+
+def test_rejected_orders_do_not_open_markets():
+    user_id = f"entry-{uuid.uuid4().hex[:8]}"
+    wallet = engine.wallet_manager.create_wallet(user_id, f"h-{user_id}")
+    base = {'user_id': user_id, 'side': 'buy', 'price': 0.2, 'quantity': 10, 'timestamp': NOW.isoformat()}
+    before = len(engine.markets)
+    results = submit_orders([
+        {**base, 'zone': f"z-{user_id}", 'price': -1},
+        {**base, 'zone': f"z-{user_id}", 'user_id': "nobody-" + user_id},
+        {**base, 'zone': "bad zone"},
+        {**base, 'zone': "north", 'delivery_start': NOW.timestamp() + 30 * 24 * 3600},
+    ])
+    assert [r['status'] for r in results] == ['rejected'] * 4
+    assert len(engine.markets) == before and wallet.reserved_fiat == 0.0
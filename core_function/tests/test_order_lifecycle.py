@@ -0,0 +1,106 @@
+# test_order_lifecycle.py
+"""Order ids, cancel/amend, time in force and expiry through market_registry.Market"""
+
+from datetime import datetime
+
+import pytest
+
+from market_registry import Market
+from order_book import Order
+
+T0 = 1_000_000.0
+
+
+def order(order_id, side, price, qty, user=None, at=0.0, **kwargs) -> Order:
+    return Order(order_id, side, price, qty, datetime.fromtimestamp(T0 + at), user or f"u-{order_id}", **kwargs)
+
+
+def tick(market: Market, at: float = 1.0):
+    with market.lock:
+        return market.locked_tick(T0 + at)
+
+
+@pytest.fixture
+def market():
+    return Market()
+
+
+def test_resting_order_fills_at_the_ask(market):
+    market.enqueue([order("s1", "sell", 0.20, 10, user="seller"), order("b1", "buy", 0.25, 4, user="buyer", at=0.5)])
+    fills = tick(market).fills
+    assert [(f.buy_order_id, f.sell_order_id, f.buyer_id, f.seller_id, f.price, f.qty) for f in fills] == \
+        [("b1", "s1", "buyer", "seller", 0.20, 4)]
+    assert fills[0].aggressor == 'buy'
+    with market.lock:
+        assert market.locked_get("b1").status == 'filled'
+        resting = market.locked_open_order("s1")
+    assert resting.qty == 6 and resting.status == 'open'
+
+
+def test_cancel_queued_order_never_reaches_the_book(market):
+    market.enqueue([order("b1", "buy", 0.25, 4)])
+    with market.lock:
+        assert market.locked_cancel("b1").status == 'cancelled'
+        assert market.locked_cancel("b1") is None
+    result = tick(market)
+    assert result.fills == [] and "b1" not in market.order_book.orders
+
+
+def test_cancel_resting_order(market):
+    market.enqueue([order("b1", "buy", 0.25, 4)])
+    tick(market)
+    with market.lock:
+        cancelled = market.locked_cancel("b1")
+    assert cancelled.status == 'cancelled'
+    assert market.is_empty()
+    assert market.order_book.get("b1") is cancelled  # archived
+
+
+def test_amend_can_cross_the_book(market):
+    market.enqueue([order("s1", "sell", 0.30, 5), order("b1", "buy", 0.20, 5)])
+    assert tick(market).fills == []
+    with market.lock:
+        market.locked_amend("b1", 0.30, None)
+    fills = tick(market, 2.0).fills
+    assert [(f.price, f.qty) for f in fills] == [(0.30, 5)]
+
+
+def test_amend_qty_keeps_order_open(market):
+    market.enqueue([order("b1", "buy", 0.20, 5)])
+    tick(market)
+    with market.lock:
+        amended = market.locked_amend("b1", None, 2)
+    assert amended.qty == 2 and market.order_book.bids.best().qty == 2
+
+
+def test_ioc_remainder_is_cancelled(market):
+    market.enqueue([order("s1", "sell", 0.20, 3), order("b1", "buy", 0.20, 5, at=0.5, tif='IOC')])
+    result = tick(market)
+    assert sum(f.qty for f in result.fills) == 3
+    assert [(o.order_id, o.status, o.qty) for o in result.closed] == [("b1", 'cancelled', 2)]
+
+
+def test_fok_is_killed_unless_fully_fillable(market):
+    market.enqueue([order("s1", "sell", 0.20, 3), order("b1", "buy", 0.20, 5, at=0.5, tif='FOK')])
+    result = tick(market)
+    assert result.fills == []
+    assert [(o.order_id, o.status) for o in result.closed] == [("b1", 'killed')]
+    market.enqueue([order("b2", "buy", 0.20, 3, at=0.6, tif='FOK')])
+    assert sum(f.qty for f in tick(market, 2.0).fills) == 3
+
+
+def test_gtd_order_expires(market):
+    market.enqueue([order("b1", "buy", 0.20, 5, tif='GTD', expires_at=T0 + 10)])
+    assert tick(market).closed == []
+    closed = tick(market, 10.0).closed
+    assert [(o.order_id, o.status) for o in closed] == [("b1", 'expired')]
+    assert market.is_empty()
+
+
+def test_delivered_market_expires_open_orders():
+    market = Market(delivery_start=int(T0))
+    market.enqueue([order("b1", "buy", 0.20, 5), order("s1", "sell", 0.30, 5)])
+    assert tick(market).closed == []
+    closed = tick(market, 900.0).closed
+    assert sorted((o.order_id, o.status) for o in closed) == [("b1", 'expired'), ("s1", 'expired')]
+    assert market.is_empty()
@@ -0,0 +1,90 @@
+# test_order_settlement.py
+"""Settling exchange fills against reservations with WalletManager.settle_order_fills"""
+
+from datetime import datetime
+
+import pytest
+
+from order_book import Fill, Order
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def manager():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("seller", "h-s"), ("buyer", "h-b")])
+    manager.get_wallet("seller").add_energy(20.0)
+    return manager
+
+
+def reserved_fill(manager: WalletManager, order_id: str, qty: int, bid_price: float = 0.30,
+                  price: float = 0.25) -> Fill:
+    assert manager.reserve("seller", energy_kwh=qty)[0]
+    assert manager.reserve("buyer", fiat=bid_price * qty)[0]
+    bid = Order(f"b-{order_id}", 'buy', bid_price, qty, NOW, "buyer")
+    ask = Order(f"s-{order_id}", 'sell', price, qty, NOW, "seller")
+    return Fill(bid, ask, price, qty, price, True, NOW.timestamp())
+
+
+def reserved(manager: WalletManager):
+    return (round(manager.get_wallet("seller").reserved_energy, 6),
+            round(manager.get_wallet("buyer").reserved_fiat, 6))
+
+
+def test_fills_settle_and_release_the_price_improvement(manager):
+    fills = [reserved_fill(manager, "1", 4), reserved_fill(manager, "2", 6)]
+    records = manager.settle_order_fills(fills)
+    assert [r['status'] for r in records] == ['completed', 'completed']
+    assert reserved(manager) == (0.0, 0.0)
+    assert manager.get_wallet("buyer").energy_balance == 10.0
+    assert manager.get_wallet("buyer").fiat_balance == pytest.approx(997.5)
+    assert manager.get_wallet("seller").fiat_balance == pytest.approx(1002.5)
+
+
+def test_fill_without_a_reservation_fails():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("seller", "h-s"), ("buyer", "h-b")])
+    bid = Order("b", 'buy', 0.3, 5, NOW, "buyer")
+    ask = Order("s", 'sell', 0.3, 5, NOW, "seller")
+    records = manager.settle_order_fills([Fill(bid, ask, 0.3, 5, 0.3, True, NOW.timestamp())])
+    assert records[0]['status'] == 'failed'
+
+
+def test_a_failed_fill_releases_what_the_other_side_holds(manager):
+    assert manager.reserve("seller", energy_kwh=5)[0]
+    assert manager.reserve("buyer", fiat=0.5)[0]   # short of the 5 * 0.30 the fill needs
+    bid = Order("b", 'buy', 0.30, 5, NOW, "buyer")
+    ask = Order("s", 'sell', 0.25, 5, NOW, "seller")
+    ghost = Order("g", 'buy', 0.30, 5, NOW, "nobody")
+    records = manager.settle_order_fills([Fill(bid, ask, 0.25, 5, 0.25, True, NOW.timestamp())])
+    assert records[0]['status'] == 'failed'
+    assert reserved(manager) == (0.0, 0.0)
+    # A missing buyer wallet still frees the seller's energy
+    assert manager.reserve("seller", energy_kwh=3)[0]
+    records = manager.settle_order_fills([Fill(ghost, ask, 0.25, 3, 0.25, True, NOW.timestamp())])
+    assert records[0]['status'] == 'failed' and reserved(manager) == (0.0, 0.0)
+    assert manager.get_wallet("seller").energy_balance == 20.0
+
+
+def test_a_failing_settlement_releases_the_fills_it_did_not_reach(manager):
+    fills = [reserved_fill(manager, str(i), 2) for i in range(3)]
+    buyer = manager.get_wallet("buyer")
+    add_energy = buyer.add_energy
+    calls = []
+
+    def failing_add_energy(amount, source="purchase"):
+        calls.append(amount)
+        if len(calls) == 2:
+            raise RuntimeError("history archive unavailable")
+        add_energy(amount, source)
+
+    buyer.add_energy = failing_add_energy
+    with pytest.raises(RuntimeError):
+        manager.settle_order_fills(fills)
+    # The first fill settled, the second failed after consuming its reservation,
+    # and the third was never reached: nothing is left held
+    assert reserved(manager) == (0.0, 0.0)
+    assert manager.get_wallet("seller").available_energy == pytest.approx(16.0)
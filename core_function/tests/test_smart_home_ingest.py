@@ -0,0 +1,84 @@
+# test_smart_home_ingest.py
+"""Bulk smart-home readings through WalletManager.sync_huawei_energy_batch"""
+
+import math
+
+import numpy as np
+import pytest
+
+from wallet_history import HistoryArchive
+from wallet_manager import MAX_READING_KWH, WalletManager
+
+T0 = 1_700_000_000.0
+
+
+@pytest.fixture
+def manager():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("alice", "h-a"), ("bob", "h-b"), ("carol", "h-c")])
+    for user_id, huawei_id in (("alice", "h-a"), ("bob", "h-b")):
+        assert manager.get_wallet(user_id).connect_huawei_smart_home(huawei_id)
+    return manager
+
+
+def statuses(results):
+    return [r['status'] for r in results]
+
+
+def test_rows_are_applied_per_wallet_in_time_order(manager):
+    results = manager.sync_huawei_energy_batch([
+        ("alice", 0.0, 3.0, T0 + 10),       # applied after the surplus below
+        {"user_id": "alice", "produced_kwh": 5.0, "consumed_kwh": 0.0, "timestamp": T0},
+        ("bob", 2.0, 0.5),
+        ("carol", 1.0, 0.0, T0),
+        ("nobody", 1.0, 0.0, T0),
+        ("bob", 0.0, 9.0, T0 + 5),
+    ])
+    assert statuses(results) == ['ok', 'ok', 'ok', 'not_connected', 'unknown_user', 'insufficient_energy']
+    assert manager.get_wallet("alice").energy_balance == 2.0
+    assert manager.get_wallet("bob").energy_balance == 1.5
+    stats = manager.get_market_statistics()
+    assert stats['total_energy_in_system_kwh'] == 3.5
+
+
+def test_columnar_and_numpy_batches(manager):
+    columns = {"user_id": ["alice", "bob"], "produced_kwh": [1.0, 2.0], "consumed_kwh": [0.0, 0.5]}
+    assert statuses(manager.sync_huawei_energy_batch(columns)) == ['ok', 'ok']
+    array = np.array([("alice", 4.0, 1.0, T0)], dtype=[('user_id', 'U16'), ('produced_kwh', 'f8'),
+                                                       ('consumed_kwh', 'f8'), ('timestamp', 'f8')])
+    assert statuses(manager.sync_huawei_energy_batch(array)) == ['ok']
+    assert manager.get_wallet("alice").energy_balance == 4.0
+
+
+@pytest.mark.parametrize("produced, consumed, ts", [
+    (math.inf, 0.0, T0),
+    (math.nan, 0.0, T0),
+    (1.0, -math.inf, T0),
+    (-1.0, 0.0, T0),
+    (MAX_READING_KWH * 2, 0.0, T0),
+    ("lots", 0.0, T0),
+    (1.0, 0.0, math.inf),
+    (1.0, 0.0, 1e20),
+    (1.0, 0.0, "not a time"),
+    (1.0, 0.0, [T0]),
+])
+def test_invalid_readings_are_rejected(manager, produced, consumed, ts):
+    before = manager.get_market_statistics()['total_energy_in_system_kwh']
+    assert statuses(manager.sync_huawei_energy_batch([("alice", produced, consumed, ts)])) == ['invalid']
+    assert manager.get_wallet("alice").energy_balance == 0.0
+    assert manager.get_market_statistics()['total_energy_in_system_kwh'] == before
+
+
+def test_mismatched_columns_raise_value_error(manager):
+    with pytest.raises(ValueError):
+        manager.sync_huawei_energy_batch({"user_id": ["alice", "bob"], "produced_kwh": [1.0],
+                                          "consumed_kwh": [0.0, 0.0]})
+    with pytest.raises(ValueError):
+        manager.sync_huawei_energy_batch([("alice", 1.0)])
+    assert manager.get_wallet("alice").energy_balance == 0.0
+
+
+def test_single_reading_rejects_non_finite_values(manager):
+    assert not manager.sync_huawei_energy_data("alice", math.inf, 0.0)
+    assert manager.sync_huawei_energy_data("alice", 2.0, 0.5)
+    assert manager.get_wallet("alice").energy_balance == 1.5
@@ -0,0 +1,58 @@
+# test_trade_batching.py
+"""Netting a tick's fills per trading pair into one transaction carrying every fill"""
+
+import pytest
+
+from block_chain_templates import (
+    Blockchain, ProofOfWork, QuantumParticipant, SimpleSigningKey, SimpleVerifyingKey, Transaction
+)
+
+FILLS = [
+    {'trade_id': "T1", 'buy_order_id': "B1", 'sell_order_id': "S1", 'price': 0.2, 'qty': 3},
+    {'trade_id': "T2", 'buy_order_id': "B1", 'sell_order_id': "S2", 'price': 0.21, 'qty': 1.5},
+]
+
+
+def signed(fills=None) -> Transaction:
+    tx = Transaction("seller", "buyer", 0.915, fills=fills)
+    tx.sign_transaction(SimpleSigningKey())
+    return tx
+
+
+def sender_key(tx: Transaction) -> SimpleVerifyingKey:
+    return SimpleVerifyingKey.from_hex(tx.sender_key)
+
+
+def test_fills_are_part_of_the_signed_payload():
+    tx = signed([dict(f) for f in FILLS])
+    assert tx.verify_signature(sender_key(tx))
+    tx.fills[1]['qty'] = 2.5   # a partial fill rewritten after signing
+    assert not tx.verify_signature(sender_key(tx))
+
+
+def test_wire_format_round_trip():
+    tx = signed(FILLS)
+    copy = Transaction.deserialize(tx.serialize())
+    assert copy.fills == FILLS and copy.to_dict() == tx.to_dict()
+    assert copy.verify_signature(sender_key(tx))
+    # Transactions without fills serialize as they did before
+    assert "fills" not in signed().serialize()
+
+
+def test_quantum_transaction_encrypts_the_fills():
+    chain = Blockchain(consensus=ProofOfWork(1))
+    for label in ("seller", "buyer"):
+        chain.register_quantum_participant(QuantumParticipant(label))
+    tx = chain.create_quantum_transaction("seller", "buyer", 0.915, fills=FILLS)
+    assert chain.add_transaction(tx)
+    assert chain.decrypt_quantum_transaction(tx, "buyer", "seller")['fills'] == FILLS
+
+
+def test_net_trades_groups_by_pair_in_execution_order():
+    pytest.importorskip("flask_socketio")
+    from background_order_processor import net_trades
+    trades = [{'seller': "s", 'buyer': "b", 'trade_id': "T1"}, {'seller': "x", 'buyer': "b", 'trade_id': "T2"},
+              {'seller': "s", 'buyer': "b", 'trade_id': "T3"}]
+    pairs = net_trades(trades)
+    assert list(pairs) == [("s", "b"), ("x", "b")]
+    assert [t['trade_id'] for t in pairs[("s", "b")]] == ["T1", "T3"]
@@ -0,0 +1,70 @@
+# test_trade_history.py
+"""Per-user trade index behind WalletManager.get_user_trading_history"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+T0 = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def trade(seller: str, buyer: str, minute: int, trade_id: str) -> dict:
+    return {'trade_id': trade_id, 'seller_id': seller, 'buyer_id': buyer, 'energy_kwh': 1.0,
+            'price_per_kwh': 0.2, 'total_cost': 0.2,
+            'timestamp': (T0 + timedelta(minutes=minute)).isoformat(), 'status': 'completed'}
+
+
+@pytest.fixture
+def manager():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("alice", "h-a"), ("bob", "h-b"), ("carol", "h-c")])
+    # Recorded out of order on purpose, as concurrent trades can be
+    for minute, seller, buyer in ((0, "alice", "bob"), (20, "bob", "carol"), (10, "carol", "alice"),
+                                  (30, "alice", "carol"), (40, "bob", "alice")):
+        manager._restore_trade(trade(seller, buyer, minute, f"t{minute}"))
+    return manager
+
+
+def ids(history: dict):
+    return [t['trade_id'] for t in history['p2p_trades']]
+
+
+def test_only_the_users_trades_in_time_order(manager):
+    history = manager.get_user_trading_history("alice")
+    assert ids(history) == ["t0", "t10", "t30", "t40"]
+    assert history['total_p2p_trades'] == 4
+    assert ids(manager.get_user_trading_history("carol")) == ["t10", "t20", "t30"]
+
+
+def test_date_range_is_half_open(manager):
+    history = manager.get_user_trading_history("alice", start=T0 + timedelta(minutes=10),
+                                               end=(T0 + timedelta(minutes=40)).isoformat())
+    assert ids(history) == ["t10", "t30"] and history['total_p2p_trades'] == 2
+
+
+def test_pagination_in_both_directions(manager):
+    assert ids(manager.get_user_trading_history("alice", offset=1, limit=2)) == ["t10", "t30"]
+    assert ids(manager.get_user_trading_history("alice", limit=3, newest_first=True)) == ["t40", "t30", "t10"]
+    assert ids(manager.get_user_trading_history("alice", offset=3, limit=5, newest_first=True)) == ["t0"]
+    assert ids(manager.get_user_trading_history("alice", offset=10)) == []
+
+
+def test_negative_paging_is_rejected(manager):
+    with pytest.raises(ValueError):
+        manager.get_user_trading_history("alice", offset=-1)
+    with pytest.raises(ValueError):
+        manager.get_user_trading_history("alice", limit=-1)
+
+
+def test_live_trades_are_indexed_for_both_sides():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("alice", "h-a"), ("bob", "h-b")])
+    manager.get_wallet("alice").add_energy(5.0)
+    ok, _, record = manager.execute_p2p_energy_trade("alice", "bob", 2.0, 0.1)
+    assert ok
+    assert ids(manager.get_user_trading_history("alice")) == [record['trade_id']]
+    assert ids(manager.get_user_trading_history("bob")) == [record['trade_id']]
+    assert manager.get_user_trading_history("nobody") == {'error': 'Wallet not found'}
@@ -0,0 +1,80 @@
+# test_wallet_crypto.py
+"""Signing backends, the verifying key cache, and EnergyWallet signatures"""
+
+import pytest
+
+import wallet_crypto
+from wallet_crypto import EcdsaBackend, KeypairPool, VerifyingKeyCache
+from wallet_manager import EnergyWallet
+
+DATA = b"trade:alice->bob:5kWh"
+
+
+def keypair(backend):
+    signing_key = KeypairPool.generate()
+    return backend.load_private_key(signing_key), signing_key.verifying_key.to_string().hex()
+
+
+@pytest.fixture(params=["ecdsa", "cryptography"])
+def backend(request):
+    if request.param == "cryptography" and not wallet_crypto.HAS_CRYPTOGRAPHY:
+        pytest.skip("cryptography is not installed")
+    return wallet_crypto.select_backend(request.param)
+
+
+def test_sign_and_verify(backend):
+    private_key, public_hex = keypair(backend)
+    cache = VerifyingKeyCache(backend)
+    signature = backend.sign(private_key, DATA)
+    assert len(signature) == 64
+    assert cache.verify(public_hex, signature, DATA)
+    assert not cache.verify(public_hex, signature, DATA + b"!")
+    assert not cache.verify(public_hex, signature[:-1], DATA)
+
+
+@pytest.mark.skipif(not wallet_crypto.HAS_CRYPTOGRAPHY, reason="cryptography is not installed")
+def test_backends_verify_each_other():
+    ecdsa_backend, openssl = EcdsaBackend(), wallet_crypto.CryptographyBackend()
+    signing_key = KeypairPool.generate()
+    public_hex = signing_key.verifying_key.to_string().hex()
+    for signer, verifier in ((ecdsa_backend, openssl), (openssl, ecdsa_backend)):
+        signature = signer.sign(signer.load_private_key(signing_key), DATA)
+        assert VerifyingKeyCache(verifier).verify(public_hex, signature, DATA)
+
+
+def test_cache_parses_once_and_precomputes_on_reuse():
+    backend = EcdsaBackend()
+    private_key, public_hex = keypair(backend)
+    cache = VerifyingKeyCache(backend)
+    signature = backend.sign(private_key, DATA)
+    for _ in range(4):
+        assert cache.verify(public_hex, signature, DATA)
+    assert (cache.misses, cache.hits, len(cache)) == (1, 3, 1)
+
+
+def test_cache_is_lru_bounded():
+    backend = EcdsaBackend()
+    cache = VerifyingKeyCache(backend, max_size=2)
+    keys = [keypair(backend)[1] for _ in range(3)]
+    cache.get(keys[0])
+    cache.get(keys[1])
+    cache.get(keys[0])
+    cache.get(keys[2])
+    assert len(cache) == 2
+    cache.get(keys[1])
+    assert cache.misses == 4
+
+
+def test_malformed_public_keys_do_not_verify():
+    cache = VerifyingKeyCache(EcdsaBackend())
+    assert not cache.verify("zz", b"\0" * 64, DATA)
+    assert not cache.verify("00" * 64, b"\0" * 64, DATA)
+
+
+def test_wallet_signatures_round_trip():
+    alice = EnergyWallet("alice", "h-a", private_key=KeypairPool.generate())
+    bob = EnergyWallet("bob", "h-b", private_key=KeypairPool.generate())
+    signature = alice.sign_data("payload")
+    assert alice.verify_signature("payload", signature)
+    assert bob.verify_signature("payload", signature, alice.get_public_key_hex())
+    assert not bob.verify_signature("payload", signature)
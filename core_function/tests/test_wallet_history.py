@@ -0,0 +1,66 @@
+# test_wallet_history.py
+"""TransactionHistory ring, spill to the SQLite archive, and archive reuse across runs"""
+
+from wallet_history import ENERGY_DEPOSIT, FIAT_WITHDRAWAL, HistoryArchive, TransactionHistory
+from wallet_manager import WalletManager
+
+
+def fill(history: TransactionHistory, count: int, start: int = 0):
+    for i in range(start, start + count):
+        history.append_entry(ENERGY_DEPOSIT, float(i), f"entry-{i}", 1_000_000.0 + i, float(i))
+
+
+def amounts(entries):
+    return [entry['amount'] for entry in entries]
+
+
+def test_behaves_like_a_list_across_the_spill_boundary():
+    history = TransactionHistory("u", "addr", HistoryArchive(":memory:"), capacity=8, spill_batch=4)
+    fill(history, 30)
+    assert len(history) == 30
+    assert amounts(history[:]) == [float(i) for i in range(30)]
+    assert amounts(history[-5:]) == [25.0, 26.0, 27.0, 28.0, 29.0]
+    assert history[0]['source'] == "entry-0" and history[-1]['wallet_id'] == "u"
+    assert amounts(history[2:12:5]) == [2.0, 7.0]
+
+
+def test_withdrawals_record_a_reason():
+    history = TransactionHistory("u", "addr", capacity=4)
+    history.append_entry(FIAT_WITHDRAWAL, 5.0, "purchase", 1_000_000.0, 95.0)
+    assert history[0]['type'] == 'fiat_withdrawal' and history[0]['reason'] == "purchase"
+
+
+def test_a_new_run_appends_after_archived_rows(tmp_path):
+    path = str(tmp_path / "history.db")
+    first = TransactionHistory("u", "addr", HistoryArchive(path), capacity=8, spill_batch=4)
+    fill(first, 20)
+    first.flush()
+    first.archive.close()
+
+    second = TransactionHistory("u", "addr", HistoryArchive(path), capacity=8, spill_batch=4)
+    assert len(second) == 20
+    fill(second, 20, start=100)
+    second.flush()
+    assert amounts(second[:]) == [float(i) for i in range(20)] + [float(i) for i in range(100, 120)]
+    assert second.archive.count("u") == 40
+
+
+def test_flush_empties_the_ring_into_the_archive():
+    archive = HistoryArchive(":memory:")
+    history = TransactionHistory("u", "addr", archive, capacity=8)
+    fill(history, 5)
+    history.flush()
+    assert archive.count("u") == 5 and len(history) == 5
+    assert amounts(history[:]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_closing_the_manager_keeps_the_ring(tmp_path):
+    path = str(tmp_path / "history.db")
+    manager = WalletManager(history_archive=HistoryArchive(path))
+    manager.create_wallet("alice", "h-a").add_energy(3.0)
+    manager.close()
+
+    again = WalletManager(history_archive=HistoryArchive(path))
+    wallet = again.create_wallet("alice", "h-a")
+    wallet.add_energy(4.0)
+    assert amounts(wallet.transaction_history[:]) == [3.0, 4.0]
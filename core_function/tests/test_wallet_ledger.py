@@ -0,0 +1,106 @@
+# test_wallet_ledger.py
+"""WalletManager recovery from WalletLedger's write-ahead log and snapshots"""
+
+import stat
+
+import pytest
+
+import wallet_ledger
+from wallet_history import HistoryArchive
+from wallet_ledger import WalletLedger
+from wallet_manager import WalletManager
+
+
+def open_manager(directory, **kwargs) -> WalletManager:
+    return WalletManager(history_archive=HistoryArchive(":memory:"),
+                         ledger=WalletLedger(directory, **kwargs))
+
+
+def balances(manager: WalletManager):
+    return {user_id: (w.energy_balance, w.fiat_balance, w.address)
+            for user_id, w in manager.wallets.items()}
+
+
+def trade_ids(manager: WalletManager):
+    return [t['trade_id'] for t in manager.completed_p2p_trades]
+
+
+@pytest.fixture
+def populated(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.create_wallets([("alice", "h-alice"), ("bob", "h-bob")])
+    alice = manager.get_wallet("alice")
+    alice.connect_huawei_smart_home("h-alice")
+    assert manager.sync_huawei_energy_data("alice", produced_kwh=50.0, consumed_kwh=5.0)
+    ok, message, _ = manager.execute_p2p_energy_trade("alice", "bob", 10.0, 0.25)
+    assert ok, message
+    return manager
+
+
+def test_recover_from_log(tmp_path, populated):
+    expected, trades = balances(populated), trade_ids(populated)
+    populated.ledger.close()
+
+    recovered = open_manager(tmp_path)
+    assert balances(recovered) == expected
+    assert trade_ids(recovered) == trades
+    stats, expected_stats = recovered.get_market_statistics(), populated.get_market_statistics()
+    del stats['timestamp'], expected_stats['timestamp']
+    assert stats == expected_stats
+
+
+def test_recover_from_snapshot_and_tail(tmp_path, populated):
+    assert populated.snapshot()
+    assert populated.sync_huawei_energy_data("alice", produced_kwh=3.0, consumed_kwh=0.0)
+    expected = balances(populated)
+    populated.ledger.close()
+
+    ledger = WalletLedger(tmp_path)
+    assert ledger.latest_snapshot() is not None
+    assert len(list(ledger.records(ledger.latest_snapshot()['seq']))) >= 1
+    ledger.close()
+    assert balances(open_manager(tmp_path)) == expected
+
+
+def test_torn_record_is_cut_off(tmp_path, populated):
+    expected = balances(populated)
+    populated.ledger.close()
+    segment = sorted(tmp_path.glob("wal_*.log"))[-1]
+    with open(segment, "a") as f:
+        f.write('{"seq": 999, "op": "balances", "wall')
+
+    recovered = open_manager(tmp_path)
+    assert balances(recovered) == expected
+    # Appends continue after the last whole record
+    assert recovered.ledger.last_seq < 999
+
+
+def test_unknown_sync_mode(tmp_path):
+    with pytest.raises(ValueError):
+        WalletLedger(tmp_path, sync="sometimes")
+
+
+def test_ledger_files_are_owner_only(tmp_path, populated):
+    assert populated.snapshot()
+    populated.ledger.close()
+    files = list(tmp_path.glob("wal_*.log")) + list(tmp_path.glob("snapshot_*.json"))
+    assert files
+    assert {stat.S_IMODE(path.stat().st_mode) for path in files} == {0o600}
+
+
+@pytest.mark.skipif(not wallet_ledger.HAS_AESGCM, reason="cryptography is not installed")
+def test_sealed_keys_never_reach_disk(tmp_path):
+    manager = open_manager(tmp_path, key_secret="s3cret")
+    manager.create_wallets([("alice", "h-alice"), ("bob", "h-bob")])
+    assert manager.snapshot()
+    keys = {user_id: w.get_private_key_hex() for user_id, w in manager.wallets.items()}
+    manager.ledger.close()
+    written = "".join(path.read_text() for path in tmp_path.glob("*_*.*"))
+    assert not any(key in written for key in keys.values())
+
+    recovered = open_manager(tmp_path, key_secret="s3cret")
+    assert {user_id: w.get_private_key_hex() for user_id, w in recovered.wallets.items()} == keys
+    recovered.ledger.close()
+    for secret in (None, "wrong"):
+        with pytest.raises(ValueError):
+            open_manager(tmp_path, key_secret=secret)
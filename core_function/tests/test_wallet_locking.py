@@ -0,0 +1,76 @@
+# test_wallet_locking.py
+"""Per-wallet locks in WalletManager: concurrent trades conserve balances and never deadlock"""
+
+import threading
+
+from wallet_history import HistoryArchive
+from wallet_manager import WalletManager
+
+USERS = [f"user-{i}" for i in range(6)]
+
+
+def funded_manager() -> WalletManager:
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([(u, f"h-{u}") for u in USERS])
+    for user_id in USERS:
+        manager.get_wallet(user_id).add_energy(100.0)
+    return manager
+
+
+def totals(manager: WalletManager):
+    wallets = manager.wallets.values()
+    return round(sum(w.energy_balance for w in wallets), 6), round(sum(w.fiat_balance for w in wallets), 6)
+
+
+def run_threads(target, count: int):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads), "deadlocked"
+
+
+def test_opposite_direction_trades_do_not_deadlock():
+    manager = funded_manager()
+    before = totals(manager)
+
+    def trade(i):
+        seller, buyer = ("user-0", "user-1") if i % 2 else ("user-1", "user-0")
+        for _ in range(200):
+            manager.execute_p2p_energy_trade(seller, buyer, 0.1, 0.2)
+
+    run_threads(trade, 8)
+    assert totals(manager) == before
+    assert manager.get_market_statistics()['completed_trades'] == len(manager.completed_p2p_trades) == 1600
+
+
+def test_concurrent_trades_across_wallets_conserve_balances():
+    manager = funded_manager()
+    before = totals(manager)
+
+    def trade(i):
+        for n in range(150):
+            seller = USERS[(i + n) % len(USERS)]
+            buyer = USERS[(i + 2 * n + 1) % len(USERS)]
+            if seller != buyer:
+                ok, message, _ = manager.execute_p2p_energy_trade(seller, buyer, 0.5, 0.1)
+                assert ok, message
+
+    run_threads(trade, 6)
+    assert totals(manager) == before
+    assert all(w.energy_balance >= 0 and w.fiat_balance >= 0 for w in manager.wallets.values())
+
+
+def test_insufficient_balance_is_checked_under_the_wallet_lock():
+    manager = WalletManager(history_archive=HistoryArchive(":memory:"))
+    manager.create_wallets([("seller", "h-s"), ("b0", "h-0"), ("b1", "h-1"), ("b2", "h-2")])
+    manager.get_wallet("seller").add_energy(10.0)
+    results = []
+
+    def buy(i):
+        results.append(manager.execute_p2p_energy_trade("seller", f"b{i % 3}", 1.0, 0.1)[0])
+
+    run_threads(buy, 30)
+    assert results.count(True) == 10
+    assert manager.get_wallet("seller").energy_balance == 0.0
@@ -0,0 +1,250 @@
+# wallet_crypto.py
+"""
+Signing and verification helpers for EnergyWallet.
+
+Signatures are raw SECP256k1 r||s (64 bytes) over SHA-1, the `ecdsa` package
+defaults, so either backend verifies what the other signed:
+  - "ecdsa":        pure Python, always available
+  - "cryptography": OpenSSL-backed, used when the package is installed
+
+QORCA_CRYPTO_BACKEND selects one explicitly (auto | ecdsa | cryptography).
+Verifying keys are parsed once per public key hex and kept in an LRU cache;
+on the ecdsa backend a key that is used again also gets precomputed
+multiplication tables (worth it only for keys verified repeatedly).
+
+KeypairPool pre-generates SECP256k1 signing keys on a background thread so
+wallet creation only pops a ready key.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Any, List, Optional, Set
+
+import ecdsa
+from ecdsa import ellipticcurve
+from ecdsa.errors import MalformedPointError
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import (
+        decode_dss_signature, encode_dss_signature
+    )
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+CURVE = ecdsa.SECP256k1
+_ORDER_BYTES = CURVE.baselen  # 32
+# Verifying key cache sizes: ~24MB worst case of precomputed ecdsa keys;
+# OpenSSL keys stay small
+DEFAULT_CACHE_SIZE = {"ecdsa": 512, "cryptography": 4096}
+
+
+class EcdsaBackend:
+    """Pure-Python backend built on the `ecdsa` package"""
+
+    name = "ecdsa"
+
+    def load_private_key(self, signing_key: ecdsa.SigningKey) -> Any:
+        return signing_key
+
+    def load_public_key(self, public_key: bytes) -> Any:
+        return ecdsa.VerifyingKey.from_string(public_key, curve=CURVE, hashfunc=hashlib.sha1)
+
+    def precompute(self, public_key: ecdsa.VerifyingKey):
+        # VerifyingKey.precompute() trips an assertion on keys loaded with
+        # from_string (the point carries no order), so build the table directly
+        point = public_key.pubkey.point
+        public_key.pubkey.point = ellipticcurve.PointJacobi(
+            point.curve(), point.x(), point.y(), 1, CURVE.order, generator=True
+        )
+        public_key.pubkey.point * 2  # build the table now, not on the next verify
+
+    def sign(self, private_key: ecdsa.SigningKey, data: bytes) -> bytes:
+        return private_key.sign(data)
+
+    def verify(self, public_key: ecdsa.VerifyingKey, signature: bytes, data: bytes) -> bool:
+        try:
+            return public_key.verify(signature, data)
+        except (ecdsa.BadSignatureError, ecdsa.der.UnexpectedDER, ValueError):
+            return False
+
+
+class CryptographyBackend:
+    """OpenSSL backend via the optional `cryptography` package"""
+
+    name = "cryptography"
+
+    def __init__(self):
+        self._curve = ec.SECP256K1()
+        self._algorithm = ec.ECDSA(hashes.SHA1())
+
+    def load_private_key(self, signing_key: ecdsa.SigningKey) -> Any:
+        secret = int.from_bytes(signing_key.to_string(), "big")
+        return ec.derive_private_key(secret, self._curve)
+
+    def load_public_key(self, public_key: bytes) -> Any:
+        # ecdsa's to_string() is the uncompressed point without the 0x04 prefix
+        return ec.EllipticCurvePublicKey.from_encoded_point(self._curve, b"\x04" + public_key)
+
+    def precompute(self, public_key: Any):
+        pass  # OpenSSL keeps its own tables
+
+    def sign(self, private_key: Any, data: bytes) -> bytes:
+        r, s = decode_dss_signature(private_key.sign(data, self._algorithm))
+        return r.to_bytes(_ORDER_BYTES, "big") + s.to_bytes(_ORDER_BYTES, "big")
+
+    def verify(self, public_key: Any, signature: bytes, data: bytes) -> bool:
+        if len(signature) != 2 * _ORDER_BYTES:
+            return False
+        r = int.from_bytes(signature[:_ORDER_BYTES], "big")
+        s = int.from_bytes(signature[_ORDER_BYTES:], "big")
+        try:
+            public_key.verify(encode_dss_signature(r, s), data, self._algorithm)
+            return True
+        except (InvalidSignature, ValueError):
+            return False
+
+
+def select_backend(name: Optional[str] = None):
+    """Return the backend named by `name` or QORCA_CRYPTO_BACKEND (default: fastest available)"""
+    name = (name or os.environ.get("QORCA_CRYPTO_BACKEND", "auto")).lower()
+    if name == "cryptography" and not HAS_CRYPTOGRAPHY:
+        raise ValueError("QORCA_CRYPTO_BACKEND=cryptography but the package is not installed")
+    if name == "cryptography" or (name == "auto" and HAS_CRYPTOGRAPHY):
+        return CryptographyBackend()
+    if name in ("auto", "ecdsa"):
+        return EcdsaBackend()
+    raise ValueError(f"Unknown crypto backend: {name}")
+
+
+class VerifyingKeyCache:
+    """LRU cache of parsed verifying keys, keyed by public key hex"""
+
+    def __init__(self, backend=None, max_size: Optional[int] = None):
+        self.backend = backend or select_backend()
+        # A parsed key is small, but an ecdsa key with precomputed tables is ~48KB
+        if max_size is None:
+            max_size = DEFAULT_CACHE_SIZE.get(self.backend.name, DEFAULT_CACHE_SIZE["ecdsa"])
+        self.max_size = max_size
+        self._keys: "OrderedDict[str, Any]" = OrderedDict()
+        self._precomputed: Set[str] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, public_key_hex: str) -> Any:
+        with self._lock:
+            key = self._keys.get(public_key_hex)
+            if key is not None:
+                self._keys.move_to_end(public_key_hex)
+                self.hits += 1
+                if public_key_hex in self._precomputed:
+                    return key
+                # Claimed here so only one thread precomputes this key
+                self._precomputed.add(public_key_hex)
+        if key is not None:
+            # Second use: worth the one-off precomputation. Build it on a private
+            # copy and publish that; threads verifying with the old object are
+            # never looking at a half-built table.
+            warm = self.backend.load_public_key(bytes.fromhex(public_key_hex))
+            self.backend.precompute(warm)
+            with self._lock:
+                if public_key_hex in self._keys:
+                    self._keys[public_key_hex] = warm
+            return warm
+        # Parse outside the lock; a racing duplicate is harmless
+        key = self.backend.load_public_key(bytes.fromhex(public_key_hex))
+        with self._lock:
+            self.misses += 1
+            self._keys[public_key_hex] = key
+            self._keys.move_to_end(public_key_hex)
+            while len(self._keys) > self.max_size:
+                evicted, _ = self._keys.popitem(last=False)
+                self._precomputed.discard(evicted)
+        return key
+
+    def verify(self, public_key_hex: str, signature: bytes, data: bytes) -> bool:
+        try:
+            key = self.get(public_key_hex)
+        except (ValueError, MalformedPointError):
+            # Malformed hex or not a point on the curve
+            return False
+        return self.backend.verify(key, signature, data)
+
+
+class KeypairPool:
+    """
+    Signing keys generated ahead of demand by a daemon worker thread.
+
+    take() never waits for the worker: when the pool is empty the key is
+    generated inline. The worker starts on first use and refills up to
+    `size` whenever the pool drops below `low_water`.
+    """
+
+    def __init__(self, size: int = 256, low_water: int = 64):
+        self.size = size
+        self.low_water = min(low_water, size)
+        self._keys: "deque[ecdsa.SigningKey]" = deque()
+        self._refill = threading.Event()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self.generated_inline = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def generate() -> ecdsa.SigningKey:
+        return ecdsa.SigningKey.generate(curve=CURVE)
+
+    def take(self) -> ecdsa.SigningKey:
+        return self.take_many(1)[0]
+
+    def take_many(self, count: int) -> List[ecdsa.SigningKey]:
+        self._ensure_worker()
+        keys = []
+        try:
+            for _ in range(count):
+                keys.append(self._keys.popleft())
+        except IndexError:
+            pass
+        if len(self._keys) < self.low_water:
+            self._refill.set()
+        missing = count - len(keys)
+        if missing:
+            self.generated_inline += missing
+            keys.extend(self.generate() for _ in range(missing))
+        return keys
+
+    def fill(self, count: Optional[int] = None):
+        """Generate keys on the calling thread (e.g. to warm the pool at startup)"""
+        for _ in range(self.size - len(self._keys) if count is None else count):
+            self._keys.append(self.generate())
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="keypair-pool", daemon=True)
+                    self._worker.start()
+                    self._refill.set()
+
+    def _run(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            while len(self._keys) < self.size:
+                self._keys.append(self.generate())
+
+
+# Shared by every wallet in the process
+backend = select_backend()
+verifying_keys = VerifyingKeyCache(backend)
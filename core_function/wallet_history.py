@@ -0,0 +1,180 @@
+# wallet_history.py
+"""
+Bounded wallet transaction history.
+
+Recent entries live in a small columnar ring (typed arrays, no per-entry
+dicts); when the ring fills up the oldest entries are spilled in one batch to
+a shared SQLite archive. TransactionHistory still behaves like the list it
+replaces: len(), iteration and indexing/slicing (e.g. history[-50:]) return
+the same dicts EnergyWallet used to store.
+
+Archive rows are keyed by (user_id, seq) with seq counting every entry the
+user ever recorded: a history resumes numbering after the rows already
+archived for its user, so a restarted node (or a recreated wallet) appends
+instead of overwriting. flush() writes the ring out on shutdown.
+"""
+
+import os
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Entry kinds, stored as one byte each
+ENTRY_TYPES = ('energy_deposit', 'energy_withdrawal', 'fiat_deposit', 'fiat_withdrawal')
+ENERGY_DEPOSIT, ENERGY_WITHDRAWAL, FIAT_DEPOSIT, FIAT_WITHDRAWAL = range(4)
+# Deposits record a 'source', withdrawals a 'reason'
+_NOTE_KEYS = ('source', 'reason', 'source', 'reason')
+
+Row = Tuple[int, float, str, float, float]  # (kind, amount, note, timestamp, new_balance)
+
+# Node state lives under QORCA_DATA_DIR; ":memory:" archives are for tests only
+DATA_DIR = os.environ.get("QORCA_DATA_DIR", os.path.join(os.path.expanduser("~"), ".qorca"))
+DEFAULT_HISTORY_DB = os.path.join(DATA_DIR, "wallet_history.db")
+
+
+class HistoryArchive:
+    """Shared SQLite store for history entries evicted from wallet rings"""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS wallet_history ("
+                " user_id TEXT NOT NULL, seq INTEGER NOT NULL, kind INTEGER NOT NULL,"
+                " amount REAL NOT NULL, note TEXT, ts REAL NOT NULL, new_balance REAL NOT NULL,"
+                " PRIMARY KEY (user_id, seq)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+
+    def append(self, user_id: str, first_seq: int, rows: List[Row]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO wallet_history VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(user_id, first_seq + i) + row for i, row in enumerate(rows)]
+            )
+            self._conn.commit()
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM wallet_history WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return count
+
+    def fetch(self, user_id: str, start_seq: int, stop_seq: int) -> List[Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kind, amount, note, ts, new_balance FROM wallet_history"
+                " WHERE user_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (user_id, start_seq, stop_seq)
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TransactionHistory:
+    """List-like wallet history: columnar ring in memory, older entries in the archive"""
+
+    def __init__(self, wallet_id: str, address: str, archive: Optional[HistoryArchive] = None,
+                 capacity: int = 256, spill_batch: int = 64):
+        self.wallet_id = wallet_id
+        self.address = address
+        self.archive = archive
+        self.capacity = capacity
+        self.spill_batch = max(1, min(spill_batch, capacity))
+        # Ring columns
+        self._kinds = array('B', bytes(capacity))
+        self._amounts = array('d', bytes(8 * capacity))
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._balances = array('d', bytes(8 * capacity))
+        self._notes: List[Optional[str]] = [None] * capacity
+        self._head = 0        # ring slot of the oldest in-memory entry
+        self._size = 0        # entries currently in the ring
+        # Entries spilled to the archive (or dropped without one), including earlier runs
+        self._archived = archive.count(wallet_id) if archive is not None else 0
+
+    def __len__(self) -> int:
+        return self._archived + self._size
+
+    def append_entry(self, kind: int, amount: float, note: str, timestamp: float, new_balance: float):
+        if self._size == self.capacity:
+            self._spill()
+        slot = (self._head + self._size) % self.capacity
+        self._kinds[slot] = kind
+        self._amounts[slot] = amount
+        self._notes[slot] = note
+        self._timestamps[slot] = timestamp
+        self._balances[slot] = new_balance
+        self._size += 1
+
+    def flush(self):
+        """Move every in-memory entry to the archive (no-op without one)"""
+        if self.archive is not None and self._size:
+            self._spill(self._size)
+
+    def _spill(self, count: Optional[int] = None):
+        # Move the oldest batch out in one archive write
+        count = self.spill_batch if count is None else count
+        rows = [self._row(i) for i in range(count)]
+        if self.archive is not None:
+            self.archive.append(self.wallet_id, self._archived, rows)
+        for i in range(count):
+            self._notes[(self._head + i) % self.capacity] = None
+        self._head = (self._head + count) % self.capacity
+        self._size -= count
+        self._archived += count
+
+    def _row(self, offset: int) -> Row:
+        slot = (self._head + offset) % self.capacity
+        return (self._kinds[slot], self._amounts[slot], self._notes[slot],
+                self._timestamps[slot], self._balances[slot])
+
+    def _to_dict(self, row: Row) -> Dict:
+        kind, amount, note, timestamp, new_balance = row
+        return {
+            'type': ENTRY_TYPES[kind],
+            'amount': amount,
+            _NOTE_KEYS[kind]: note,
+            'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+            'new_balance': new_balance,
+            'wallet_id': self.wallet_id,
+            'address': self.address
+        }
+
+    def _rows(self, start: int, stop: int) -> List[Row]:
+        """Rows for global sequence numbers [start, stop)"""
+        rows: List[Row] = []
+        if start < self._archived:
+            if self.archive is not None:
+                rows.extend(self.archive.fetch(self.wallet_id, start, min(stop, self._archived)))
+            start = self._archived
+        rows.extend(self._row(seq - self._archived) for seq in range(start, stop))
+        return rows
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        total = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(total)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return [self._to_dict(row) for row in self._rows(start, max(start, stop))]
+        if index < 0:
+            index += total
+        if not 0 <= index < total:
+            raise IndexError("transaction history index out of range")
+        rows = self._rows(index, index + 1)
+        if not rows:
+            raise IndexError("transaction history entry was not archived")
+        return self._to_dict(rows[0])
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self[:])
@@ -0,0 +1,302 @@
+# wallet_ledger.py
+"""
+Durable storage for WalletManager: a write-ahead log plus periodic snapshots.
+
+Every balance-changing operation appends one JSON record holding the new
+absolute state of the wallets it touched, so replay is idempotent and a
+trade (two wallets) is a single record. Records are group-committed: writers
+enqueue and get a sequence number, a committer thread writes everything queued
+so far and fsyncs once per batch, and wait() returns when a sequence number is
+durable. sync="op" fsyncs each record on the calling thread instead (the slow
+baseline); sync="none" leaves flushing to the OS.
+
+Layout:
+    <directory>/wal_<first_seq>.log        JSON lines, {"seq": n, "op": ...}
+    <directory>/snapshot_<seq>.json        full state up to and including seq
+
+Recovery loads the newest snapshot and replays WAL records after its seq; a
+torn record at the end of the newest segment (crash mid-write) is cut off.
+
+Wallet private keys are custodial and travel in 'wallets' records and
+snapshots. Every file here is owner-only (0600). With a key_secret the keys
+are additionally sealed with AES-GCM (key derived with scrypt from the secret
+and <directory>/key_salt, bound to the user id) before they are written;
+that needs the optional `cryptography` package. Without a secret they are
+stored in plain text, protected only by the file mode.
+
+Order reservations (reserved_energy / reserved_fiat) are not logged: they
+belong to resting orders, and the order book is not recovered either. A
+restart drops both, so every order must be resubmitted and reserves again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    HAS_AESGCM = True
+except ImportError:
+    HAS_AESGCM = False
+
+LOGGER = logging.getLogger(__name__)
+
+SYNC_MODES = ("batch", "op", "none")
+# Log segments, snapshots and the key salt hold custodial keys: owner-only
+FILE_MODE = 0o600
+DIR_MODE = 0o700
+
+
+def _create(path: Path, flags: int):
+    """Open `path` for writing, created (or tightened to) FILE_MODE"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | flags, FILE_MODE)
+    os.fchmod(fd, FILE_MODE)
+    return os.fdopen(fd, "a" if flags & os.O_APPEND else "w")
+
+
+class WalletLedger:
+    """Group-committed write-ahead log with snapshots."""
+
+    def __init__(self, directory, sync: str = "batch", keep_snapshots: int = 2,
+                 key_secret: Optional[str] = None):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode: {sync} (expected one of {SYNC_MODES})")
+        if key_secret and not HAS_AESGCM:
+            raise ValueError("Sealing wallet keys needs the cryptography package")
+        self.directory = Path(directory)
+        self.directory.mkdir(mode=DIR_MODE, parents=True, exist_ok=True)
+        self.sync = sync
+        self.keep_snapshots = keep_snapshots
+        # Files written before they were created owner-only
+        for path in self.directory.glob("*"):
+            if path.is_file():
+                os.chmod(path, FILE_MODE)
+        self._key_cipher = AESGCM(self._derive_key(key_secret)) if key_secret else None
+
+        self._lock = threading.Lock()
+        self._durable = threading.Condition(self._lock)
+        self._pending: List[str] = []
+        self._repair_tail()
+        self._seq = self._last_logged_seq()
+        self._durable_seq = self._seq
+        snapshot = self.latest_snapshot()
+        self.records_since_snapshot = self._seq - (snapshot["seq"] if snapshot else 0)
+        self.batches = 0
+        self._file = None
+        self._open_segment(self._seq + 1)
+        self._closed = False
+        self._worker: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def append(self, op: str, **fields) -> int:
+        """Queue a record and return its sequence number (durable after wait(seq))."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Wallet ledger is closed")
+            self._seq += 1
+            self.records_since_snapshot += 1
+            line = json.dumps({"seq": self._seq, "op": op, **fields}, separators=(",", ":"))
+            if self.sync == "op":
+                self._write([line])
+                self._durable_seq = self._seq
+                return self._seq
+            self._pending.append(line)
+            seq = self._seq
+            self._durable.notify_all()
+        self._ensure_worker()
+        return seq
+
+    def wait(self, seq: int):
+        """Block until record `seq` has been written (and fsynced, in batch mode)."""
+        with self._lock:
+            while self._durable_seq < seq and not self._closed:
+                self._durable.wait()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._durable.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        with self._lock:
+            if self._pending:
+                self._write(self._pending)
+                self._pending = []
+                self._durable_seq = self._seq
+            self._file.close()
+
+    def _write(self, lines: List[str]):
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        if self.sync != "none":
+            os.fsync(self._file.fileno())
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None and not self._closed:
+                    self._worker = threading.Thread(target=self._commit_loop, name="wallet-ledger", daemon=True)
+                    self._worker.start()
+
+    def _commit_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._durable.wait()
+                if self._closed:
+                    return
+                batch, self._pending = self._pending, []
+                upto = self._seq
+                # The file handle is only swapped by snapshot(), under the lock
+                handle = self._file
+            # Write outside the lock so writers keep queueing the next batch
+            handle.write("\n".join(batch) + "\n")
+            handle.flush()
+            if self.sync != "none":
+                os.fsync(handle.fileno())
+            with self._lock:
+                self.batches += 1
+                self._durable_seq = max(self._durable_seq, upto)
+                self._durable.notify_all()
+
+    # ------------------------------------------------------------------
+    # Wallet keys
+    # ------------------------------------------------------------------
+    def _derive_key(self, secret: str) -> bytes:
+        path = self.directory / "key_salt"
+        try:
+            salt = path.read_bytes()
+        except FileNotFoundError:
+            salt = os.urandom(16)
+            with _create(path, os.O_EXCL) as f:
+                f.write(salt.hex())
+        else:
+            salt = bytes.fromhex(salt.decode())
+        return hashlib.scrypt(secret.encode(), salt=salt, n=2 ** 14, r=8, p=1, dklen=32)
+
+    def seal_key(self, user_id: str, private_key_hex: str) -> Dict[str, str]:
+        """Record fields holding a wallet's private key (sealed when a key_secret is set)"""
+        if self._key_cipher is None:
+            return {"private_key": private_key_hex}
+        nonce = os.urandom(12)
+        sealed = self._key_cipher.encrypt(nonce, bytes.fromhex(private_key_hex), user_id.encode())
+        return {"sealed_private_key": (nonce + sealed).hex()}
+
+    def open_key(self, record: Dict[str, Any]) -> str:
+        """Private key hex from a wallet record written by seal_key (or before sealing existed)"""
+        if "sealed_private_key" not in record:
+            return record["private_key"]
+        if self._key_cipher is None:
+            raise ValueError("Wallet keys in this ledger are sealed; a key_secret is required")
+        data = bytes.fromhex(record["sealed_private_key"])
+        try:
+            return self._key_cipher.decrypt(data[:12], data[12:], record["user_id"].encode()).hex()
+        except InvalidTag:
+            raise ValueError(f"Cannot unseal the key of wallet {record['user_id']}: wrong key_secret?")
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def _open_segment(self, first_seq: int):
+        path = self.directory / f"wal_{first_seq:012d}.log"
+        self._file = _create(path, os.O_APPEND)
+
+    def _segments(self) -> List[Tuple[int, Path]]:
+        return sorted((int(p.stem.split("_")[1]), p) for p in self.directory.glob("wal_*.log"))
+
+    def _snapshots(self) -> List[Path]:
+        return sorted(self.directory.glob("snapshot_*.json"))
+
+    def snapshot(self, state: Dict[str, Any], seq: int) -> Path:
+        """
+        Persist `state`, which must reflect every record up to `seq`, then
+        start a new WAL segment and delete segments the snapshot covers.
+        """
+        path = self.directory / f"snapshot_{seq:012d}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with _create(tmp_path, os.O_TRUNC) as f:
+            json.dump({"seq": seq, **state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            # Drain queued records into the old segment before switching
+            self._drain_locked()
+            self._file.close()
+            self._open_segment(self._seq + 1)
+            self.records_since_snapshot = self._seq - seq
+
+        segments = self._segments()
+        for i, (first, segment) in enumerate(segments[:-1]):
+            next_first = segments[i + 1][0]
+            if next_first - 1 <= seq:
+                segment.unlink()
+        for old in self._snapshots()[:-self.keep_snapshots] if self.keep_snapshots > 0 else []:
+            old.unlink()
+        return path
+
+    def _drain_locked(self):
+        # Caller holds self._lock: wait out an in-flight batch, then write the rest
+        while self._durable_seq < self._seq - len(self._pending):
+            self._durable.wait()
+        if self._pending:
+            self._write(self._pending)
+            self._pending = []
+            self._durable_seq = self._seq
+            self._durable.notify_all()
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+    def latest_snapshot(self) -> Optional[Dict[str, Any]]:
+        snapshots = self._snapshots()
+        if not snapshots:
+            return None
+        with open(snapshots[-1]) as f:
+            return json.load(f)
+
+    def records(self, after_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yield logged records with seq > after_seq, in order."""
+        segments = self._segments()
+        for _, path in segments:
+            with open(path) as f:
+                lines = f.read().split("\n")
+            for line in lines:
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record["seq"] > after_seq:
+                    yield record
+
+    def _repair_tail(self):
+        """Cut a torn record off the end of the newest segment."""
+        segments = self._segments()
+        if not segments:
+            return
+        path = segments[-1][1]
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                LOGGER.warning(f"Truncating torn record at the end of {path.name}")
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _last_logged_seq(self) -> int:
+        last = 0
+        snapshot = self.latest_snapshot()
+        if snapshot is not None:
+            last = snapshot["seq"]
+        for record in self.records(last):
+            last = record["seq"]
+        return last
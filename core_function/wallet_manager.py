@@ -1,17 +1,42 @@
 # wallet_manager.py
+import atexit
 import ecdsa
 import binascii
 import hashlib
 import json
+import math
+import bisect
+import heapq
+import itertools
+import logging
+import os
 import threading
-from typing import Dict, List, Optional, Tuple
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+
+import wallet_crypto
+from wallet_ledger import WalletLedger
+from wallet_history import (
+    HistoryArchive, TransactionHistory, DEFAULT_HISTORY_DB,
+    ENERGY_DEPOSIT, ENERGY_WITHDRAWAL, FIAT_DEPOSIT, FIAT_WITHDRAWAL
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Tolerance for float rounding when reserved amounts are released and debited
+BALANCE_EPSILON = 1e-9
+# Upper bound for one smart-home reading (produced or consumed kWh)
+MAX_READING_KWH = 1_000_000.0
+
 
 class EnergyWallet:
     """Individual wallet for energy trading with blockchain integration"""
     
-    def __init__(self, user_id: str, huawei_id: str, private_key: ecdsa.SigningKey = None):
+    def __init__(self, user_id: str, huawei_id: str, private_key: ecdsa.SigningKey = None,
+                 history_archive: Optional[HistoryArchive] = None):
         self.user_id = user_id
         self.huawei_id = huawei_id  # Virtual common ID for smart home integration
         
@@ -22,20 +47,34 @@ class EnergyWallet:
             self.private_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
         
         self.public_key = self.private_key.verifying_key
+        self._public_key_hex = binascii.hexlify(self.public_key.to_string()).decode()
+        # Backend-specific signing key, built on first sign_data()
+        self._backend_private_key = None
         self.address = self._generate_address()
         
         # Balances
         self.energy_balance = 0.0  # kWh
         self.fiat_balance = 1000.0  # USD (initial balance for demo)
+        # Held for resting exchange orders (sell: energy, buy: fiat); not spendable elsewhere
+        self.reserved_energy = 0.0
+        self.reserved_fiat = 0.0
         
-        # Transaction history
-        self.transaction_history: List[Dict] = []
+        # Transaction history: recent entries in memory, older ones in the archive
+        self.transaction_history = TransactionHistory(user_id, self.address, history_archive)
         self.pending_transactions: List[Dict] = []
         
         # Smart home connection status
         self.huawei_connected = False
         self.last_sync_time = None
         
+        # Guards balances and history; WalletManager takes it (in address order)
+        self.lock = threading.Lock()
+        
+        # Called with (energy_delta, fiat_delta) on every balance change
+        self.balance_listener: Optional[Callable[[float, float], None]] = None
+        # Called with the wallet when its smart-home connection changes
+        self.state_listener: Optional[Callable[["EnergyWallet"], None]] = None
+        
     def _generate_address(self) -> str:
         """Generate wallet address from public key"""
         pub_key_bytes = self.public_key.to_string()
@@ -50,49 +89,57 @@ class EnergyWallet:
     
     def get_public_key_hex(self) -> str:
         """Export public key as hex string"""
-        return binascii.hexlify(self.public_key.to_string()).decode()
+        return self._public_key_hex
     
     def sign_data(self, data: str) -> bytes:
         """Sign arbitrary data with private key"""
-        return self.private_key.sign(data.encode())
+        if self._backend_private_key is None:
+            self._backend_private_key = wallet_crypto.backend.load_private_key(self.private_key)
+        return wallet_crypto.backend.sign(self._backend_private_key, data.encode())
     
     def verify_signature(self, data: str, signature: bytes, public_key_hex: str = None) -> bool:
-        """Verify signature against data"""
-        try:
-            if public_key_hex:
-                vk = ecdsa.VerifyingKey.from_string(
-                    bytes.fromhex(public_key_hex), 
-                    curve=ecdsa.SECP256k1
-                )
-            else:
-                vk = self.public_key
-            return vk.verify(signature, data.encode())
-        except:
-            return False
+        """Verify signature against data (verifying keys are cached per public key)"""
+        return wallet_crypto.verifying_keys.verify(public_key_hex or self._public_key_hex,
+                                                   signature, data.encode())
     
     def add_energy(self, amount: float, source: str = "production"):
         """Add energy to wallet (from solar panels, etc.)"""
         if amount > 0:
             self.energy_balance += amount
-            self._record_transaction({
-                'type': 'energy_deposit',
-                'amount': amount,
-                'source': source,
-                'timestamp': datetime.now().isoformat(),
-                'new_balance': self.energy_balance
-            })
+            self._record_transaction(ENERGY_DEPOSIT, amount, source, self.energy_balance)
+            self._notify_balance(amount, 0.0)
+    
+    @property
+    def available_energy(self) -> float:
+        return self.energy_balance - self.reserved_energy
+    
+    @property
+    def available_fiat(self) -> float:
+        return self.fiat_balance - self.reserved_fiat
+    
+    def reserve(self, energy: float = 0.0, fiat: float = 0.0) -> bool:
+        """Hold energy/fiat for a resting order (caller holds self.lock)"""
+        if energy > self.available_energy + BALANCE_EPSILON or fiat > self.available_fiat + BALANCE_EPSILON:
+            return False
+        self.reserved_energy += energy
+        self.reserved_fiat += fiat
+        return True
+    
+    def release(self, energy: float = 0.0, fiat: float = 0.0):
+        """Return held energy/fiat to the available balance (caller holds self.lock)"""
+        self.reserved_energy = max(0.0, self.reserved_energy - energy)
+        self.reserved_fiat = max(0.0, self.reserved_fiat - fiat)
+        if self.reserved_energy < BALANCE_EPSILON:
+            self.reserved_energy = 0.0
+        if self.reserved_fiat < BALANCE_EPSILON:
+            self.reserved_fiat = 0.0
     
     def deduct_energy(self, amount: float, reason: str = "consumption") -> bool:
         """Deduct energy from wallet"""
-        if amount <= self.energy_balance:
+        if amount <= self.available_energy + BALANCE_EPSILON:
             self.energy_balance -= amount
-            self._record_transaction({
-                'type': 'energy_withdrawal',
-                'amount': amount,
-                'reason': reason,
-                'timestamp': datetime.now().isoformat(),
-                'new_balance': self.energy_balance
-            })
+            self._record_transaction(ENERGY_WITHDRAWAL, amount, reason, self.energy_balance)
+            self._notify_balance(-amount, 0.0)
             return True
         return False
     
@@ -100,33 +147,25 @@ class EnergyWallet:
         """Add fiat currency to wallet"""
         if amount > 0:
             self.fiat_balance += amount
-            self._record_transaction({
-                'type': 'fiat_deposit',
-                'amount': amount,
-                'source': source,
-                'timestamp': datetime.now().isoformat(),
-                'new_balance': self.fiat_balance
-            })
+            self._record_transaction(FIAT_DEPOSIT, amount, source, self.fiat_balance)
+            self._notify_balance(0.0, amount)
     
     def deduct_fiat(self, amount: float, reason: str = "purchase") -> bool:
         """Deduct fiat from wallet"""
-        if amount <= self.fiat_balance:
+        if amount <= self.available_fiat + BALANCE_EPSILON:
             self.fiat_balance -= amount
-            self._record_transaction({
-                'type': 'fiat_withdrawal',
-                'amount': amount,
-                'reason': reason,
-                'timestamp': datetime.now().isoformat(),
-                'new_balance': self.fiat_balance
-            })
+            self._record_transaction(FIAT_WITHDRAWAL, amount, reason, self.fiat_balance)
+            self._notify_balance(0.0, -amount)
             return True
         return False
     
-    def _record_transaction(self, transaction: Dict):
+    def _notify_balance(self, energy_delta: float, fiat_delta: float):
+        if self.balance_listener is not None:
+            self.balance_listener(energy_delta, fiat_delta)
+    
+    def _record_transaction(self, kind: int, amount: float, note: str, new_balance: float):
         """Record transaction in history"""
-        transaction['wallet_id'] = self.user_id
-        transaction['address'] = self.address
-        self.transaction_history.append(transaction)
+        self.transaction_history.append_entry(kind, amount, note, time.time(), new_balance)
     
     def get_balance_summary(self) -> Dict:
         """Get current balance summary"""
@@ -136,6 +175,8 @@ class EnergyWallet:
             'address': self.address,
             'energy_balance_kwh': round(self.energy_balance, 2),
             'fiat_balance_usd': round(self.fiat_balance, 2),
+            'reserved_energy_kwh': round(self.reserved_energy, 2),
+            'reserved_fiat_usd': round(self.reserved_fiat, 2),
             'huawei_connected': self.huawei_connected,
             'last_sync': self.last_sync_time
         }
@@ -146,12 +187,25 @@ class EnergyWallet:
         if huawei_id == self.huawei_id:
             self.huawei_connected = True
             self.last_sync_time = datetime.now().isoformat()
+            if self.state_listener is not None:
+                self.state_listener(self)
             return True
         return False
     
     def disconnect_huawei_smart_home(self):
         """Disconnect from Huawei Smart Home"""
         self.huawei_connected = False
+        if self.state_listener is not None:
+            self.state_listener(self)
+    
+    def ledger_state(self) -> List:
+        """
+        Absolute wallet state as logged by WalletLedger: [user_id, energy, fiat, connected]
+
+        Reservations are left out on purpose: they die with the in-memory
+        order book on restart (see wallet_ledger).
+        """
+        return [self.user_id, self.energy_balance, self.fiat_balance, self.huawei_connected]
     
     def to_dict(self) -> Dict:
         """Serialize wallet data"""
@@ -162,40 +216,227 @@ class EnergyWallet:
             'public_key': self.get_public_key_hex(),
             'energy_balance': self.energy_balance,
             'fiat_balance': self.fiat_balance,
+            'reserved_energy': self.reserved_energy,
+            'reserved_fiat': self.reserved_fiat,
             'huawei_connected': self.huawei_connected,
             'last_sync_time': self.last_sync_time,
             'transaction_count': len(self.transaction_history)
         }
 
 
+class MarketStatistics:
+    """Running market aggregates, updated in the deposit/withdrawal and trade paths"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_energy = 0.0
+        self.total_fiat = 0.0
+        self.completed_trades = 0
+        self.traded_volume = 0.0
+        self.traded_value = 0.0
+    
+    def add_wallet(self, wallet: "EnergyWallet"):
+        self.on_balance_change(wallet.energy_balance, wallet.fiat_balance)
+    
+    def on_balance_change(self, energy_delta: float, fiat_delta: float):
+        with self.lock:
+            self.total_energy += energy_delta
+            self.total_fiat += fiat_delta
+    
+    def record_trade(self, energy_kwh: float, total_cost: float):
+        with self.lock:
+            self.completed_trades += 1
+            self.traded_volume += energy_kwh
+            self.traded_value += total_cost
+    
+    @property
+    def vwap(self) -> float:
+        """Volume-weighted average trade price per kWh"""
+        return self.traded_value / self.traded_volume if self.traded_volume > 0 else 0.0
+
+
+class P2POfferBook:
+    """
+    Pending P2P offers indexed for O(1)/O(log n) access.
+    
+    - offers: dict by offer_id (pending and in-flight offers only)
+    - expiry min-heap: offers are expired lazily when the heap top is due
+    - price index: sorted (price, seq, offer_id) of offers open for acceptance
+    - archive: bounded deque of completed/expired offers
+    
+    Not thread-safe on its own; WalletManager guards it with offers_lock.
+    """
+    
+    def __init__(self, archive_size: int = 10_000):
+        self.offers: Dict[str, Dict] = {}
+        self.archive: deque = deque(maxlen=archive_size)
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._price_index: List[Tuple[float, int, str]] = []
+        self._index_keys: Dict[str, Tuple[float, int, str]] = {}
+        self._seq = itertools.count()
+    
+    def __len__(self) -> int:
+        return len(self.offers)
+    
+    @property
+    def active_count(self) -> int:
+        """Offers open for acceptance (call expire() first for an exact count)"""
+        return len(self._price_index)
+    
+    def add(self, offer: Dict):
+        self.offers[offer['offer_id']] = offer
+        heapq.heappush(self._expiry_heap, (offer['expiry_timestamp'], offer['offer_id']))
+        self._index(offer)
+    
+    def get(self, offer_id: str) -> Optional[Dict]:
+        return self.offers.get(offer_id)
+    
+    def claim(self, offer_id: str):
+        """Take an offer off the market while a trade against it is in flight"""
+        self.offers[offer_id]['status'] = 'accepting'
+        self._unindex(offer_id)
+    
+    def release(self, offer_id: str):
+        """Put a claimed offer back on the market after a failed trade"""
+        offer = self.offers[offer_id]
+        offer['status'] = 'pending'
+        self._index(offer)
+    
+    def close(self, offer_id: str, status: str) -> Optional[Dict]:
+        offer = self.offers.pop(offer_id, None)
+        if offer is None:
+            return None
+        self._unindex(offer_id)
+        offer['status'] = status
+        self.archive.append(offer)
+        return offer
+    
+    def expire(self, now: float) -> int:
+        """Expire every pending offer whose deadline has passed"""
+        expired = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, offer_id = heapq.heappop(heap)
+            offer = self.offers.get(offer_id)
+            # Closed offers leave stale heap entries; in-flight ones are settled by the acceptor
+            if offer is not None and offer['status'] == 'pending':
+                self.close(offer_id, 'expired')
+                expired += 1
+        return expired
+    
+    def active(self) -> List[Dict]:
+        """Open offers, cheapest first"""
+        return [self.offers[offer_id] for _, _, offer_id in self._price_index]
+    
+    def _index(self, offer: Dict):
+        key = (offer['price_per_kwh'], next(self._seq), offer['offer_id'])
+        self._index_keys[offer['offer_id']] = key
+        bisect.insort(self._price_index, key)
+    
+    def _unindex(self, offer_id: str):
+        key = self._index_keys.pop(offer_id, None)
+        if key is not None:
+            position = bisect.bisect_left(self._price_index, key)
+            del self._price_index[position]
+
+
 class WalletManager:
     """Central manager for all energy wallets with P2P transaction support"""
     
-    def __init__(self):
+    def __init__(self, history_archive: Optional[HistoryArchive] = None,
+                 keypair_pool: Optional[wallet_crypto.KeypairPool] = None,
+                 ledger: Optional[WalletLedger] = None,
+                 snapshot_interval: int = 10_000):
         self.wallets: Dict[str, EnergyWallet] = {}
+        # Older wallet history entries spill here (shared across wallets; on disk by default)
+        self.history_archive = history_archive if history_archive is not None else HistoryArchive()
+        # Pre-generated signing keys for new wallets
+        self.keypair_pool = keypair_pool if keypair_pool is not None else wallet_crypto.KeypairPool()
         self.address_to_user: Dict[str, str] = {}
         self.huawei_to_user: Dict[str, str] = {}
+        # Registry lock: only guards the lookup maps above. Balances are guarded
+        # by each wallet's own lock, offers and trade records by their own locks.
         self.lock = threading.Lock()
+        self.offers_lock = threading.Lock()
+        self.trades_lock = threading.Lock()
         
         # P2P transaction tracking
-        self.pending_p2p_trades: List[Dict] = []
+        self.offer_book = P2POfferBook()
         self.completed_p2p_trades: List[Dict] = []
+        self.stats = MarketStatistics()
+        # Per-user trade index (seller and buyer side), time-ordered for bisect
+        self.trades_by_user: Dict[str, List[Dict]] = defaultdict(list)
+        self._trade_times_by_user: Dict[str, List[float]] = defaultdict(list)
+        self._offer_seq = itertools.count(1)
+        self._trade_seq = itertools.count(1)
+        
+        # Durability (optional): every balance change is logged before the call returns
+        self.ledger = ledger
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_lock = threading.Lock()
+        if ledger is not None:
+            self._recover()
+    
+    @staticmethod
+    @contextmanager
+    def _locked_wallets(*wallets: EnergyWallet):
+        """Hold the locks of several wallets, acquired in address order to avoid deadlocks"""
+        ordered = sorted({id(w): w for w in wallets}.values(), key=lambda w: w.address)
+        for wallet in ordered:
+            wallet.lock.acquire()
+        try:
+            yield
+        finally:
+            for wallet in reversed(ordered):
+                wallet.lock.release()
     
     def create_wallet(self, user_id: str, huawei_id: str) -> EnergyWallet:
         """Create a new wallet for a user"""
-        with self.lock:
-            if user_id in self.wallets:
+        return self.create_wallets([(user_id, huawei_id)])[0]
+    
+    def _check_new_wallets(self, entries: List[Tuple[str, str]]):
+        """Reject duplicate user/Huawei ids (caller holds self.lock)"""
+        user_ids, huawei_ids = set(), set()
+        for user_id, huawei_id in entries:
+            if user_id in self.wallets or user_id in user_ids:
                 raise ValueError(f"Wallet already exists for user {user_id}")
-            
-            if huawei_id in self.huawei_to_user:
+            if huawei_id in self.huawei_to_user or huawei_id in huawei_ids:
                 raise ValueError(f"Huawei ID {huawei_id} already registered")
-            
-            wallet = EnergyWallet(user_id, huawei_id)
-            self.wallets[user_id] = wallet
-            self.address_to_user[wallet.address] = user_id
-            self.huawei_to_user[huawei_id] = user_id
-            
-            return wallet
+            user_ids.add(user_id)
+            huawei_ids.add(huawei_id)
+    
+    def create_wallets(self, entries: List[Tuple[str, str]]) -> List[EnergyWallet]:
+        """
+        Create wallets for many (user_id, huawei_id) pairs at once.
+        All-or-nothing: raises ValueError without registering any wallet if an id is taken.
+        Keys come from the background keypair pool; wallets are built outside the
+        registry lock, which is only held to check ids and to register the batch.
+        """
+        entries = list(entries)
+        with self.lock:
+            self._check_new_wallets(entries)
+        
+        keys = self.keypair_pool.take_many(len(entries))
+        wallets = [EnergyWallet(user_id, huawei_id, private_key=key, history_archive=self.history_archive)
+                   for (user_id, huawei_id), key in zip(entries, keys)]
+        
+        with self.lock:
+            # Ids may have been taken while the wallets were being built
+            self._check_new_wallets(entries)
+            for wallet in wallets:
+                self._register_wallet(wallet)
+            seq = self._log('wallets', wallets=[self._wallet_record(w) for w in wallets])
+        self._commit(seq)
+        return wallets
+    
+    def _register_wallet(self, wallet: EnergyWallet):
+        """Add a wallet to the lookup maps (caller holds self.lock)"""
+        self.stats.add_wallet(wallet)
+        wallet.balance_listener = self.stats.on_balance_change
+        wallet.state_listener = self._on_wallet_state
+        self.wallets[wallet.user_id] = wallet
+        self.address_to_user[wallet.address] = wallet.user_id
+        self.huawei_to_user[wallet.huawei_id] = wallet.user_id
     
     def get_wallet(self, user_id: str) -> Optional[EnergyWallet]:
         """Get wallet by user ID"""
@@ -224,25 +465,25 @@ class WalletManager:
         Execute P2P energy trade between two users
         Returns: (success, message, transaction_details)
         """
-        with self.lock:
-            seller_wallet = self.get_wallet(seller_id)
-            buyer_wallet = self.get_wallet(buyer_id)
-            
-            if not seller_wallet:
-                return False, f"Seller wallet not found: {seller_id}", None
-            
-            if not buyer_wallet:
-                return False, f"Buyer wallet not found: {buyer_id}", None
-            
-            total_cost = energy_kwh * price_per_kwh
-            
+        seller_wallet = self.get_wallet(seller_id)
+        buyer_wallet = self.get_wallet(buyer_id)
+        
+        if not seller_wallet:
+            return False, f"Seller wallet not found: {seller_id}", None
+        
+        if not buyer_wallet:
+            return False, f"Buyer wallet not found: {buyer_id}", None
+        
+        total_cost = energy_kwh * price_per_kwh
+        
+        with self._locked_wallets(seller_wallet, buyer_wallet):
             # Check seller has enough energy
-            if seller_wallet.energy_balance < energy_kwh:
-                return False, f"Insufficient energy balance. Available: {seller_wallet.energy_balance} kWh", None
+            if seller_wallet.available_energy < energy_kwh:
+                return False, f"Insufficient energy balance. Available: {seller_wallet.available_energy} kWh", None
             
             # Check buyer has enough fiat
-            if buyer_wallet.fiat_balance < total_cost:
-                return False, f"Insufficient fiat balance. Available: ${buyer_wallet.fiat_balance}", None
+            if buyer_wallet.available_fiat < total_cost:
+                return False, f"Insufficient fiat balance. Available: ${buyer_wallet.available_fiat}", None
             
             # Execute trade
             seller_wallet.deduct_energy(energy_kwh, f"P2P sale to {buyer_id}")
@@ -252,22 +493,136 @@ class WalletManager:
             seller_wallet.add_fiat(total_cost, f"P2P energy sale to {buyer_id}")
             
             # Record trade
-            trade_record = {
-                'trade_id': f"P2P-{datetime.now().timestamp()}",
-                'seller_id': seller_id,
-                'seller_address': seller_wallet.address,
-                'buyer_id': buyer_id,
-                'buyer_address': buyer_wallet.address,
-                'energy_kwh': energy_kwh,
-                'price_per_kwh': price_per_kwh,
-                'total_cost': total_cost,
-                'timestamp': datetime.now().isoformat(),
-                'status': 'completed'
-            }
-            
-            self.completed_p2p_trades.append(trade_record)
+            executed_at = datetime.now()
+            trade_record = self._trade_record(seller_wallet, buyer_wallet, energy_kwh,
+                                              price_per_kwh, total_cost, executed_at)
+            # Log and index together so a snapshot sees either both or neither
+            with self.trades_lock:
+                seq = self._log('trade', trade=trade_record,
+                                wallets=[seller_wallet.ledger_state(), buyer_wallet.ledger_state()])
+                self.completed_p2p_trades.append(trade_record)
+                self._index_trade(trade_record, executed_at.timestamp())
+        
+        self.stats.record_trade(energy_kwh, total_cost)
+        self._commit(seq)
+        
+        return True, "Trade executed successfully", trade_record
+    
+    def _trade_record(self, seller_wallet: EnergyWallet, buyer_wallet: EnergyWallet,
+                      energy_kwh: float, price_per_kwh: float, total_cost: float,
+                      executed_at: datetime) -> Dict:
+        seller_id, buyer_id = seller_wallet.user_id, buyer_wallet.user_id
+        return {
+            # Sequence suffix keeps ids unique within the same clock tick
+            'trade_id': f"P2P-{executed_at.timestamp()}-{next(self._trade_seq)}",
+            'seller_id': seller_id,
+            'seller_address': seller_wallet.address,
+            'buyer_id': buyer_id,
+            'buyer_address': buyer_wallet.address,
+            'energy_kwh': energy_kwh,
+            'price_per_kwh': price_per_kwh,
+            'total_cost': total_cost,
+            'timestamp': executed_at.isoformat(),
+            'status': 'completed'
+        }
+    
+    def reserve(self, user_id: str, energy_kwh: float = 0.0, fiat: float = 0.0) -> Tuple[bool, str]:
+        """Hold balance for a resting exchange order so its settlement cannot fail"""
+        wallet = self.get_wallet(user_id)
+        if not wallet:
+            return False, f"Wallet not found: {user_id}"
+        with wallet.lock:
+            if not wallet.reserve(energy_kwh, fiat):
+                return False, (f"Insufficient balance. Available: {wallet.available_energy} kWh, "
+                               f"${wallet.available_fiat}")
+        return True, "Reserved"
+    
+    def release(self, user_id: str, energy_kwh: float = 0.0, fiat: float = 0.0):
+        """Return the unfilled part of a reservation (order cancelled or expired)"""
+        wallet = self.get_wallet(user_id)
+        if wallet:
+            with wallet.lock:
+                wallet.release(energy_kwh, fiat)
+    
+    def settle_order_fills(self, fills: List) -> List[Dict]:
+        """
+        Settle a batch of exchange fills against reserved balances in one step.
+        Fills are order_book.Fill records (buyer_id, seller_id, qty, price,
+        bid_price); the buyer's reservation was made at bid_price, so any price
+        improvement is released.
+        All wallets in the batch are locked once (address order) and the batch
+        is logged as a single ledger record. Returns one trade record per fill;
+        fills without a wallet or reservation come back with status 'failed' and
+        whatever either side still held for them is released.
+        If settling raises, the reservations of the fills it had not reached
+        are released before the error propagates.
+        """
+        wallets = {}
+        for fill in fills:
+            for user_id in (fill.buyer_id, fill.seller_id):
+                if user_id not in wallets:
+                    wallets[user_id] = self.get_wallet(user_id)
+        
+        records: List[Dict] = []
+        settled: List[Dict] = []
+        executed_at = datetime.now()
+        started = 0  # fills whose settlement has begun
+        try:
+            with self._locked_wallets(*[w for w in wallets.values() if w is not None]):
+                for fill in fills:
+                    buyer, seller = wallets[fill.buyer_id], wallets[fill.seller_id]
+                    qty, price = fill.qty, fill.price
+                    cost = qty * price
+                    held = qty * fill.bid_price
+                    if (buyer is None or seller is None
+                            or seller.reserved_energy + BALANCE_EPSILON < qty
+                            or buyer.reserved_fiat + BALANCE_EPSILON < held):
+                        # The fill has left the book: free what the other side still holds for it
+                        if seller is not None:
+                            seller.release(energy=qty)
+                        if buyer is not None:
+                            buyer.release(fiat=held)
+                        records.append({'buyer_id': fill.buyer_id, 'seller_id': fill.seller_id,
+                                        'energy_kwh': qty, 'price_per_kwh': price, 'status': 'failed'})
+                        started += 1
+                        continue
+                
+                    started += 1
+                    seller.release(energy=qty)
+                    seller.deduct_energy(qty, f"Exchange sale to {buyer.user_id}")
+                    seller.add_fiat(cost, f"Exchange sale to {buyer.user_id}")
+                    buyer.release(fiat=held)
+                    buyer.deduct_fiat(cost, f"Exchange purchase from {seller.user_id}")
+                    buyer.add_energy(qty, f"Exchange purchase from {seller.user_id}")
+                
+                    record = self._trade_record(seller, buyer, qty, price, cost, executed_at)
+                    record['source'] = 'order_book'
+                    record['buy_order_id'] = fill.buy_order_id
+                    record['sell_order_id'] = fill.sell_order_id
+                    record['aggressor'] = fill.aggressor
+                    records.append(record)
+                    settled.append(record)
             
-            return True, "Trade executed successfully", trade_record
+                seq = 0
+                if settled:
+                    with self.trades_lock:
+                        touched = {r['seller_id'] for r in settled} | {r['buyer_id'] for r in settled}
+                        seq = self._log('settlement', trades=settled,
+                                        wallets=[wallets[u].ledger_state() for u in sorted(touched)])
+                        for record in settled:
+                            self.completed_p2p_trades.append(record)
+                            self._index_trade(record, executed_at.timestamp())
+        except BaseException:
+            # The fills have already left the book: hand back what the rest still hold
+            for fill in fills[started:]:
+                self.release(fill.seller_id, energy_kwh=fill.qty)
+                self.release(fill.buyer_id, fiat=fill.qty * fill.bid_price)
+            raise
+        
+        for record in settled:
+            self.stats.record_trade(record['energy_kwh'], record['total_cost'])
+        self._commit(seq)
+        return records
     
     def create_p2p_trade_offer(self, 
                                 seller_id: str, 
@@ -283,10 +638,11 @@ class WalletManager:
         if not seller_wallet:
             return False, f"Seller wallet not found: {seller_id}", None
         
-        if seller_wallet.energy_balance < energy_kwh:
-            return False, f"Insufficient energy balance. Available: {seller_wallet.energy_balance} kWh", None
+        if seller_wallet.available_energy < energy_kwh:
+            return False, f"Insufficient energy balance. Available: {seller_wallet.available_energy} kWh", None
         
-        offer_id = f"OFFER-{datetime.now().timestamp()}"
+        # Sequence suffix keeps ids unique within the same clock tick
+        offer_id = f"OFFER-{datetime.now().timestamp()}-{next(self._offer_seq)}"
         expiry_time = datetime.now().timestamp() + (expiry_minutes * 60)
         
         offer = {
@@ -302,8 +658,8 @@ class WalletManager:
             'status': 'pending'
         }
         
-        with self.lock:
-            self.pending_p2p_trades.append(offer)
+        with self.offers_lock:
+            self.offer_book.add(offer)
         
         return True, "Offer created successfully", offer_id
     
@@ -312,48 +668,46 @@ class WalletManager:
         Accept a pending P2P trade offer
         Returns: (success, message, transaction_details)
         """
-        with self.lock:
+        with self.offers_lock:
             # Find the offer
-            offer = None
-            for trade in self.pending_p2p_trades:
-                if trade['offer_id'] == offer_id and trade['status'] == 'pending':
-                    offer = trade
-                    break
+            offer = self.offer_book.get(offer_id)
             
-            if not offer:
+            if not offer or offer['status'] != 'pending':
                 return False, "Offer not found or already completed", None
             
             # Check if expired
             if datetime.now().timestamp() > offer['expiry_timestamp']:
-                offer['status'] = 'expired'
+                self.offer_book.close(offer_id, 'expired')
                 return False, "Offer has expired", None
             
-            # Execute the trade
-            success, message, trade_record = self.execute_p2p_energy_trade(
-                offer['seller_id'],
-                buyer_id,
-                offer['energy_kwh'],
-                offer['price_per_kwh']
-            )
-            
+            # Claim the offer so a concurrent accept cannot take it too
+            self.offer_book.claim(offer_id)
+        
+        # Execute the trade outside the offer lock (wallet locks only)
+        success, message, trade_record = self.execute_p2p_energy_trade(
+            offer['seller_id'],
+            buyer_id,
+            offer['energy_kwh'],
+            offer['price_per_kwh']
+        )
+        
+        with self.offers_lock:
             if success:
-                offer['status'] = 'completed'
                 offer['buyer_id'] = buyer_id
                 offer['completed_at'] = datetime.now().isoformat()
-            
-            return success, message, trade_record
+                self.offer_book.close(offer_id, 'completed')
+            elif datetime.now().timestamp() > offer['expiry_timestamp']:
+                self.offer_book.close(offer_id, 'expired')
+            else:
+                self.offer_book.release(offer_id)
+        
+        return success, message, trade_record
     
     def get_active_offers(self) -> List[Dict]:
-        """Get all active P2P trade offers"""
-        current_time = datetime.now().timestamp()
-        active_offers = []
-        
-        with self.lock:
-            for offer in self.pending_p2p_trades:
-                if offer['status'] == 'pending' and offer['expiry_timestamp'] > current_time:
-                    active_offers.append(offer.copy())
-        
-        return active_offers
+        """Get all active P2P trade offers (cheapest first)"""
+        with self.offers_lock:
+            self.offer_book.expire(datetime.now().timestamp())
+            return [offer.copy() for offer in self.offer_book.active()]
     
     def sync_huawei_energy_data(self, user_id: str, produced_kwh: float, consumed_kwh: float) -> bool:
         """
@@ -368,73 +722,378 @@ class WalletManager:
         if not wallet.huawei_connected:
             return False
         
-        # Net energy calculation
-        net_energy = produced_kwh - consumed_kwh
+        try:
+            net_energy = self._net_reading(produced_kwh, consumed_kwh)
+        except (TypeError, ValueError):
+            return False
         
+        with wallet.lock:
+            self._apply_energy_reading(wallet, net_energy)
+            wallet.last_sync_time = datetime.now().isoformat()
+            seq = self._log('balances', wallets=[wallet.ledger_state()])
+        self._commit(seq)
+        return True
+    
+    @staticmethod
+    def _net_reading(produced_kwh, consumed_kwh) -> float:
+        """Net energy of one reading; ValueError unless both values are finite and in range"""
+        produced, consumed = float(produced_kwh), float(consumed_kwh)
+        for value in (produced, consumed):
+            if not math.isfinite(value) or not 0.0 <= value <= MAX_READING_KWH:
+                raise ValueError(f"reading out of range: {value}")
+        return produced - consumed
+    
+    @staticmethod
+    def _apply_energy_reading(wallet: EnergyWallet, net_energy: float) -> bool:
+        """Apply one net reading to a wallet (caller holds wallet.lock)"""
         if net_energy > 0:
             # Surplus energy - add to wallet
             wallet.add_energy(net_energy, "Huawei Smart Home - Solar Production")
-        else:
-            # Deficit - deduct from wallet (if available)
-            wallet.deduct_energy(abs(net_energy), "Huawei Smart Home - Consumption")
+            return True
+        # Deficit - deduct from wallet (if available)
+        return wallet.deduct_energy(abs(net_energy), "Huawei Smart Home - Consumption")
+    
+    @staticmethod
+    def _reading_columns(readings) -> Tuple[list, list, list, list]:
+        """
+        Normalise a reading batch to (user_ids, produced, consumed, timestamps) columns.
+        Accepts a list of (user_id, produced, consumed, timestamp) tuples or dicts,
+        a dict of columns, or a NumPy structured array with those field names.
+        Raises ValueError for columns of different lengths or rows that are not
+        3 or 4 fields long.
+        """
+        fields = ('user_id', 'produced_kwh', 'consumed_kwh', 'timestamp')
+        names = getattr(getattr(readings, 'dtype', None), 'names', None)
+        if names or isinstance(readings, dict):
+            present = names or readings.keys()
+            size = len(readings['user_id'])
+            columns = []
+            for f in fields:
+                column = readings[f] if f in present else [None] * size
+                # NumPy columns: convert once to native Python values
+                column = column.tolist() if hasattr(column, 'tolist') else list(column)
+                if len(column) != size:
+                    raise ValueError(f"column {f} has {len(column)} values, user_id has {size}")
+                columns.append(column)
+            return tuple(columns)
+        rows = []
+        for i, r in enumerate(readings):
+            row = tuple(r.get(f) for f in fields) if isinstance(r, dict) else tuple(r)
+            if len(row) not in (3, 4):
+                raise ValueError(f"reading {i} has {len(row)} fields, expected 3 or 4")
+            rows.append(row + (None,) * (4 - len(row)))
+        if not rows:
+            return [], [], [], []
+        return tuple(list(c) for c in zip(*rows))
+    
+    def sync_huawei_energy_batch(self, readings) -> List[Dict]:
+        """
+        Apply a batch of smart-home readings (see _reading_columns for accepted shapes).
+        Readings are grouped per wallet and applied in timestamp order under a single
+        acquisition of that wallet's lock. Returns one status dict per input row:
+        'ok', 'insufficient_energy', 'unknown_user', 'not_connected' or 'invalid'
+        (non-numeric, non-finite, negative or above MAX_READING_KWH values, or a
+        bad timestamp).
+        """
+        user_ids, produced, consumed, timestamps = self._reading_columns(readings)
+        results: List[Dict] = [None] * len(user_ids)
+        by_wallet: Dict[str, List[Tuple[float, int, float]]] = defaultdict(list)
+        now = time.time()
         
-        wallet.last_sync_time = datetime.now().isoformat()
-        return True
+        for i, user_id in enumerate(user_ids):
+            user_id = str(user_id)
+            try:
+                net_energy = self._net_reading(produced[i], consumed[i])
+                ts = self._to_timestamp(timestamps[i])
+                if ts is not None:
+                    datetime.fromtimestamp(ts)  # must be a representable time
+            except (AttributeError, TypeError, ValueError, OverflowError, OSError):
+                results[i] = {'index': i, 'user_id': user_id, 'status': 'invalid'}
+                continue
+            by_wallet[user_id].append((now if ts is None else float(ts), i, net_energy))
+        
+        seq = 0
+        for user_id, wallet_readings in by_wallet.items():
+            wallet = self.wallets.get(user_id)
+            if wallet is None or not wallet.huawei_connected:
+                status = 'unknown_user' if wallet is None else 'not_connected'
+                for _, i, _ in wallet_readings:
+                    results[i] = {'index': i, 'user_id': user_id, 'status': status}
+                continue
+            
+            wallet_readings.sort()
+            with wallet.lock:
+                # Report the batch to market statistics as one balance change
+                listener, wallet.balance_listener = wallet.balance_listener, None
+                energy_before = wallet.energy_balance
+                try:
+                    for _, i, net_energy in wallet_readings:
+                        applied = self._apply_energy_reading(wallet, net_energy)
+                        results[i] = {'index': i, 'user_id': user_id,
+                                      'status': 'ok' if applied else 'insufficient_energy',
+                                      'energy_balance': wallet.energy_balance}
+                    wallet.last_sync_time = datetime.fromtimestamp(wallet_readings[-1][0]).isoformat()
+                    seq = self._log('balances', wallets=[wallet.ledger_state()])
+                finally:
+                    wallet.balance_listener = listener
+                    if listener is not None and wallet.energy_balance != energy_before:
+                        listener(wallet.energy_balance - energy_before, 0.0)
+        # One durability wait for the whole batch (group commit)
+        self._commit(seq)
+        return results
+    
+    def _index_trade(self, trade_record: Dict, executed_ts: float):
+        """Add a trade to the seller's and buyer's history index (caller holds trades_lock)"""
+        for user_id in {trade_record['seller_id'], trade_record['buyer_id']}:
+            times = self._trade_times_by_user[user_id]
+            trades = self.trades_by_user[user_id]
+            if not times or times[-1] <= executed_ts:
+                times.append(executed_ts)
+                trades.append(trade_record)
+            else:
+                # Concurrent trades can record slightly out of order
+                position = bisect.bisect_right(times, executed_ts)
+                times.insert(position, executed_ts)
+                trades.insert(position, trade_record)
     
-    def get_user_trading_history(self, user_id: str) -> Dict:
-        """Get complete trading history for a user"""
+    @staticmethod
+    def _to_timestamp(value: Union[None, float, str, datetime]) -> Optional[float]:
+        if value is None or isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.timestamp()
+    
+    def get_user_trading_history(self,
+                                 user_id: str,
+                                 limit: Optional[int] = None,
+                                 offset: int = 0,
+                                 start: Union[None, float, str, datetime] = None,
+                                 end: Union[None, float, str, datetime] = None,
+                                 newest_first: bool = False) -> Dict:
+        """
+        Get trading history for a user
+        Optional date range [start, end) and pagination (offset/limit) over
+        the user's own trade index, so cost is proportional to their trades.
+        Raises ValueError for a negative offset or limit.
+        """
+        if offset < 0:
+            raise ValueError("offset must be non-negative")
+        if limit is not None and limit < 0:
+            raise ValueError("limit must be non-negative")
         wallet = self.get_wallet(user_id)
         
         if not wallet:
             return {'error': 'Wallet not found'}
         
-        # Filter trades where user was buyer or seller
-        user_trades = [
-            trade for trade in self.completed_p2p_trades
-            if trade['seller_id'] == user_id or trade['buyer_id'] == user_id
-        ]
+        start_ts = self._to_timestamp(start)
+        end_ts = self._to_timestamp(end)
+        
+        # Trades where user was buyer or seller, narrowed to the date range
+        with self.trades_lock:
+            times = self._trade_times_by_user.get(user_id, [])
+            trades = self.trades_by_user.get(user_id, [])
+            lo = bisect.bisect_left(times, start_ts) if start_ts is not None else 0
+            hi = bisect.bisect_left(times, end_ts) if end_ts is not None else len(times)
+            hi = max(lo, hi)
+            total_in_range = hi - lo
+            if newest_first:
+                page_hi = hi - offset
+                page_lo = page_hi - limit if limit is not None else lo
+                user_trades = trades[max(lo, page_lo):max(lo, page_hi)][::-1]
+            else:
+                page_lo = lo + offset
+                page_hi = page_lo + limit if limit is not None else hi
+                user_trades = trades[min(hi, page_lo):min(hi, page_hi)]
+        
+        with wallet.lock:
+            recent_transactions = wallet.transaction_history[-50:]  # Last 50
         
         return {
             'user_id': user_id,
             'wallet_address': wallet.address,
-            'wallet_transactions': wallet.transaction_history[-50:],  # Last 50
+            'wallet_transactions': recent_transactions,
             'p2p_trades': user_trades,
-            'total_p2p_trades': len(user_trades)
+            'total_p2p_trades': total_in_range,
+            'offset': offset,
+            'limit': limit
         }
     
     def get_market_statistics(self) -> Dict:
-        """Get overall market statistics"""
-        with self.lock:
-            total_energy = sum(w.energy_balance for w in self.wallets.values())
-            total_fiat = sum(w.fiat_balance for w in self.wallets.values())
-            
-            active_offers_count = len([
-                o for o in self.pending_p2p_trades 
-                if o['status'] == 'pending' and o['expiry_timestamp'] > datetime.now().timestamp()
-            ])
-            
-            total_volume = sum(t['energy_kwh'] for t in self.completed_p2p_trades)
-            total_value = sum(t['total_cost'] for t in self.completed_p2p_trades)
-            
-            avg_price = total_value / total_volume if total_volume > 0 else 0
+        """Get overall market statistics (O(1): served from running aggregates)"""
+        with self.offers_lock:
+            self.offer_book.expire(datetime.now().timestamp())
+            active_offers_count = self.offer_book.active_count
+        
+        stats = self.stats
+        with stats.lock:
+            total_energy = stats.total_energy
+            total_fiat = stats.total_fiat
+            completed_count = stats.completed_trades
+            total_volume = stats.traded_volume
+            total_value = stats.traded_value
+            avg_price = stats.vwap
         
         return {
             'total_wallets': len(self.wallets),
             'total_energy_in_system_kwh': round(total_energy, 2),
             'total_fiat_in_system_usd': round(total_fiat, 2),
             'active_offers': active_offers_count,
-            'completed_trades': len(self.completed_p2p_trades),
+            'completed_trades': completed_count,
             'total_energy_traded_kwh': round(total_volume, 2),
             'total_value_traded_usd': round(total_value, 2),
             'average_price_per_kwh': round(avg_price, 4),
             'timestamp': datetime.now().isoformat()
         }
     
+    # ------------------------------------------------------------------
+    # Durability (WalletLedger)
+    # ------------------------------------------------------------------
+    def _log(self, op: str, **fields) -> int:
+        """Queue a ledger record; call under the locks that guard the logged state"""
+        if self.ledger is None:
+            return 0
+        return self.ledger.append(op, **fields)
+    
+    def _commit(self, seq: int):
+        """Wait (outside any lock) until record `seq` is durable; snapshot when due"""
+        if self.ledger is None or not seq:
+            return
+        self.ledger.wait(seq)
+        if self.ledger.records_since_snapshot >= self.snapshot_interval:
+            self.snapshot()
+    
+    def _on_wallet_state(self, wallet: EnergyWallet):
+        with wallet.lock:
+            seq = self._log('balances', wallets=[wallet.ledger_state()])
+        self._commit(seq)
+    
+    def _wallet_record(self, wallet: EnergyWallet) -> Dict:
+        record = {
+            'user_id': wallet.user_id,
+            'huawei_id': wallet.huawei_id,
+            'state': wallet.ledger_state()
+        }
+        if self.ledger is not None:
+            record.update(self.ledger.seal_key(wallet.user_id, wallet.get_private_key_hex()))
+        return record
+    
+    def snapshot(self) -> bool:
+        """Write a ledger snapshot (skipped if one is already in progress)"""
+        if self.ledger is None or not self._snapshot_lock.acquire(blocking=False):
+            return False
+        try:
+            # Wallet creations and trades are logged under these locks, so the
+            # cut below holds exactly the wallets/trades with seq <= cut
+            with self.lock, self.trades_lock:
+                cut = self.ledger.last_seq
+                wallets = list(self.wallets.values())
+                trades = list(self.completed_p2p_trades)
+            # Balances read afterwards may include later records; replaying
+            # those again on recovery is harmless (records hold absolute state)
+            records = []
+            for wallet in wallets:
+                with wallet.lock:
+                    records.append(self._wallet_record(wallet))
+            self.ledger.snapshot({'wallets': records, 'trades': trades}, cut)
+            return True
+        finally:
+            self._snapshot_lock.release()
+    
+    def _recover(self):
+        """Rebuild wallets and trades from the latest snapshot plus the WAL tail"""
+        snapshot = self.ledger.latest_snapshot()
+        after = 0
+        if snapshot is not None:
+            after = snapshot['seq']
+            self._restore_wallets(snapshot['wallets'])
+            for trade in snapshot['trades']:
+                self._restore_trade(trade)
+        replayed = 0
+        for record in self.ledger.records(after):
+            op = record['op']
+            if op == 'wallets':
+                self._restore_wallets(record['wallets'])
+            elif op == 'trade':
+                self._restore_trade(record['trade'])
+            elif op == 'settlement':
+                for trade in record['trades']:
+                    self._restore_trade(trade)
+            if op in ('balances', 'trade', 'settlement'):
+                for state in record['wallets']:
+                    self._restore_state(state)
+            replayed += 1
+        
+        # Market aggregates are derived state: rebuild them once at the end
+        self.stats = MarketStatistics()
+        for wallet in self.wallets.values():
+            self.stats.add_wallet(wallet)
+            wallet.balance_listener = self.stats.on_balance_change
+        for trade in self.completed_p2p_trades:
+            self.stats.record_trade(trade['energy_kwh'], trade['total_cost'])
+        if snapshot is not None or replayed:
+            LOGGER.info(f"Recovered {len(self.wallets)} wallets and {len(self.completed_p2p_trades)} trades "
+                        f"(snapshot seq {after}, {replayed} log records replayed)")
+    
+    def _restore_wallets(self, records: List[Dict]):
+        for record in records:
+            if record['user_id'] in self.wallets:
+                continue
+            key = ecdsa.SigningKey.from_string(bytes.fromhex(self.ledger.open_key(record)),
+                                               curve=ecdsa.SECP256k1)
+            wallet = EnergyWallet(record['user_id'], record['huawei_id'], private_key=key,
+                                  history_archive=self.history_archive)
+            self._register_wallet(wallet)
+            self._restore_state(record['state'])
+    
+    def _restore_state(self, state: List):
+        user_id, energy, fiat, connected = state
+        wallet = self.wallets.get(user_id)
+        if wallet is not None:
+            wallet.energy_balance = energy
+            wallet.fiat_balance = fiat
+            wallet.huawei_connected = connected
+    
+    def _restore_trade(self, trade: Dict):
+        self.completed_p2p_trades.append(trade)
+        self._index_trade(trade, datetime.fromisoformat(trade['timestamp']).timestamp())
+    
+    def close(self):
+        """Flush in-memory wallet history to the archive and close the ledger"""
+        with self.lock:
+            wallets = list(self.wallets.values())
+        for wallet in wallets:
+            with wallet.lock:
+                wallet.transaction_history.flush()
+        if self.ledger is not None:
+            self.ledger.close()
+    
     def list_all_wallets(self) -> List[Dict]:
         """List all wallets with basic info"""
         with self.lock:
-            return [wallet.to_dict() for wallet in self.wallets.values()]
+            wallets = list(self.wallets.values())
+        return [wallet.to_dict() for wallet in wallets]
+
+
+def _build_wallet_manager() -> WalletManager:
+    """
+    Global manager configuration:
+      QORCA_WALLET_HISTORY_DB          spilled wallet history (default: $QORCA_DATA_DIR/wallet_history.db)
+      QORCA_WALLET_LEDGER_DIR          enables the write-ahead log + snapshots in this directory
+      QORCA_WALLET_LEDGER_SYNC         batch (group commit, default) | op | none
+      QORCA_WALLET_KEY_SECRET          seals wallet private keys in the ledger (needs cryptography)
+      QORCA_WALLET_SNAPSHOT_INTERVAL   log records between snapshots (default 10000)
+    """
+    history = HistoryArchive(os.environ.get("QORCA_WALLET_HISTORY_DB", DEFAULT_HISTORY_DB))
+    ledger_dir = os.environ.get("QORCA_WALLET_LEDGER_DIR")
+    ledger = None
+    if ledger_dir:
+        ledger = WalletLedger(ledger_dir, sync=os.environ.get("QORCA_WALLET_LEDGER_SYNC", "batch"),
+                              key_secret=os.environ.get("QORCA_WALLET_KEY_SECRET") or None)
+    interval = int(os.environ.get("QORCA_WALLET_SNAPSHOT_INTERVAL", "10000"))
+    return WalletManager(history, ledger=ledger, snapshot_interval=interval)
 
 
 # Global wallet manager instance
-wallet_manager = WalletManager()
+wallet_manager = _build_wallet_manager()
+atexit.register(wallet_manager.close)